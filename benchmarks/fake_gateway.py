@@ -0,0 +1,234 @@
+"""
+A local stand-in for Discord's HTTP API and gateway, so the sharded bot can be run offline.
+
+It serves the few HTTP routes discord.py needs to log in, report the gateway and sync the
+slash commands, and a gateway websocket that identifies shards and sends each shard the
+guilds that belong to it, the way Discord assigns them: shard = (guild_id >> 22) % shards.
+Messages the bot sends are recorded per channel, and test code can deliver messages to
+the bot with send_message.
+
+Run it on its own and start the bot against it, one process per set of shards:
+
+    python -m benchmarks.fake_gateway --port 8765 --guilds 20 --shards 2
+
+    DISCORD_API_URL=http://127.0.0.1:8765/api/v10 DISCORD_GATEWAY_URL=ws://127.0.0.1:8765/gateway \\
+        BOT_TOKEN=fake SHARD_COUNT=2 SHARD_IDS=0 python main.py
+"""
+import json
+import asyncio
+import argparse
+import itertools
+from aiohttp import web, WSMsgType
+
+BOT_ID = 1000
+OWNER_ID = 2000
+
+def json_response(data):
+    # discord.py only decodes bodies whose content type is exactly application/json
+    return web.Response(body=json.dumps(data).encode(), content_type='application/json')
+
+def user(user_id, name, bot=False):
+    return {'id': str(user_id), 'username': name, 'discriminator': '0', 'global_name': None, 'avatar': None, 'bot': bot}
+
+class FakeGateway:
+    """
+    Serves the fake HTTP API under /api/v10 and the gateway at /gateway.
+
+    Attributes:
+    ----------
+    shards : int
+        The shard count recommended by /gateway/bot.
+
+    guild_ids : list
+        The IDs of the guilds the bot is in, spread evenly over the shards.
+
+    identified : dict
+        Maps each shard ID to the number of times it identified.
+
+    command_syncs : int
+        The number of times the slash commands were synced.
+
+    messages : dict
+        Maps channel IDs to the payloads of the messages the bot sent there.
+    """
+    def __init__(self, guilds=10, shards=2, host='127.0.0.1', port=0):
+        self.shards = shards
+        self.host = host
+        self.port = port
+        # Give guild i a snowflake that lands on shard i % shards
+        self.guild_ids = [(i + shards) << 22 for i in range(guilds)]
+        self.identified = {}
+        self.command_syncs = 0
+        self.messages = {}
+
+        self._sockets = {}
+        self._ids = itertools.count(10 ** 6)
+        self._runner = None
+
+    @property
+    def api_url(self):
+        return f'http://{self.host}:{self.port}/api/v10'
+
+    @property
+    def gateway_url(self):
+        return f'ws://{self.host}:{self.port}/gateway'
+
+    def shard_of(self, guild_id):
+        return (guild_id >> 22) % self.shards
+
+    @staticmethod
+    def text_channel(guild_id):
+        return guild_id + 1
+
+    def guild(self, guild_id):
+        text_id, voice_id = self.text_channel(guild_id), guild_id + 2
+        return {
+            'id': str(guild_id), 'name': f'Guild {guild_id}', 'owner_id': str(OWNER_ID), 'unavailable': False,
+            'member_count': 2, 'large': False, 'features': [], 'emojis': [], 'stickers': [], 'members': [],
+            'voice_states': [], 'presences': [], 'threads': [], 'stage_instances': [], 'guild_scheduled_events': [],
+            'roles': [{'id': str(guild_id), 'name': '@everyone', 'permissions': '0', 'position': 0, 'color': 0,
+                       'hoist': False, 'managed': False, 'mentionable': False}],
+            'channels': [
+                {'id': str(text_id), 'type': 0, 'name': 'general', 'position': 0, 'permission_overwrites': []},
+                {'id': str(voice_id), 'type': 2, 'name': 'Music', 'position': 1, 'permission_overwrites': [],
+                 'bitrate': 64000, 'user_limit': 0},
+            ],
+        }
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/api/v10/users/@me', self._bot_user)
+        app.router.add_get('/api/v10/oauth2/applications/@me', self._application)
+        app.router.add_get('/api/v10/gateway', self._gateway)
+        app.router.add_get('/api/v10/gateway/bot', self._gateway)
+        app.router.add_put('/api/v10/applications/{application_id}/commands', self._sync_commands)
+        app.router.add_post('/api/v10/channels/{channel_id}/messages', self._create_message)
+        app.router.add_get('/gateway', self._websocket)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def close(self):
+        for ws, _ in list(self._sockets.values()):
+            await ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _bot_user(self, request):
+        return json_response(user(BOT_ID, 'Hoppon', bot=True))
+
+    async def _application(self, request):
+        return json_response({
+            'id': str(BOT_ID), 'name': 'Hoppon', 'description': '', 'icon': None, 'bot_public': True,
+            'bot_require_code_grant': False, 'owner': user(OWNER_ID, 'owner'), 'verify_key': '', 'flags': 0,
+        })
+
+    async def _gateway(self, request):
+        return json_response({'url': self.gateway_url, 'shards': self.shards,
+                                  'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0, 'max_concurrency': 1}})
+
+    async def _sync_commands(self, request):
+        self.command_syncs += 1
+        commands = await request.json()
+        return json_response([dict(command, id=str(next(self._ids)), application_id=str(BOT_ID), version='1')
+                                  for command in commands])
+
+    async def _create_message(self, request):
+        channel_id = int(request.match_info['channel_id'])
+        if request.content_type == 'multipart/form-data':
+            reader = await request.multipart()
+            payload = json.loads(await (await reader.next()).text())
+        else:
+            payload = await request.json()
+        self.messages.setdefault(channel_id, []).append(payload)
+        return json_response(self.message(channel_id, user(BOT_ID, 'Hoppon', bot=True), payload.get('content') or '',
+                                              embeds=payload.get('embeds') or []))
+
+    def message(self, channel_id, author, content, embeds=()):
+        return {
+            'id': str(next(self._ids)), 'channel_id': str(channel_id), 'author': author, 'content': content,
+            'timestamp': '2026-01-01T00:00:00+00:00', 'edited_timestamp': None, 'tts': False,
+            'mention_everyone': False, 'mentions': [], 'mention_roles': [], 'attachments': [],
+            'embeds': list(embeds), 'pinned': False, 'type': 0,
+        }
+
+    async def _websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        sequence = itertools.count(1)
+        await ws.send_json({'op': 10, 'd': {'heartbeat_interval': 45000}, 's': None, 't': None})
+
+        shard_id = None
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                break
+            payload = json.loads(message.data)
+            if payload['op'] == 1:
+                await ws.send_json({'op': 11, 'd': None, 's': None, 't': None})
+            elif payload['op'] == 2:
+                shard_id, shard_count = payload['d'].get('shard') or (0, 1)
+                if shard_count != self.shards:
+                    await ws.close(code=4010, message=b'Invalid shard')
+                    break
+                self.identified[shard_id] = self.identified.get(shard_id, 0) + 1
+                self._sockets[shard_id] = (ws, sequence)
+                await self._ready(ws, sequence, shard_id)
+
+        if shard_id is not None and self._sockets.get(shard_id, (None,))[0] is ws:
+            del self._sockets[shard_id]
+        return ws
+
+    async def _ready(self, ws, sequence, shard_id):
+        guild_ids = [guild_id for guild_id in self.guild_ids if self.shard_of(guild_id) == shard_id]
+        await self._dispatch(ws, sequence, 'READY', {
+            'v': 10, 'user': user(BOT_ID, 'Hoppon', bot=True), 'session_id': f'session-{shard_id}',
+            'resume_gateway_url': self.gateway_url, 'shard': [shard_id, self.shards],
+            'guilds': [{'id': str(guild_id), 'unavailable': True} for guild_id in guild_ids],
+            'application': {'id': str(BOT_ID), 'flags': 0},
+        })
+        for guild_id in guild_ids:
+            await self._dispatch(ws, sequence, 'GUILD_CREATE', self.guild(guild_id))
+
+    @staticmethod
+    async def _dispatch(ws, sequence, event, data):
+        await ws.send_json({'op': 0, 's': next(sequence), 't': event, 'd': data})
+
+    async def send_message(self, guild_id, content, author_id=OWNER_ID):
+        """
+        Deliver a message in a guild's text channel to the shard the guild belongs to.
+
+        Returns:
+        -------
+        int
+            The ID of the channel the message was sent in.
+        """
+        channel_id = self.text_channel(guild_id)
+        ws, sequence = self._sockets[self.shard_of(guild_id)]
+        message = self.message(channel_id, user(author_id, 'owner'), content)
+        message['guild_id'] = str(guild_id)
+        message['member'] = {'roles': [], 'joined_at': '2026-01-01T00:00:00+00:00', 'deaf': False, 'mute': False}
+        await self._dispatch(ws, sequence, 'MESSAGE_CREATE', message)
+        return channel_id
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--guilds', type=int, default=20)
+    parser.add_argument('--shards', type=int, default=2)
+    args = parser.parse_args()
+
+    gateway = FakeGateway(guilds=args.guilds, shards=args.shards, port=args.port)
+    await gateway.start()
+    print(f"DISCORD_API_URL={gateway.api_url} DISCORD_GATEWAY_URL={gateway.gateway_url} SHARD_COUNT={args.shards}")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"identified {gateway.identified}, {sum(map(len, gateway.messages.values()))} messages")
+    finally:
+        await gateway.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,245 @@
+"""
+Local stand-ins for yt-dlp, Spotipy and the Discord objects utils/music.py talks to, so the
+music pipeline can be benchmarked without network access.
+
+The YouTube and Spotify fakes block the calling thread for a configurable latency, like
+the real clients do, and fail a configurable fraction of calls. They can also spend CPU
+time in pure Python on each call, holding the GIL like yt-dlp's parsing does. The voice client "plays"
+each song for a fixed number of seconds and then calls its after callback.
+"""
+import os
+import time
+import random
+import asyncio
+import hashlib
+import threading
+import discord
+
+class InjectedFailure(Exception):
+    """
+    Raised by the fakes for calls chosen to fail.
+    """
+
+class FakeLatency:
+    """
+    Blocks for a random latency, burns CPU for a fixed time and fails a fraction of calls.
+    """
+    def __init__(self, latency, jitter=0.5, failure_rate=0.0, seed=0, cpu=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.cpu = cpu
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self, name):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency * (1 + self._random.uniform(-self.jitter, self.jitter))
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        time.sleep(delay)
+
+        # Pure Python work holds the GIL for the whole time
+        deadline = time.thread_time() + self.cpu
+        while time.thread_time() < deadline:
+            sum(range(1000))
+
+        if fail:
+            raise InjectedFailure(f"Injected failure in {name}")
+
+def video_id(text):
+    return hashlib.sha1(text.encode()).hexdigest()[:11]
+
+class FakeYoutubeDL(FakeLatency):
+    """
+    Stand-in for yt_dlp.YoutubeDL. Searches return one flat result named after the query,
+    and URLs return an Opus stream that expires in six hours.
+    """
+    def extract_info(self, query, download=False):
+        self.wait('extract_info')
+        if query.startswith('https://www.youtube.com/watch?v='):
+            vid = query.rsplit('=', 1)[1]
+            return {
+                'id': vid,
+                'title': f"Artist {vid[:4]} - Song {vid[4:8]}",
+                'duration': 200,
+                'url': f"https://example.invalid/{vid}?expire={int(time.time()) + 6 * 60 * 60}",
+                'acodec': 'opus',
+                'asr': 48000,
+            }
+
+        return {'entries': [{'id': video_id(query), 'title': query, 'duration': 200}]}
+
+def fake_youtube_dl(latency, cpu, options=None):
+    """
+    Create a FakeYoutubeDL from YouTubeDL options, for the resolver's worker processes.
+    Use it with functools.partial, which keeps it picklable.
+    """
+    return FakeYoutubeDL(latency, cpu=cpu, seed=os.getpid())
+
+class FakeSpotify(FakeLatency):
+    """
+    Stand-in for spotipy.Spotify serving generated tracks, albums and playlists.
+    """
+    PAGE_SIZE = 100
+
+    def __init__(self, latency, playlist_size=500, **kwargs):
+        super().__init__(latency, **kwargs)
+        self.playlist_size = playlist_size
+
+    @staticmethod
+    def make_track(track_id):
+        return {'id': track_id, 'name': f"Song {track_id}", 'artists': [{'name': f"Artist {track_id}"}],
+                'duration_ms': 200000, 'album': {'images': []}}
+
+    def _page(self, prefix, offset, total, wrap):
+        items = [self.make_track(f"{prefix}{i}") for i in range(offset, min(offset + self.PAGE_SIZE, total))]
+        following = offset + self.PAGE_SIZE
+        return {
+            'items': [{'track': item} for item in items] if wrap else items,
+            'total': total,
+            'next': f"fake://{prefix}/{following}/{total}/{int(wrap)}" if following < total else None,
+        }
+
+    def track(self, track_id):
+        self.wait('track')
+        return self.make_track(track_id)
+
+    def tracks(self, track_ids):
+        self.wait('tracks')
+        return {'tracks': [self.make_track(track_id) for track_id in track_ids]}
+
+    def playlist(self, playlist_id):
+        self.wait('playlist')
+        return {'name': f"Playlist {playlist_id}", 'tracks': self._page(playlist_id, 0, self.playlist_size, True)}
+
+    def album(self, album_id):
+        self.wait('album')
+        return {'name': f"Album {album_id}", 'tracks': self._page(album_id, 0, self.playlist_size, False)}
+
+    def next(self, page):
+        self.wait('next')
+        prefix, offset, total, wrap = page['next'][len('fake://'):].split('/')
+        return self._page(prefix, int(offset), int(total), wrap == '1')
+
+    def search(self, q, type='track', limit=1):
+        self.wait('search')
+        return {'tracks': {'items': [self.make_track(video_id(q)) for _ in range(limit)][:1]}}
+
+    def recommendations(self, seed_tracks=None, limit=20):
+        self.wait('recommendations')
+        seed = ''.join(seed_tracks or [])
+        return {'tracks': [self.make_track(video_id(f"{seed}{i}{time.monotonic_ns()}")) for i in range(limit)]}
+
+class FakeMessage:
+    async def edit(self, **kwargs):
+        pass
+
+    async def delete(self):
+        pass
+
+class FakeChannel:
+    def __init__(self, channel_id, guild=None):
+        self.id = channel_id
+        self.guild = guild
+        self.members = []
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+        return FakeMessage()
+
+class FakeAudioSource:
+    def cleanup(self):
+        pass
+
+class FakeVoiceClient:
+    """
+    Stand-in for discord.VoiceClient. Records when each song started and finishes each
+    song after song_length seconds. Like the real client, it refuses to play a song while
+    another one is playing.
+    """
+    def __init__(self, guild, channel, song_length):
+        self.guild = guild
+        self.channel = channel
+        self.song_length = song_length
+        self.started = []
+        self._handle = None
+        self._after = None
+        self._connected = True
+
+    def is_connected(self):
+        return self._connected
+
+    def is_playing(self):
+        return self._handle is not None
+
+    def is_paused(self):
+        return False
+
+    def play(self, source, after=None):
+        if not self._connected:
+            raise discord.ClientException('Not connected to voice.')
+        if self.is_playing():
+            raise discord.ClientException('Already playing audio.')
+        self.started.append(time.perf_counter())
+        self._after = after
+        self._handle = asyncio.get_running_loop().call_later(self.song_length, self._finish, None)
+
+    def _finish(self, error):
+        self._handle = None
+        if self._after is not None:
+            self._after(error)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._finish(None)
+
+    async def disconnect(self, force=False):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._connected = False
+        self.guild.voice_client = None
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.shard_id = 0
+        self.voice_client = None
+
+class FakeAuthor:
+    def __init__(self, channel):
+        self.bot = False
+        self.voice = type('VoiceState', (), {'channel': channel})()
+
+class FakeContext:
+    """
+    Stand-in for commands.Context in a guild where the bot is already in voice.
+    """
+    def __init__(self, guild_id, song_length):
+        self.guild = FakeGuild(guild_id)
+        self.channel = FakeChannel(guild_id, self.guild)
+        voice_channel = FakeChannel(guild_id + 1_000_000, self.guild)
+        self.author = FakeAuthor(voice_channel)
+        self.message = FakeMessage()
+        self.guild.voice_client = FakeVoiceClient(self.guild, voice_channel, song_length)
+        self.started_at = None
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+    async def defer(self):
+        pass
@@ -0,0 +1,91 @@
+"""
+Measures the queue journal: what journaling costs each queue change on the event loop,
+and how long restoring the journaled queues takes at startup, before and after compaction.
+
+The journal is filled with 10k queued tracks spread over a few guilds, plus some songs
+played off the front of each queue. Restoring is timed through Music, which restores the
+journal when it is created, against creating Music with an empty journal.
+
+Run from the repository root:
+
+    python -m benchmarks.journal_restore [--tracks 10000] [--guilds 10] [--played 1000]
+"""
+import os
+import time
+import argparse
+import tempfile
+
+# Music needs Spotify credentials to start, and the benchmark must not touch the real caches
+os.environ.setdefault('SPOTIFY_CLIENT_ID', 'benchmark')
+os.environ.setdefault('SPOTIFY_CLIENT_SECRET', 'benchmark')
+os.environ.pop('AUDIO_CACHE_DIR', None)
+
+from utils.music import Music
+from utils.journal import QueueJournal
+from utils.player import PlayerRegistry
+from utils.track import Track
+
+def make_track(i):
+    return Track(f'{i:011d}', f'Artist {i} - Song {i}', duration=200.0 + i, spotify_id=f'spotify{i:015d}')
+
+def fill(players, tracks, guilds):
+    started = time.perf_counter()
+    for i in range(tracks):
+        players.get(i % guilds).song_queue.append(make_track(i))
+    return time.perf_counter() - started
+
+def create_music(path):
+    os.environ['QUEUE_JOURNAL_PATH'] = path
+    started = time.perf_counter()
+    music = Music()
+    elapsed = time.perf_counter() - started
+
+    restored = sum(len(player.song_queue) for player in music.players.players.values())
+    music.journal.close()
+    music.resolver.close()
+    music.search_cache.close()
+    music.loudness.close()
+    return elapsed, restored, music.journal.restore_seconds
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, default=10000)
+    parser.add_argument('--guilds', type=int, default=10)
+    parser.add_argument('--played', type=int, default=1000, help='songs taken off the front of the queues before the restart')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['SEARCH_CACHE_PATH'] = os.path.join(directory, 'search_cache.db')
+        os.environ['LOUDNESS_PATH'] = os.path.join(directory, 'loudness.db')
+        os.environ['QUEUE_MAX_SIZE'] = str(args.tracks)
+        path = os.path.join(directory, 'queue.journal')
+
+        # The cost of a queue change with and without journaling
+        plain = fill(PlayerRegistry(), args.tracks, args.guilds)
+        journal = QueueJournal(path=path)
+        journal.start()
+        players = PlayerRegistry(journal=journal)
+        journaled = fill(players, args.tracks, args.guilds)
+
+        for i in range(args.played):
+            player = players.get(i % args.guilds)
+            player.song_queue.popleft()
+            journal.set_playing(player.guild_id, make_track(i), 1, 2)
+        journal.close()
+        size = os.path.getsize(path)
+
+        baseline, _, _ = create_music(os.path.join(directory, 'empty.journal'))
+        # Restoring compacts the journal, so the second restore reads the snapshot
+        uncompacted, restored, replay = create_music(path)
+        compacted_size = os.path.getsize(path)
+        compacted, _, compacted_replay = create_music(path)
+
+    print(f"{args.tracks} queued tracks in {args.guilds} guilds, {args.played} played")
+    print(f"append without journal  {plain / args.tracks * 1e6:8.2f}us per track")
+    print(f"append with journal     {journaled / args.tracks * 1e6:8.2f}us per track")
+    print(f"{'journal':<12}{'size':>10}{'replay':>10}{'restore':>10}{'restored':>10}")
+    print(f"{'appended':<12}{size / 1024:>8.0f}KB{replay * 1000:>8.1f}ms{(uncompacted - baseline) * 1000:>8.1f}ms{restored:>10}")
+    print(f"{'compacted':<12}{compacted_size / 1024:>8.0f}KB{compacted_replay * 1000:>8.1f}ms{(compacted - baseline) * 1000:>8.1f}ms{restored:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Measures how long the event loop stalls while music lookups are running.
+
+A fake YouTubeDL whose extract_info blocks for a fixed time stands in for yt-dlp. The same
+burst of lookups is run once by calling it directly inside coroutines (how utils/music.py
+used to work) and once through the Resolver thread pool, while a LoopLagMonitor samples how
+late the loop wakes up.
+
+Run from the repository root:
+
+    python -m benchmarks.loop_stall [--calls 16] [--latency 0.25] [--workers 4]
+"""
+import time
+import asyncio
+import argparse
+from utils.resolver import Resolver
+from utils.loop_monitor import LoopLagMonitor
+
+class FakeYoutubeDL:
+    """
+    Stand-in for yt_dlp.YoutubeDL whose extract_info blocks the calling thread.
+    """
+    def __init__(self, latency):
+        self.latency = latency
+
+    def extract_info(self, query, download=False):
+        time.sleep(self.latency)
+        return {'entries': [{'id': 'dQw4w9WgXcQ', 'title': query}]}
+
+async def run_blocking(ydl, calls):
+    async def lookup(i):
+        await asyncio.sleep(0)
+        return ydl.extract_info(f'song {i}', download=False)
+
+    await asyncio.gather(*(lookup(i) for i in range(calls)))
+
+async def run_resolver(resolver, calls):
+    await asyncio.gather(*(resolver.search(f'song {i}') for i in range(calls)))
+
+async def measure(name, scenario):
+    monitor = LoopLagMonitor(interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.05)
+    monitor.reset()
+
+    start = time.perf_counter()
+    await scenario
+    elapsed = time.perf_counter() - start
+
+    await asyncio.sleep(0.05)
+    monitor.stop()
+    stats = monitor.stats()
+    print(f"{name:<10} wall {elapsed:7.3f}s   max stall {stats['max_lag'] * 1000:8.1f}ms   "
+          f"mean stall {stats['mean_lag'] * 1000:7.1f}ms   samples {stats['samples']}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=16, help='number of concurrent lookups')
+    parser.add_argument('--latency', type=float, default=0.25, help='seconds each lookup blocks for')
+    parser.add_argument('--workers', type=int, default=4, help='resolver thread pool size')
+    args = parser.parse_args()
+
+    ydl = FakeYoutubeDL(args.latency)
+    resolver = Resolver(ydl, sp=None, max_workers=args.workers)
+
+    print(f"{args.calls} lookups blocking {args.latency}s each, {args.workers} resolver workers")
+    await measure('before', run_blocking(ydl, args.calls))
+    await measure('after', run_resolver(resolver, args.calls))
+    resolver.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
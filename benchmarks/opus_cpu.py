@@ -0,0 +1,92 @@
+"""
+Measures the CPU cost per voice stream of the playback paths in Music.audio_source.
+
+A sample Opus file is decoded through each path exactly like the voice client would:
+FFmpegPCMAudio frames are encoded to Opus with discord.py's encoder (transcode), the same
+with ffmpeg's volume filter applied for a song whose loudness is adjusted (normalized),
+while FFmpegOpusAudio with codec='copy' only has ffmpeg remux the packets (passthrough). Frames
+are read as fast as possible, and the CPU time of both ffmpeg and the Python process is
+reported per minute of audio, per stream.
+
+Requires ffmpeg on the PATH and libopus loadable by discord.py. Run from the repository root:
+
+    python -m benchmarks.opus_cpu [--input song.opus] [--seconds 60] [--streams 4] [--libopus path]
+
+Without --input, a test tone is generated with ffmpeg.
+"""
+import os
+import time
+import resource
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import discord
+
+def generate_input(seconds):
+    path = os.path.join(tempfile.mkdtemp(), 'sample.opus')
+    subprocess.run(['ffmpeg', '-nostdin', '-loglevel', 'error', '-f', 'lavfi',
+                    '-i', f'sine=frequency=440:duration={seconds}', '-ac', '2', '-ar', '48000',
+                    '-c:a', 'libopus', '-b:a', '128k', path], check=True)
+    return path
+
+def transcode(path, options='-vn'):
+    source = discord.FFmpegPCMAudio(path, options=options)
+    encoder = discord.opus.Encoder()
+    frames = 0
+    while data := source.read():
+        encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+        frames += 1
+    source.cleanup()
+    return frames
+
+def normalized(path):
+    return transcode(path, options='-vn -af volume=-6.0dB')
+
+def passthrough(path):
+    source = discord.FFmpegOpusAudio(path, codec='copy', options='-vn')
+    frames = 0
+    while source.read():
+        frames += 1
+    source.cleanup()
+    return frames
+
+def measure(name, play, path, streams):
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    own = time.process_time()
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=streams) as executor:
+        frames = sum(executor.map(play, [path] * streams))
+
+    elapsed = time.perf_counter() - start
+    own = time.process_time() - own
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    ffmpeg = (after.ru_utime + after.ru_stime) - (children.ru_utime + children.ru_stime)
+
+    # Each frame is 20ms of audio
+    audio_minutes = frames * 0.02 / 60
+    print(f"{name:<12} ffmpeg {ffmpeg / audio_minutes:7.3f} CPU-s/min   python {own / audio_minutes:7.3f} CPU-s/min   "
+          f"total {(ffmpeg + own) / audio_minutes:7.3f} CPU-s/min per stream   wall {elapsed:6.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', help='Opus file to play (default: generated test tone)')
+    parser.add_argument('--seconds', type=int, default=60, help='length of the generated test tone')
+    parser.add_argument('--streams', type=int, default=4, help='number of concurrent streams')
+    parser.add_argument('--libopus', help='path to libopus, if discord.py can not find it')
+    args = parser.parse_args()
+
+    if args.libopus:
+        discord.opus.load_opus(args.libopus)
+    if not discord.opus.is_loaded() and not discord.opus._load_default():
+        parser.error("libopus could not be loaded")
+
+    path = args.input or generate_input(args.seconds)
+    print(f"{args.streams} concurrent streams of {path}")
+    measure('transcode', transcode, path, args.streams)
+    measure('normalized', normalized, path, args.streams)
+    measure('passthrough', passthrough, path, args.streams)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Benchmarks the music pipeline in utils/music.py end to end, against the stand-ins for
+YouTube, Spotify and Discord in benchmarks/fakes.py.
+
+Scenarios:
+
+    import      one guild !plays a Spotify playlist (500 tracks by default)
+    concurrent  50 guilds each !play a different song at the same time
+    autoqueue   one guild plays a long autoqueue session through play_next
+
+Each scenario reports its throughput, p50/p99 time-to-first-audio (or the gap between
+songs for autoqueue), event loop lag and peak memory. The results are saved to
+benchmarks/results/<commit>.json, and --compare prints the change against an earlier file.
+
+Run from the repository root:
+
+    python -m benchmarks.pipeline [--scenario all] [--youtube-latency 0.3] [--spotify-latency 0.1]
+                                  [--failure-rate 0] [--compare benchmarks/results/<commit>.json]
+
+The resolver's rate limits apply as usual, so YOUTUBE_RATE, SPOTIFY_RATE and the other
+settings in the README can be set to benchmark other configurations.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+
+# Music needs Spotify credentials to start, and the benchmark must not touch the real caches
+os.environ.setdefault('SPOTIFY_CLIENT_ID', 'benchmark')
+os.environ.setdefault('SPOTIFY_CLIENT_SECRET', 'benchmark')
+os.environ.pop('AUDIO_CACHE_DIR', None)
+
+from utils.music import Music
+from utils.loop_monitor import LoopLagMonitor
+from utils.scheduler import set_priority, INTERACTIVE
+from benchmarks.fakes import FakeYoutubeDL, FakeSpotify, FakeContext, FakeAudioSource
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def make_music(args, directory, name):
+    """
+    Create a Music instance with fresh caches that talks to the fakes.
+    """
+    os.environ['SEARCH_CACHE_PATH'] = os.path.join(directory, f'{name}.db')
+    os.environ['LOUDNESS_PATH'] = os.path.join(directory, f'{name}-loudness.db')
+    os.environ['QUEUE_JOURNAL_PATH'] = os.path.join(directory, f'{name}.journal')
+    music = Music()
+
+    ydl = FakeYoutubeDL(args.youtube_latency, failure_rate=args.failure_rate, seed=1)
+    sp = FakeSpotify(args.spotify_latency, playlist_size=args.tracks, failure_rate=args.failure_rate, seed=2)
+    music.resolver.loader = lambda: (ydl, sp, ydl)
+    music.audio_source = lambda song, local_path=None: FakeAudioSource()
+    return music, ydl, sp
+
+async def command(music, ctx, search):
+    """
+    Run a !play like the cog does. Errors end the command, as they would in the bot.
+
+    Returns:
+    -------
+    bool
+        Whether the command succeeded.
+    """
+    set_priority(INTERACTIVE, ctx.guild.id)
+    ctx.started_at = time.perf_counter()
+    try:
+        await music.play_song(ctx, search)
+    except Exception:
+        return False
+    return True
+
+async def scenario_import(music, args):
+    ctx = FakeContext(1, song_length=3600)
+    started = time.perf_counter()
+    await command(music, ctx, 'https://open.spotify.com/playlist/benchmark')
+    elapsed = time.perf_counter() - started
+
+    queued = len(music.players.get(1).song_queue) + len(ctx.voice_client.started)
+    first_audio = [ctx.voice_client.started[0] - started] if ctx.voice_client.started else []
+    return {
+        'tracks': args.tracks,
+        'queued': queued,
+        'seconds': elapsed,
+        'tracks_per_second': queued / elapsed,
+        'ttfa_p50': percentile(first_audio, 0.5),
+        'ttfa_p99': percentile(first_audio, 0.99),
+    }
+
+async def scenario_concurrent(music, args):
+    contexts = [FakeContext(guild_id, song_length=3600) for guild_id in range(1, args.guilds + 1)]
+    started = time.perf_counter()
+    succeeded = await asyncio.gather(*(command(music, ctx, f'benchmark song {ctx.guild.id}') for ctx in contexts))
+    elapsed = time.perf_counter() - started
+
+    first_audio = [ctx.voice_client.started[0] - started for ctx in contexts if ctx.voice_client.started]
+    return {
+        'guilds': args.guilds,
+        'playing': len(first_audio),
+        'failed_commands': succeeded.count(False),
+        'seconds': elapsed,
+        'commands_per_second': args.guilds / elapsed,
+        'ttfa_p50': percentile(first_audio, 0.5),
+        'ttfa_p99': percentile(first_audio, 0.99),
+    }
+
+async def scenario_autoqueue(music, args):
+    ctx = FakeContext(1, song_length=3600)
+    voice_client = ctx.voice_client
+    player = music.players.get(1)
+    player.toggle_autoqueue = True
+
+    started = time.perf_counter()
+    await command(music, ctx, 'Artist Seed - Song Seed')
+    deadline = started + args.timeout
+
+    # Skip each song after song_length seconds, since songs that end within a few seconds
+    # are treated as failed streams, and time how long the next one takes to start
+    gaps = []
+    while len(voice_client.started) < args.songs and time.perf_counter() < deadline:
+        playing = len(voice_client.started)
+        await asyncio.sleep(args.song_length)
+        skipped = time.perf_counter()
+        music.stop_playback(ctx)
+        while len(voice_client.started) == playing and player.now_playing is not None and time.perf_counter() < deadline:
+            await asyncio.sleep(0.001)
+        if len(voice_client.started) == playing:
+            # Autoqueue could not find a song, so the session is over
+            break
+        gaps.append(voice_client.started[-1] - skipped)
+    elapsed = time.perf_counter() - started
+
+    # Stop the session so nothing keeps running into the next scenario
+    player.toggle_autoqueue = False
+    if player.refill_task is not None:
+        player.refill_task.cancel()
+    await voice_client.disconnect()
+
+    starts = voice_client.started
+    return {
+        'songs': len(starts),
+        'seconds': elapsed,
+        'songs_per_second': len(starts) / elapsed,
+        'ttfa_p50': percentile([starts[0] - started] if starts else [], 0.5),
+        'gap_p50': percentile(gaps, 0.5),
+        'gap_p99': percentile(gaps, 0.99),
+    }
+
+SCENARIOS = {
+    'import': scenario_import,
+    'concurrent': scenario_concurrent,
+    'autoqueue': scenario_autoqueue,
+}
+
+async def run(name, args, directory):
+    music, ydl, sp = make_music(args, directory, name)
+    monitor = LoopLagMonitor(interval=0.01)
+    if args.memory:
+        tracemalloc.start()
+
+    monitor.start()
+    try:
+        result = await SCENARIOS[name](music, args)
+    finally:
+        monitor.stop()
+        music.resolver.close()
+        music.search_cache.close()
+        music.loudness.close()
+        music.journal.close()
+
+    lag = monitor.stats()
+    result.update({
+        'loop_lag_mean': lag['mean_lag'],
+        'loop_lag_max': lag['max_lag'],
+        'youtube_calls': ydl.calls,
+        'spotify_calls': sp.calls,
+        'injected_failures': ydl.failures + sp.failures,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+    if args.memory:
+        result['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+    return result
+
+def commit():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{revision}-dirty' if dirty else revision
+
+def show(results, previous):
+    for name, result in results.items():
+        print(f"\n{name}")
+        before = previous.get(name, {})
+        for key, value in result.items():
+            line = f"  {key:<20} {value:12.4f}" if isinstance(value, float) else f"  {key:<20} {value!s:>12}"
+            old = before.get(key)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+                line += f"   ({(value - old) / old:+.1%} vs {old:.4g})"
+            print(line)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=['all', *SCENARIOS], default='all')
+    parser.add_argument('--youtube-latency', type=float, default=0.3, help='seconds each yt-dlp call blocks for')
+    parser.add_argument('--spotify-latency', type=float, default=0.1, help='seconds each Spotify call blocks for')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of fake calls that fail')
+    parser.add_argument('--tracks', type=int, default=500, help='playlist size for the import scenario')
+    parser.add_argument('--guilds', type=int, default=50, help='guilds for the concurrent scenario')
+    parser.add_argument('--songs', type=int, default=100, help='songs to play in the autoqueue scenario')
+    parser.add_argument('--song-length', type=float, default=0.5, help='seconds each song plays for before it is skipped in the autoqueue scenario')
+    parser.add_argument('--timeout', type=float, default=300, help='seconds the autoqueue scenario may run for')
+    parser.add_argument('--memory', action='store_true', help='also trace Python allocations (slower)')
+    parser.add_argument('--compare', help='results file to compare against')
+    parser.add_argument('--no-save', action='store_true', help='do not save the results')
+    args = parser.parse_args()
+
+    # Injected failures are logged as warnings by the bot, which would bury the results
+    logging.basicConfig(level=logging.ERROR)
+
+    names = list(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            results[name] = await run(name, args, directory)
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)['results']
+    show(results, previous)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f'{commit()}.json')
+        with open(path, 'w') as file:
+            json.dump({'commit': commit(), 'time': time.time(), 'python': sys.version.split()[0],
+                       'settings': vars(args), 'results': results}, file, indent=2)
+        print(f"\nSaved results to {path}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
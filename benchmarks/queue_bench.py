@@ -0,0 +1,82 @@
+"""
+Compares the old list-of-dicts song queue with the Track/TrackQueue structure.
+
+Reports the memory held by 10k queued tracks and the throughput of appending to and
+taking songs from the front of a queue of that size.
+
+Run from the repository root:
+
+    python -m benchmarks.queue_bench [--tracks 10000]
+"""
+import time
+import argparse
+import tracemalloc
+from utils.track import Track, TrackQueue
+
+def make_dict(i):
+    return {
+        'video_id': f'{i:011d}',
+        'title': f'Artist {i} - Song {i}',
+        'thumbnail': None,
+        'url': None,
+        'expires': None,
+        'duration': 200.0 + i,
+        'spotify_id': None,
+        'retried': False,
+    }
+
+def make_track(i):
+    return Track(f'{i:011d}', f'Artist {i} - Song {i}', duration=200.0 + i)
+
+def fill_list(count):
+    queue = []
+    for i in range(count):
+        queue.append(make_dict(i))
+    return queue
+
+def fill_track_queue(count):
+    queue = TrackQueue(maxlen=count)
+    for i in range(count):
+        queue.append(make_track(i))
+    return queue
+
+def measure_memory(fill, count):
+    tracemalloc.start()
+    queue = fill(count)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del queue
+    return size
+
+def measure_pop(fill, pop, count):
+    queue = fill(count)
+    start = time.perf_counter()
+    while queue:
+        pop(queue)
+    return count / (time.perf_counter() - start)
+
+def measure_append(fill, count):
+    start = time.perf_counter()
+    fill(count)
+    return count / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tracks', type=int, default=10000, help='number of queued tracks')
+    args = parser.parse_args()
+
+    rows = [
+        ('list of dicts', fill_list, lambda queue: queue.pop(0)),
+        ('TrackQueue', fill_track_queue, lambda queue: queue.popleft()),
+    ]
+
+    print(f"{args.tracks} queued tracks")
+    print(f"{'structure':<15}{'memory':>12}{'per track':>12}{'append/s':>14}{'pop front/s':>14}")
+    for name, fill, pop in rows:
+        memory = measure_memory(fill, args.tracks)
+        appends = measure_append(fill, args.tracks)
+        pops = measure_pop(fill, pop, args.tracks)
+        print(f"{name:<15}{memory / 1024:>10.0f}KB{memory / args.tracks:>11.0f}B{appends:>14,.0f}{pops:>14,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Compares running yt-dlp on the resolver's thread pool with running it in worker processes
+(RESOLVER_MODE=process), using a fake YouTubeDL that spends CPU time in pure Python on
+every call like yt-dlp's page parsing does.
+
+Reports the throughput of a burst of extractions, the event loop lag during the burst and,
+for process mode, the calls and throughput of each worker process.
+
+Run from the repository root:
+
+    python -m benchmarks.resolver_processes [--calls 200] [--cpu 0.02] [--latency 0.05] [--workers 4]
+"""
+import os
+import time
+import asyncio
+import argparse
+import functools
+
+# The burst measures the workers, not the YouTube rate limit
+os.environ.setdefault('YOUTUBE_RATE', '100000')
+os.environ.setdefault('YOUTUBE_BURST', '100000')
+
+from utils.resolver import Resolver
+from utils.resolver_processes import YoutubeProcessPool
+from utils.loop_monitor import LoopLagMonitor
+from benchmarks.fakes import FakeYoutubeDL, fake_youtube_dl
+
+async def burst(resolver, calls, offset):
+    urls = [f'https://www.youtube.com/watch?v=burst{offset + i:06d}' for i in range(calls)]
+    monitor = LoopLagMonitor(interval=0.01)
+    monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(resolver.extract(url) for url in urls))
+    elapsed = time.perf_counter() - started
+    monitor.stop()
+    return elapsed, monitor.stats()
+
+async def measure(resolver, args):
+    # Start the workers before timing
+    await burst(resolver, args.workers, 0)
+    elapsed, lag = await burst(resolver, args.calls, args.workers)
+    resolver.close()
+    return elapsed, lag
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--cpu', type=float, default=0.02, help='CPU seconds each call spends in Python')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds each call waits on the network')
+    parser.add_argument('--workers', type=int, default=4, help='resolver threads and worker processes')
+    args = parser.parse_args()
+
+    threads = Resolver(ydl=FakeYoutubeDL(args.latency, cpu=args.cpu), max_workers=args.workers)
+    thread_elapsed, thread_lag = await measure(threads, args)
+
+    pool = YoutubeProcessPool({}, workers=args.workers, factory=functools.partial(fake_youtube_dl, args.latency, args.cpu))
+    processes = Resolver(max_workers=args.workers, processes=pool)
+    process_elapsed, process_lag = await measure(processes, args)
+
+    print(f"{args.calls} extractions, {args.cpu * 1000:.0f}ms CPU and {args.latency * 1000:.0f}ms wait each, "
+          f"{args.workers} workers, {os.cpu_count()} CPUs")
+    print(f"{'mode':<10}{'calls/s':>10}{'mean lag':>12}{'max lag':>12}")
+    for name, elapsed, lag in (('thread', thread_elapsed, thread_lag), ('process', process_elapsed, process_lag)):
+        print(f"{name:<10}{args.calls / elapsed:>10.1f}{lag['mean_lag'] * 1000:>10.1f}ms{lag['max_lag'] * 1000:>10.1f}ms")
+
+    print(f"\n{'worker':<10}{'calls':>8}{'calls/s':>10}")
+    for pid, worker in pool.stats()['per_worker'].items():
+        print(f"{pid:<10}{worker['calls']:>8}{worker['calls_per_second']:>10.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
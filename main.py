@@ -1,11 +1,30 @@
+import time
+
+# Measured before the other imports so the startup report includes them
+STARTED = time.perf_counter()
+
+import io
 import os
+import json
+import hashlib
 import discord
+import yarl
 import random
 import asyncio
-import requests
+import logging
 from dotenv import load_dotenv
-from discord.ext import commands
+from discord import app_commands
+from discord.ext import commands, tasks
 from utils.music import Music
+from utils.assets import AssetManager
+from utils.prayer_times import PrayerTimesClient, PrayerTimesError
+from utils.scheduler import set_priority, INTERACTIVE
+from utils.metrics import metrics
+from utils.loop_monitor import LoopLagMonitor
+
+IMPORT_TIME = time.perf_counter() - STARTED
+
+log = logging.getLogger(__name__)
 
 class DiscordBot(commands.Cog):
     """
@@ -14,6 +33,8 @@ class DiscordBot(commands.Cog):
     Attributes:
         bot (commands.Bot): The bot instance.
         music (Music): An instance of the Music class for managing music-related commands.
+        prayer_times (PrayerTimesClient): A cached client for the prayer times API.
+        assets (AssetManager): The bot's images, loaded into memory at startup.
     """
 
     def __init__(self, bot):
@@ -25,14 +46,144 @@ class DiscordBot(commands.Cog):
         """
         self.bot = bot
         self.music = Music()
+        self.prayer_times = PrayerTimesClient()
+        self.assets = AssetManager()
+        self.loop_monitor = LoopLagMonitor(interval=0.1, on_sample=lambda lag: metrics.observe('event_loop_lag_seconds', lag))
+
+        # Export the stats of every component on the metrics endpoint and in !stats
+        metrics.register('bot', lambda: {'guilds': len(self.bot.guilds), 'voice_clients': len(self.bot.voice_clients),
+                                         'latency': self.bot.latency})
+        metrics.register('music', self.music.stats)
+        metrics.register('resolver', self.music.resolver.stats)
+        metrics.register('spotify', self.music.spotify.stats)
+        metrics.register('search_cache', self.music.search_cache.stats)
+        metrics.register('audio_cache', self.music.audio_cache.stats)
+        metrics.register('loudness', self.music.loudness.stats)
+        metrics.register('suggestions', self.music.suggestions.stats)
+        metrics.register('announcer', self.music.announcer.stats)
+        metrics.register('assets', self.assets.stats)
+        metrics.register('event_loop', self.loop_monitor.stats)
+        metrics.register('voice', self.music.sessions.stats)
+        metrics.register('journal', self.music.journal.stats)
+
+    async def cog_load(self):
+        """
+        Start background tasks when the cog is added to the bot.
+        """
+        self.evict_idle_players.start()
+        self.disconnect_idle_voice.start()
+        self.compact_journal.start()
+        self.flush_search_cache.start()
+        self.warm_up_task = asyncio.create_task(self.warm_up())
+        self.loop_monitor.start()
+        # Each process serves its metrics on METRICS_PORT plus the first shard it runs
+        await metrics.start(offset=min(self.bot.shard_ids) if self.bot.shard_ids else 0)
+
+    async def cog_unload(self):
+        """
+        Stop background tasks when the cog is removed from the bot.
+        """
+        self.evict_idle_players.cancel()
+        self.disconnect_idle_voice.cancel()
+        self.compact_journal.cancel()
+        self.flush_search_cache.cancel()
+        self.warm_up_task.cancel()
+        self.loop_monitor.stop()
+        # Cogs are unloaded before voice disconnects on shutdown, so the journal still
+        # holds the songs that were playing
+        self.music.close()
+        await metrics.stop()
+        await self.prayer_times.close()
+
+    async def warm_up(self):
+        """
+        Create the music clients in the background once the bot is connected, so the first
+        !play does not pay for importing yt-dlp and Spotipy, then resume the playback a
+        restart interrupted.
+        """
+        await self.bot.wait_until_ready()
+        started = time.perf_counter()
+        try:
+            await self.music.resolver.load()
+        except Exception:
+            log.warning("Could not create the music clients, retrying on first use", exc_info=True)
+        else:
+            log.info("Music clients ready in %.2fs", time.perf_counter() - started)
+        await self.music.resume_playback(self.bot)
+
+    async def cog_before_invoke(self, ctx):
+        """
+        Run the YouTube and Spotify calls of a command as interactive work for its guild.
+
+        Args:
+            ctx (commands.Context): The context in which the command was invoked.
+        """
+        set_priority(INTERACTIVE, ctx.guild.id if ctx.guild else None)
+        ctx.started_at = time.perf_counter()
+
+    async def cog_after_invoke(self, ctx):
+        """
+        Record how long a command took, whether or not it succeeded.
+
+        Args:
+            ctx (commands.Context): The context in which the command was invoked.
+        """
+        metrics.observe('command_seconds', time.perf_counter() - ctx.started_at,
+                        command=ctx.command.qualified_name, failed=str(ctx.command_failed).lower())
+
+    @tasks.loop(minutes=1)
+    async def evict_idle_players(self):
+        """
+        Drop the music state of guilds that have been idle for a while.
+        """
+        self.music.players.evict_idle()
+
+    @tasks.loop(minutes=1)
+    async def compact_journal(self):
+        """
+        Compact the queue journal once enough changes have been written to it.
+        """
+        if self.music.journal.needs_compaction():
+            self.music.journal.compact(self.music.players.players)
+
+    @tasks.loop(minutes=1)
+    async def flush_search_cache(self):
+        """
+        Write the search cache's new entries and last-used times, which are only recorded in memory.
+        """
+        self.music.search_cache.flush()
+
+    @tasks.loop(seconds=15)
+    async def disconnect_idle_voice(self):
+        """
+        Leave voice channels where nothing has played for a while.
+        """
+        await self.music.sessions.disconnect_idle(self.bot.voice_clients)
 
     @commands.Cog.listener()
-    async def on_disconnect(self):
+    async def on_voice_state_update(self, member, before, after):
         """
-        Disconnect all voice clients when the bot disconnects.
+        Leave a voice channel once the last human in it leaves.
+
+        Args:
+            member (discord.Member): The member whose voice state changed.
+            before (discord.VoiceState): The voice state before the change.
+            after (discord.VoiceState): The voice state after the change.
         """
-        if self.bot.voice_clients:
-            for voice_client in self.bot.voice_clients:
+        if not member.bot and before.channel is not None and before.channel != after.channel:
+            await self.music.sessions.channel_left(before.channel)
+
+    @commands.Cog.listener()
+    async def on_shard_disconnect(self, shard_id):
+        """
+        Disconnect the voice clients of a shard's guilds when that shard disconnects.
+        Guilds on the other shards keep playing.
+
+        Args:
+            shard_id (int): The ID of the shard that disconnected.
+        """
+        for voice_client in self.bot.voice_clients:
+            if voice_client.guild.shard_id == shard_id:
                 await voice_client.disconnect()
 
     @commands.command()
@@ -57,13 +208,18 @@ class DiscordBot(commands.Cog):
             {"name": "join", "description": "Makes the bot join the voice channel that the user is currently in.", "usage": "!join"},
             {"name": "leave", "description": "Makes the bot leave the voice channel.", "usage": "!leave"},
             {"name": "autoqueue", "description": "Toggles the autoqueue feature, which adds songs to the queue based on the last played song.", "usage": "!autoqueue"},
-            {"name": "play", "description": "Plays a song based on the provided search input (YouTube URL, Spotify URL, or search query).", "usage": "!play <search_input>"},
+            {"name": "play", "description": "Plays a song based on the provided search input (YouTube URL, Spotify URL, or search query). /play suggests songs as you type.", "usage": "!play <search_input> or /play <search_input>"},
             {"name": "skip", "description": "Skips the currently playing song.", "usage": "!skip"},
             {"name": "queue", "description": "Displays the current song queue.", "usage": "!queue"},
             {"name": "clear", "description": "Clears the song queue.", "usage": "!clear"},
+            {"name": "shuffle", "description": "Shuffles the song queue.", "usage": "!shuffle"},
+            {"name": "remove", "description": "Removes the song at a position in the queue.", "usage": "!remove <position>"},
+            {"name": "move", "description": "Moves a song to a new position in the queue.", "usage": "!move <from> <to>"},
             {"name": "pause", "description": "Pauses the currently playing song.", "usage": "!pause"},
             {"name": "resume", "description": "Resumes the paused song.", "usage": "!resume"},
-            {"name": "stop", "description": "Stops the currently playing song and clears the queue.", "usage": "!stop"}
+            {"name": "stop", "description": "Stops the currently playing song and clears the queue.", "usage": "!stop"},
+            {"name": "shards", "description": "Displays the latency, guild count and voice connections of each shard.", "usage": "!shards"},
+            {"name": "stats", "description": "Displays latency and cache statistics. Only available to the bot owner.", "usage": "!stats"}
         ]
         
         for cmd in commands:
@@ -84,11 +240,12 @@ class DiscordBot(commands.Cog):
             ctx (commands.Context): The context in which the command was invoked.
         """
         randomInt = random.randint(0, 1)
-        randomGif = random.randint(1, 7)
 
         # Send the coin flip animation
-        await ctx.send(file=discord.File(f'coinFlips/coinFlip{randomGif}.gif'), delete_after=5)
-        await asyncio.sleep(5)
+        coin_flips = self.assets.group('coinFlips')
+        if coin_flips:
+            await self.assets.send(ctx, random.choice(coin_flips), delete_after=5)
+            await asyncio.sleep(5)
 
         # Send the result of the coin flip
         result = "Heads" if randomInt == 0 else "Tails"
@@ -148,16 +305,17 @@ class DiscordBot(commands.Cog):
             contents (str): The city and country separated by a space.
         """
         country, city = contents.split(" ")
-        url = f'http://api.aladhan.com/v1/timingsByCity?city={city}&country={country}&method=2'
-        response = requests.get(url)
-        data = response.json()
-        prayer_times = data["data"]["timings"]
+        try:
+            prayer_times, stale = await self.prayer_times.timings(country, city)
+        except PrayerTimesError:
+            await ctx.send(f"Could not get prayer times for {city}, {country} right now.")
+            return
 
         embed = discord.Embed(
             title=f"Prayer times for {city}, {country}",
             colour=discord.Colour.blue()
         )
-        embed.set_footer(text='')
+        embed.set_footer(text='Could not reach the prayer times service, showing the last known times.' if stale else '')
         embed.set_thumbnail(url="https://www.ancient-origins.net/sites/default/files/field/image/The-Kaaba.jpg")
         embed.set_author(name=self.bot.user.name, icon_url=self.bot.user.display_avatar.url)
         embed.add_field(name='Fajr', value=f'{prayer_times["Fajr"]}', inline=False)
@@ -176,11 +334,11 @@ class DiscordBot(commands.Cog):
         Args:
             ctx (commands.Context): The context in which the command was invoked.
         """
-        if ctx.author.voice:
-            channel = ctx.author.voice.channel
-            await channel.connect()
-        else:
+        if not ctx.author.voice:
             await ctx.send("You are not connected to a voice channel.")
+            return
+
+        await self.music.connect(ctx)
 
     @commands.command()
     async def leave(self, ctx):
@@ -205,25 +363,39 @@ class DiscordBot(commands.Cog):
         """
         await self.music.autoqueue(ctx)
 
-    @commands.command()
+    @commands.hybrid_command(description="Plays a song from a YouTube URL, Spotify URL, or search query.")
     async def play(self, ctx, *, search_input):
         """
         Plays a song based on the provided search input (YouTube URL, Spotify URL, or search query).
+        Also available as /play, which suggests songs the bot has played or found before.
         
         Args:
             ctx (commands.Context): The context in which the command was invoked.
             search_input (str): The search query or URL for the song.
         """
-        if not ctx.voice_client:
-            if ctx.author.voice:
-                channel = ctx.author.voice.channel
-                await channel.connect()
-            else:
-                await ctx.send("You are not connected to a voice channel.")
-                return
+        # Looking the song up can take longer than a slash command may go unanswered
+        await ctx.defer()
+
+        # Reuses the guild's voice connection if the bot is still lingering in voice
+        if not await self.music.connect(ctx):
+            await ctx.send("You are not connected to a voice channel.")
+            return
 
         await self.music.play_song(ctx, search_input)
 
+    @play.autocomplete('search_input')
+    async def play_autocomplete(self, interaction, current):
+        """
+        Suggests known songs for /play from the local suggestion index, without any network calls.
+        Picking a suggestion plays its YouTube URL, which is queued without looking it up again.
+
+        Args:
+            interaction (discord.Interaction): The autocomplete interaction.
+            current (str): What has been typed so far.
+        """
+        return [app_commands.Choice(name=suggestion.title[:100], value=f"https://www.youtube.com/watch?v={suggestion.video_id}")
+                for suggestion in self.music.suggestions.suggest(current)]
+
     @commands.command()
     async def skip(self, ctx):
         """
@@ -232,8 +404,8 @@ class DiscordBot(commands.Cog):
         Args:
             ctx (commands.Context): The context in which the command was invoked.
         """
-        if ctx.voice_client.is_playing():
-            ctx.voice_client.stop()
+        if ctx.voice_client and ctx.voice_client.is_playing():
+            self.music.stop_playback(ctx)
         else:
             await ctx.send("No music is currently playing.")
 
@@ -257,6 +429,39 @@ class DiscordBot(commands.Cog):
         """
         await self.music.clear_queue(ctx)
 
+    @commands.command()
+    async def shuffle(self, ctx):
+        """
+        Shuffles the song queue.
+        
+        Args:
+            ctx (commands.Context): The context in which the command was invoked.
+        """
+        await self.music.shuffle_queue(ctx)
+
+    @commands.command()
+    async def remove(self, ctx, position: int):
+        """
+        Removes the song at a position in the queue.
+        
+        Args:
+            ctx (commands.Context): The context in which the command was invoked.
+            position (int): The position of the song in the queue, starting at 1.
+        """
+        await self.music.remove_song(ctx, position)
+
+    @commands.command()
+    async def move(self, ctx, source: int, destination: int):
+        """
+        Moves a song to a new position in the queue.
+        
+        Args:
+            ctx (commands.Context): The context in which the command was invoked.
+            source (int): The current position of the song, starting at 1.
+            destination (int): The position to move the song to, starting at 1.
+        """
+        await self.music.move_song(ctx, source, destination)
+
     @commands.command()
     async def pause(self, ctx):
         """
@@ -267,6 +472,8 @@ class DiscordBot(commands.Cog):
         """
         if ctx.voice_client and ctx.voice_client.is_playing():
             ctx.voice_client.pause()
+            self.music.journal.set_paused(ctx.guild.id, True)
+            self.music.refresh_panel(ctx)
             await ctx.send("Paused the music.")
         else:
             await ctx.send("No music is currently playing or I'm not connected to a voice channel.")
@@ -281,6 +488,8 @@ class DiscordBot(commands.Cog):
         """
         if ctx.voice_client and ctx.voice_client.is_paused():
             ctx.voice_client.resume()
+            self.music.journal.set_paused(ctx.guild.id, False)
+            self.music.refresh_panel(ctx)
             await ctx.send("Resumed the music.")
         else:
             await ctx.send("Music is not paused or I'm not connected to a voice channel.")
@@ -293,34 +502,203 @@ class DiscordBot(commands.Cog):
         Args:
             ctx (commands.Context): The context in which the command was invoked.
         """
-        if ctx.voice_client.is_playing():
-            ctx.voice_client.stop()
-            await self.music.clear_queue()
+        if ctx.voice_client and ctx.voice_client.is_playing():
+            # Clear first so the stopped song does not start the next one
+            await self.music.clear_queue(ctx)
+            self.music.stop_playback(ctx)
             await ctx.send("Stopped the music and cleared the queue.")
         else:
             await ctx.send("No music is currently playing.")
 
+    @commands.command()
+    @commands.is_owner()
+    async def stats(self, ctx):
+        """
+        Displays command latencies, time-to-first-audio, resolver latencies and event loop lag,
+        with the full stats of every component attached as a text file. Only the bot owner can use it.
+
+        Args:
+            ctx (commands.Context): The context in which the command was invoked.
+        """
+        embed = discord.Embed(title="Stats", colour=discord.Colour.blue())
+
+        sections = [
+            ("Commands", 'command_seconds', 'command'),
+            ("Time to first audio", 'time_to_first_audio_seconds', 'source'),
+            ("Resolver", 'resolver_seconds', 'operation'),
+            ("Event loop lag", 'event_loop_lag_seconds', None),
+        ]
+        for title, name, label in sections:
+            rows = metrics.summary(name)[:10]
+            lines = [f"`{labels.get(label, 'all') if label else 'all'}` {count}x, mean {mean:.3f}s, "
+                     f"p50 ≤{p50}s, p95 ≤{p95}s" for labels, count, mean, p50, p95 in rows]
+            embed.add_field(name=f"**{title}**", value='\n'.join(lines)[:1024] or "No data yet.", inline=False)
+
+        report = []
+        for component, component_stats in metrics.components.items():
+            report.append(f"[{component}]")
+            report.extend(f"{key} = {value:g}" for key, value in metrics.flatten(component_stats()))
+            report.append("")
+        file = discord.File(io.BytesIO('\n'.join(report).encode()), filename='stats.txt')
+
+        await ctx.send(embed=embed, file=file)
+
+    @commands.command()
+    async def shards(self, ctx):
+        """
+        Displays the gateway latency, guild count and active voice connections of each shard
+        run by this process.
+
+        Args:
+            ctx (commands.Context): The context in which the command was invoked.
+        """
+        embed = discord.Embed(
+            title="Shards",
+            description=f"{len(self.bot.shards)} of {self.bot.shard_count} shards run in this process.",
+            colour=discord.Colour.blue()
+        )
+
+        for shard in self.bot.shard_stats():
+            status = "Disconnected" if shard['closed'] else f"{shard['latency'] * 1000:.0f}ms"
+            current = " (this server)" if ctx.guild and ctx.guild.shard_id == shard['id'] else ""
+            embed.add_field(
+                name=f"**Shard {shard['id']}**{current}",
+                value=f"**Latency:** {status}\n**Guilds:** {shard['guilds']}\n**Voice:** {shard['voice']}",
+                inline=True
+            )
+
+        await ctx.send(embed=embed)
+
 # ================== SETUP ==================
 
 # Load environment variables
 load_dotenv()
 
+class Bot(commands.AutoShardedBot):
+    """
+    The bot. Loads the cog once in setup_hook and logs how long startup took.
+
+    The bot is sharded automatically. SHARD_COUNT and SHARD_IDS let several processes each
+    run a subset of the shards.
+
+    Attributes:
+        startup_times (dict): Seconds spent importing, logging in, setting up the cog and
+            connecting until the first ready event.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.startup_times = {'import': IMPORT_TIME}
+
+    async def login(self, token):
+        """
+        Log in and time it. setup_hook runs as part of logging in and is timed separately.
+        """
+        started = time.perf_counter()
+        await super().login(token)
+        self.startup_times['login'] = time.perf_counter() - started - self.startup_times['setup']
+
+    async def setup_hook(self):
+        """
+        Add the cog. Unlike on_ready, this only runs once, not on every reconnect.
+        """
+        started = time.perf_counter()
+        await self.add_cog(DiscordBot(self))
+
+        # Register the slash commands from the process running the first shard only
+        if self.shard_ids is None or 0 in self.shard_ids:
+            await self.sync_commands()
+        self.startup_times['setup'] = time.perf_counter() - started
+
+    async def sync_commands(self):
+        """
+        Register the slash commands with Discord if they changed since the last sync.
+
+        A sync overwrites every global command and is rate limited, so a hash of the
+        commands is kept in a file and restarts with the same commands skip it. Set
+        SYNC_COMMANDS to 'always' to sync on every start or 'never' to not sync at all.
+
+        Returns:
+            bool: Whether the commands were synced.
+        """
+        mode = os.environ.get('SYNC_COMMANDS', 'auto').lower()
+        if mode == 'never':
+            return False
+
+        commands = [command.to_dict(self.tree) for command in self.tree.get_commands()]
+        digest = hashlib.sha256(json.dumps(commands, sort_keys=True).encode()).hexdigest()
+        path = os.environ.get('COMMAND_HASH_PATH', 'data/commands.hash')
+        if mode != 'always':
+            try:
+                with open(path, encoding='utf-8') as file:
+                    if file.read().strip() == digest:
+                        log.info("Slash commands are unchanged, not syncing them")
+                        return False
+            except FileNotFoundError:
+                pass
+
+        await self.tree.sync()
+        log.info("Synced %d slash commands", len(commands))
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(digest)
+        return True
+
+    async def on_ready(self):
+        """
+        Event handler for when the bot is ready. Logs the startup report the first time.
+        """
+        if 'ready' not in self.startup_times:
+            self.startup_times['ready'] = time.perf_counter() - STARTED
+            log.info("Startup: imports %.2fs, login %.2fs, cog setup %.2fs, ready after %.2fs",
+                     self.startup_times['import'], self.startup_times['login'],
+                     self.startup_times['setup'], self.startup_times['ready'])
+        print(f"{self.user} is now running!")
+
+    def shard_stats(self):
+        """
+        Return the health of each shard run by this process.
+
+        Returns:
+            list: A dict per shard with its ID, gateway latency in seconds, whether it is
+                disconnected, and its number of guilds and voice connections.
+        """
+        guilds = {shard_id: 0 for shard_id in self.shards}
+        for guild in self.guilds:
+            guilds[guild.shard_id] = guilds.get(guild.shard_id, 0) + 1
+
+        voice = {shard_id: 0 for shard_id in self.shards}
+        for voice_client in self.voice_clients:
+            voice[voice_client.guild.shard_id] = voice.get(voice_client.guild.shard_id, 0) + 1
+
+        return [{'id': shard.id, 'latency': shard.latency, 'closed': shard.is_closed(),
+                 'guilds': guilds[shard.id], 'voice': voice[shard.id]}
+                for shard in sorted(self.shards.values(), key=lambda shard: shard.id)]
+
 # Set up discord bot
 intents = discord.Intents.default()
 intents.message_content = True  # Enable intents to read message content
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Shard this process runs, e.g. SHARD_COUNT=4 and SHARD_IDS=0,1 in one process and 2,3 in another.
+# By default the bot runs every shard, with the shard count Discord recommends.
+shard_count = os.environ.get('SHARD_COUNT')
+shard_ids = os.environ.get('SHARD_IDS')
 
-# Add Cog
-@bot.event
-async def on_ready():
-    """
-    Event handler for when the bot is ready.
-    """
-    await bot.add_cog(DiscordBot(bot))
-    print(f"{bot.user} is now running!")
+bot = Bot(command_prefix="!", intents=intents,
+          shard_count=int(shard_count) if shard_count else None,
+          shard_ids=[int(shard_id) for shard_id in shard_ids.split(',')] if shard_ids else None)
 
 if __name__ == "__main__":
+    # Talk to a local stand-in for Discord instead, e.g. benchmarks/fake_gateway.py
+    if os.environ.get('DISCORD_API_URL'):
+        discord.http.Route.BASE = os.environ['DISCORD_API_URL']
+    if os.environ.get('DISCORD_GATEWAY_URL'):
+        discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(os.environ['DISCORD_GATEWAY_URL'])
+
     # Run bot
     bot_token = os.environ['BOT_TOKEN']
-    bot.run(bot_token)
+    # Also show the log messages of the bot's own modules
+    bot.run(bot_token, root_logger=True)
@@ -0,0 +1,53 @@
+import os
+import time
+import asyncio
+import pytest
+
+from utils.audio_cache import AudioCache
+
+def test_only_abandoned_downloads_are_cleaned_up(tmp_path):
+    directory = tmp_path / 'audio'
+    directory.mkdir()
+    # Another process sharing the directory is still writing this one
+    running = directory / 'a.opus.4242.part'
+    running.write_bytes(b'partial')
+    abandoned = directory / 'b.opus.4243.part'
+    abandoned.write_bytes(b'partial')
+    old = time.time() - AudioCache.STALE_PART_SECONDS - 60
+    os.utime(abandoned, (old, old))
+
+    AudioCache(directory=str(directory))
+    assert running.exists()
+    assert not abandoned.exists()
+
+class FakeProcess:
+    returncode = 0
+
+    def __init__(self, arguments):
+        self.arguments = arguments
+
+    async def communicate(self):
+        # ffmpeg writes its output to the last argument
+        with open(self.arguments[-1], 'wb') as file:
+            file.write(b'audio')
+        return b'', b''
+
+@pytest.mark.parametrize('opus, codec', [(True, ['-c:a', 'copy']), (False, ['-c:a', 'libopus', '-b:a', '128k'])])
+def test_opus_streams_are_copied_instead_of_encoded(tmp_path, monkeypatch, opus, codec):
+    calls = []
+
+    async def create_subprocess_exec(*arguments, **kwargs):
+        calls.append(arguments)
+        return FakeProcess(arguments)
+    monkeypatch.setattr(asyncio, 'create_subprocess_exec', create_subprocess_exec)
+
+    cache = AudioCache(directory=str(tmp_path / 'audio'))
+    asyncio.run(cache.store('video', 'https://example.com/stream', opus))
+
+    [arguments] = calls
+    start = arguments.index('-vn') + 1
+    assert list(arguments[start:start + len(codec)]) == codec
+    # Each process downloads into a temporary file of its own
+    assert arguments[-1].endswith(f'.{os.getpid()}.part')
+    assert cache.entries == {'video': 5}
+    assert os.listdir(cache.directory) == ['video.opus']
@@ -0,0 +1,74 @@
+import os
+import time
+import asyncio
+import sqlite3
+import discord
+import pytest
+
+@pytest.fixture
+def environment(tmp_path, monkeypatch):
+    monkeypatch.setenv('SPOTIFY_CLIENT_ID', 'test')
+    monkeypatch.setenv('SPOTIFY_CLIENT_SECRET', 'test')
+    monkeypatch.delenv('AUDIO_CACHE_DIR', raising=False)
+    monkeypatch.delenv('METRICS_PORT', raising=False)
+    monkeypatch.setenv('QUEUE_RESUME', 'false')
+    monkeypatch.setenv('SEARCH_CACHE_PATH', str(tmp_path / 'search_cache.db'))
+    monkeypatch.setenv('LOUDNESS_PATH', str(tmp_path / 'loudness.db'))
+    monkeypatch.setenv('QUEUE_JOURNAL_PATH', str(tmp_path / 'queue.journal'))
+    return monkeypatch
+
+async def load_cog():
+    from main import Bot, DiscordBot
+
+    intents = discord.Intents.default()
+    bot = Bot(command_prefix='!', intents=intents, shard_count=1, shard_ids=[0])
+    cog = DiscordBot(bot)
+    await bot.add_cog(cog)
+    return bot, cog
+
+def test_unloading_the_cog_releases_the_music_resources(environment):
+    async def run():
+        bot, cog = await load_cog()
+        music = cog.music
+        analysis = asyncio.create_task(asyncio.sleep(60))
+        music.loudness._pending['video'] = analysis
+
+        await bot.remove_cog('DiscordBot')
+        await asyncio.sleep(0)
+
+        assert music.resolver.executor._shutdown
+        assert analysis.cancelled()
+        for db in (music.search_cache.db, music.loudness.db):
+            with pytest.raises(sqlite3.ProgrammingError):
+                db.execute('SELECT 1')
+
+    asyncio.run(run())
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+def test_unloading_the_cog_stops_the_worker_processes(environment):
+    environment.setenv('RESOLVER_MODE', 'process')
+    environment.setenv('RESOLVER_PROCESSES', '2')
+
+    async def run():
+        bot, cog = await load_cog()
+        executor = cog.music.resolver.processes.executor
+        # Workers are started on demand, so give both of them something to do
+        for future in [executor.submit(time.sleep, 0.1) for _ in range(2)]:
+            future.result()
+        pids = list(executor._processes)
+        assert pids and all(map(alive, pids))
+
+        await bot.remove_cog('DiscordBot')
+        for _ in range(100):
+            if not any(map(alive, pids)):
+                break
+            await asyncio.sleep(0.1)
+        assert not any(map(alive, pids))
+
+    asyncio.run(run())
@@ -0,0 +1,43 @@
+import pytest
+
+from utils.loudness import LoudnessStore
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.delenv('LOUDNESS_NORMALIZE', raising=False)
+    store = LoudnessStore(path=str(tmp_path / 'loudness.db'), target=-14, min_gain=1.0)
+    yield store
+    store.close()
+
+@pytest.mark.parametrize('integrated, true_peak, expected', [
+    (-14.5, -3.0, None),   # close enough to the target to pass through
+    (-8.0, -0.1, -6.0),    # loud songs are turned down, whatever their peak
+    (-20.0, -10.0, 6.0),   # quiet songs are boosted to the target
+    (-30.0, -2.0, 1.0),    # but only as far as the peak headroom allows
+    (-40.0, -25.0, 10.0),  # and by at most max_boost
+    (-20.0, 0.5, None),    # a quiet song without headroom is left alone, not turned down
+])
+def test_gain(store, integrated, true_peak, expected):
+    store.put('video', integrated, true_peak)
+    assert store.gain('video') == expected
+
+def test_small_adjustments_are_skipped_by_default(tmp_path, monkeypatch):
+    monkeypatch.delenv('LOUDNESS_NORMALIZE', raising=False)
+    monkeypatch.delenv('LOUDNESS_MIN_GAIN', raising=False)
+    store = LoudnessStore(path=str(tmp_path / 'loudness.db'), target=-14)
+    try:
+        # Songs within a few dB of the target are passed through rather than transcoded
+        store.put('close', -16.5, -5.0)
+        store.put('far', -20.0, -10.0)
+        assert store.gain('close') is None
+        assert store.gain('far') == 6.0
+    finally:
+        store.close()
+
+def test_measurements_survive_a_restart(store):
+    store.put('video', -20.0, -10.0)
+    reopened = LoudnessStore(path=store.path, target=-14, min_gain=1.0)
+    try:
+        assert reopened.gain('video') == 6.0
+    finally:
+        reopened.close()
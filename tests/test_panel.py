@@ -0,0 +1,44 @@
+import asyncio
+import discord
+import pytest
+
+from utils.panel import PlayerPanel
+
+class Response:
+    def __init__(self, status):
+        self.status = status
+        self.reason = 'Error'
+
+class FailingMessage:
+    def __init__(self, error):
+        self.error = error
+
+    async def edit(self, **kwargs):
+        raise self.error
+
+class Channel:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, **kwargs):
+        self.sent.append(kwargs)
+        return FailingMessage(None)
+
+@pytest.mark.parametrize('error', [discord.NotFound(Response(404), 'Unknown Message'),
+                                   discord.HTTPException(Response(429), 'Too Many Requests')])
+def test_failed_final_update_does_not_post_a_new_panel(error):
+    async def run():
+        channel = Channel()
+        panel = PlayerPanel(channel, lambda: discord.Embed(title='Nothing playing'), min_interval=0.01)
+        panel.message = FailingMessage(error)
+
+        await panel.close()
+        panel.refresh()
+        await panel.update()
+        await asyncio.sleep(0.1)
+
+        assert panel.message is None
+        assert panel._task is None
+        assert channel.sent == []
+
+    asyncio.run(run())
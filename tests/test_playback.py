@@ -0,0 +1,165 @@
+import time
+import asyncio
+import pytest
+
+from benchmarks.fakes import FakeYoutubeDL, FakeSpotify, FakeContext, FakeAudioSource
+
+@pytest.fixture
+def music(tmp_path, monkeypatch):
+    """
+    A Music instance with fresh caches that talks to the fakes in benchmarks/fakes.py.
+    """
+    monkeypatch.setenv('SPOTIFY_CLIENT_ID', 'test')
+    monkeypatch.setenv('SPOTIFY_CLIENT_SECRET', 'test')
+    monkeypatch.delenv('AUDIO_CACHE_DIR', raising=False)
+    monkeypatch.setenv('SEARCH_CACHE_PATH', str(tmp_path / 'search_cache.db'))
+    monkeypatch.setenv('LOUDNESS_PATH', str(tmp_path / 'loudness.db'))
+    monkeypatch.setenv('LOUDNESS_NORMALIZE', 'false')
+    monkeypatch.setenv('QUEUE_JOURNAL_PATH', str(tmp_path / 'queue.journal'))
+
+    from utils.music import Music
+    music = Music()
+    ydl = FakeYoutubeDL(0.01, seed=1)
+    sp = FakeSpotify(0.01, playlist_size=20, seed=2)
+    music.resolver.loader = lambda: (ydl, sp, ydl)
+    music.audio_source = lambda song, local_path=None: FakeAudioSource()
+    yield music
+
+    music.close()
+
+def test_concurrent_play_commands_start_one_song_and_queue_the_other(music):
+    async def run():
+        ctx = FakeContext(1, song_length=3600)
+        # The strict fake voice client raises if a second song is started over the first
+        await asyncio.gather(music.play_song(ctx, 'first song'), music.play_song(ctx, 'second song'))
+
+        player = music.players.get(1)
+        assert len(ctx.voice_client.started) == 1
+        assert {player.now_playing.title, *(song.title for song in player.song_queue)} == {'first song', 'second song'}
+        await ctx.voice_client.disconnect()
+
+    asyncio.run(run())
+
+def test_song_finished_while_a_command_starts_playback(music):
+    async def run():
+        ctx = FakeContext(1, song_length=0.05)
+        await music.play_song(ctx, 'first song')
+        # The first song ends and hands over to play_next while more songs are requested
+        await asyncio.gather(music.play_song(ctx, 'second song'), music.play_song(ctx, 'third song'))
+        await asyncio.sleep(0.5)
+
+        assert len(ctx.voice_client.started) >= 2
+        await ctx.voice_client.disconnect()
+
+    asyncio.run(run())
+
+def test_playlist_import_starts_playback_once(music):
+    async def run():
+        ctx = FakeContext(1, song_length=3600)
+        await music.play_song(ctx, 'https://open.spotify.com/playlist/test')
+
+        player = music.players.get(1)
+        assert len(ctx.voice_client.started) == 1
+        assert len(player.song_queue) == 19
+        await ctx.voice_client.disconnect()
+
+    asyncio.run(run())
+
+def test_players_in_voice_are_not_evicted_before_anything_is_played(music):
+    async def run():
+        ctx = FakeContext(1, song_length=3600)
+        assert await music.connect(ctx)
+
+        player = music.players.get(1)
+        player.last_active -= music.players.idle_timeout + 1
+        assert music.players.evict_idle() == 0
+
+        await ctx.voice_client.disconnect()
+        assert music.players.evict_idle() == 1
+
+    asyncio.run(run())
+
+@pytest.mark.parametrize('resumed_after, position', [(None, 30), (70, 930)])
+def test_time_spent_paused_does_not_count_towards_the_resume_position(music, monkeypatch, resumed_after, position):
+    from utils.track import Track
+
+    # Play a song from 1000 seconds ago, pause it after 30 seconds and maybe resume it later
+    now = time.time() - 1000
+    with monkeypatch.context() as patch:
+        patch.setattr(time, 'time', lambda: now)
+        music.journal.set_playing(1, Track('video', 'song', duration=3600), 10, 20)
+        now += 30
+        music.journal.set_paused(1, True)
+        if resumed_after is not None:
+            now += resumed_after
+            music.journal.set_paused(1, False)
+
+    # Restart
+    music.journal.close()
+    music.restore_queues()
+    assert music.players.get(1).song_queue[0].start == pytest.approx(position, abs=2)
+
+def test_songs_being_cached_are_analysed_from_the_cached_file(music, tmp_path, monkeypatch):
+    from utils.audio_cache import AudioCache
+    from utils.track import Track
+
+    async def run():
+        music.audio_cache = AudioCache(directory=str(tmp_path / 'audio'), on_prefetch=True)
+        analysed = []
+        monkeypatch.setattr(music.loudness, 'schedule', lambda video_id, source: analysed.append(source))
+
+        async def store(video_id, stream_url, opus=False):
+            await asyncio.sleep(0.05)
+            path = music.audio_cache.path(video_id)
+            with open(path, 'wb') as file:
+                file.write(b'audio')
+            music.audio_cache.entries[video_id] = 5
+        monkeypatch.setattr(music.audio_cache, 'store', store)
+
+        song = Track('video', 'song')
+        song.url = 'https://example.com/stream'
+        music.audio_cache.schedule_store(song.video_id, song.url)
+        music.schedule_loudness(song)
+        assert analysed == []
+
+        await asyncio.sleep(0.1)
+        assert analysed == [music.audio_cache.path('video')]
+
+        # Songs that are not being cached are analysed from their stream
+        other = Track('other', 'other song')
+        other.url = 'https://example.com/other'
+        music.schedule_loudness(other)
+        assert analysed[-1] == other.url
+
+    asyncio.run(run())
+
+def test_import_that_fails_partway_finishes_its_progress_message(music):
+    class FailingSpotify(FakeSpotify):
+        PAGE_SIZE = 10
+
+        def next(self, page):
+            raise RuntimeError("Spotify is down")
+
+    # A two page playlist whose second page can't be fetched
+    sp = FailingSpotify(0.01, playlist_size=15, seed=3)
+    ydl = FakeYoutubeDL(0.01, seed=1)
+    music.resolver.loader = lambda: (ydl, sp, ydl)
+    imports = []
+    start_import = music.announcer.start_import
+    music.announcer.start_import = lambda ctx: imports.append(start_import(ctx)) or imports[-1]
+
+    async def run():
+        ctx = FakeContext(1, song_length=3600)
+        with pytest.raises(RuntimeError):
+            await music.play_song(ctx, 'https://open.spotify.com/playlist/test')
+
+        [progress] = imports
+        player = music.players.get(1)
+        # Every track of the first page was resolved and queued before the import stopped
+        assert progress.done and not progress.complete
+        assert progress.resolved == 10
+        assert 1 + len(player.song_queue) == 10
+        assert progress.embed().title == "Import from Spotify stopped early"
+        await ctx.voice_client.disconnect()
+
+    asyncio.run(run())
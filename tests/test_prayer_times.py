@@ -0,0 +1,116 @@
+import json
+import asyncio
+import pytest
+from aiohttp import web
+
+from utils.prayer_times import PrayerTimesClient, PrayerTimesError
+
+TIMINGS = {'Fajr': '05:00', 'Dhuhr': '12:30', 'Asr': '16:00', 'Maghrib': '19:00', 'Isha': '20:30'}
+
+class StubAladhan:
+    """
+    A local stand-in for the Aladhan API. Each request is answered with the next queued
+    (status, body) pair, or with today's timings once the queue is empty.
+    """
+    def __init__(self):
+        self.responses = []
+        self.requests = 0
+        self.delay = 0.0
+
+    async def timings_by_city(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        if self.responses:
+            status, body = self.responses.pop(0)
+        else:
+            status, body = 200, {'code': 200, 'data': {'timings': TIMINGS, 'date': {'gregorian': {'date': '01-01-2026'}},
+                                                       'meta': {'timezone': 'America/Toronto'}}}
+        return web.Response(status=status, text=body if isinstance(body, str) else json.dumps(body),
+                            content_type='application/json')
+
+async def serve(stub):
+    app = web.Application()
+    app.router.add_get('/v1/timingsByCity', stub.timings_by_city)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f'http://127.0.0.1:{port}/v1'
+
+def run_against_stub(test, **kwargs):
+    async def run():
+        stub = StubAladhan()
+        runner, url = await serve(stub)
+        client = PrayerTimesClient(base_url=url, **kwargs)
+        try:
+            await test(stub, client)
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+def expire(client, key):
+    timings, date, _ = client.cache.get(key)
+    client.cache.put(key, (timings, date, 0))
+
+def test_timings_are_cached_per_city():
+    async def test(stub, client):
+        assert await client.timings('Canada', 'Toronto') == (TIMINGS, False)
+        assert await client.timings(' canada', 'TORONTO ') == (TIMINGS, False)
+        assert stub.requests == 1
+
+    run_against_stub(test)
+
+def test_concurrent_requests_share_one_call():
+    async def test(stub, client):
+        stub.delay = 0.05
+        results = await asyncio.gather(*(client.timings('Canada', 'Toronto') for _ in range(5)))
+        assert results == [(TIMINGS, False)] * 5
+        assert stub.requests == 1
+
+    run_against_stub(test)
+
+@pytest.mark.parametrize('body', ['[]', 'null', '"Service Unavailable"', '<html>Bad Gateway</html>',
+                                  {'code': 400, 'data': 'Unable to find city'}, {'data': {'timings': None}}])
+def test_malformed_responses_raise_prayer_times_error(body):
+    async def test(stub, client):
+        stub.responses.append((200, body))
+        with pytest.raises(PrayerTimesError):
+            await client.timings('Canada', 'Toronto')
+
+    run_against_stub(test)
+
+@pytest.mark.parametrize('status, body', [(200, '[]'), (200, 'null'), (502, '"Bad Gateway"'), (500, {'code': 500})])
+def test_failures_fall_back_to_stale_timings(status, body):
+    async def test(stub, client):
+        await client.timings('Canada', 'Toronto')
+        expire(client, ('canada', 'toronto'))
+
+        stub.responses.append((status, body))
+        assert await client.timings('Canada', 'Toronto') == (TIMINGS, True)
+        # The next request reaches the API again
+        assert await client.timings('Canada', 'Toronto') == (TIMINGS, False)
+        assert stub.requests == 3
+
+    run_against_stub(test)
+
+def test_timeout_falls_back_to_stale_timings():
+    async def test(stub, client):
+        await client.timings('Canada', 'Toronto')
+        expire(client, ('canada', 'toronto'))
+
+        stub.delay = 1
+        assert await client.timings('Canada', 'Toronto') == (TIMINGS, True)
+
+    run_against_stub(test, timeout=0.1)
+
+def test_cache_is_bounded():
+    async def test(stub, client):
+        for city in ('Toronto', 'Ottawa', 'Montreal'):
+            await client.timings('Canada', city)
+        assert len(client.cache) == 2
+        assert ('canada', 'toronto') not in client.cache
+
+    run_against_stub(test, max_entries=2)
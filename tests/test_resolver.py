@@ -0,0 +1,41 @@
+import asyncio
+
+from utils.resolver import Resolver
+from utils.scheduler import Scheduler, priority, INTERACTIVE, AUTOQUEUE
+
+class RecordingYoutubeDL:
+    def __init__(self):
+        self.calls = []
+
+    def extract_info(self, query, download=False):
+        self.calls.append(query)
+        return {'entries': [{'id': query, 'title': query}]}
+
+def test_interactive_caller_raises_the_autoqueue_call_it_joins():
+    async def run():
+        ydl = RecordingYoutubeDL()
+        resolver = Resolver(ydl=ydl, max_workers=1)
+        # One call every 0.05s, so the autoqueue refill's searches queue up
+        resolver.scheduler = Scheduler(1, {'youtube': (20, 1), 'spotify': (20, 1)})
+        try:
+            with priority(AUTOQUEUE, 1):
+                refill = [asyncio.create_task(resolver.search(f'song {i}')) for i in range(6)]
+            await asyncio.sleep(0)
+
+            with priority(INTERACTIVE, 2):
+                result = await resolver.search('song 5')
+
+            assert result['entries'][0]['id'] == 'song 5'
+            assert resolver.dedup_hits['search'] == 1
+            # Only the search that already had the slot ran before it
+            assert ydl.calls == ['song 0', 'song 5']
+            stats = resolver.scheduler.stats()['classes']
+            assert stats['interactive']['started'] == 1
+            assert stats['autoqueue']['waiting'] == 4
+
+            await asyncio.gather(*refill)
+            assert sorted(ydl.calls) == [f'song {i}' for i in range(6)]
+        finally:
+            resolver.close()
+
+    asyncio.run(run())
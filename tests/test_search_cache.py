@@ -0,0 +1,67 @@
+import sqlite3
+
+from utils.search_cache import SearchCache
+
+def last_used(path, key):
+    with sqlite3.connect(path) as db:
+        row = db.execute('SELECT last_used FROM search_cache WHERE key = ?', (key,)).fetchone()
+    return row and row[0]
+
+def test_hits_are_written_on_flush(tmp_path):
+    path = str(tmp_path / 'search_cache.db')
+    cache = SearchCache(path=path)
+    cache.put('query:a', 'video-a', 'A')
+    cache.flush()
+    stored = last_used(path, 'query:a')
+
+    assert cache.get('query:a') == ('video-a', 'A')
+    assert last_used(path, 'query:a') == stored
+
+    cache.flush()
+    assert last_used(path, 'query:a') > stored
+    cache.close()
+
+def test_stores_are_written_on_flush(tmp_path):
+    path = str(tmp_path / 'search_cache.db')
+    cache = SearchCache(path=path, max_entries=2)
+    for key in ('query:a', 'query:b', 'query:c'):
+        cache.put(key, 'video')
+    assert last_used(path, 'query:a') is None
+
+    cache.flush()
+    # The entry evicted before the flush is never written
+    assert last_used(path, 'query:a') is None
+    assert last_used(path, 'query:b') is not None
+    assert last_used(path, 'query:c') is not None
+    cache.close()
+
+def test_least_recently_hit_entries_are_evicted_after_a_restart(tmp_path):
+    path = str(tmp_path / 'search_cache.db')
+    cache = SearchCache(path=path, max_entries=2)
+    cache.put('query:a', 'video-a')
+    cache.put('query:b', 'video-b')
+    cache.get('query:a')
+    cache.close()
+
+    reopened = SearchCache(path=path, max_entries=2)
+    reopened.put('query:c', 'video-c')
+    assert list(reopened.entries) == ['query:a', 'query:c']
+    reopened.close()
+
+def test_expired_entries_are_deleted_on_flush(tmp_path):
+    path = str(tmp_path / 'search_cache.db')
+    cache = SearchCache(path=path)
+    cache.put('query:old', 'video-old')
+    cache.put('query:again', 'video-again')
+    cache.entries['query:old'] = ('video-old', None, 0)
+    cache.entries['query:again'] = ('video-again', None, 0)
+
+    assert cache.get('query:old') is None
+    assert cache.get('query:again') is None
+    # Storing a key again keeps it, even though it was found expired before the flush
+    cache.put('query:again', 'video-new')
+    cache.flush()
+
+    assert last_used(path, 'query:old') is None
+    assert last_used(path, 'query:again') is not None
+    cache.close()
@@ -0,0 +1,128 @@
+import socket
+import asyncio
+import logging
+import discord
+import pytest
+import yarl
+
+from benchmarks.fake_gateway import FakeGateway
+from utils.metrics import Metrics
+
+@pytest.fixture
+def environment(tmp_path, monkeypatch):
+    monkeypatch.setenv('SPOTIFY_CLIENT_ID', 'test')
+    monkeypatch.setenv('SPOTIFY_CLIENT_SECRET', 'test')
+    monkeypatch.delenv('AUDIO_CACHE_DIR', raising=False)
+    monkeypatch.delenv('METRICS_PORT', raising=False)
+    monkeypatch.setenv('LOUDNESS_NORMALIZE', 'false')
+    monkeypatch.setenv('QUEUE_RESUME', 'false')
+    monkeypatch.setenv('COMMAND_HASH_PATH', str(tmp_path / 'commands.hash'))
+    monkeypatch.delenv('SYNC_COMMANDS', raising=False)
+    monkeypatch.setattr(discord.http.Route, 'BASE', 'http://127.0.0.1:1/api/v10')
+    return tmp_path, monkeypatch
+
+def create_bot(directory, monkeypatch, shard_ids, shard_count):
+    from main import Bot
+
+    # Every process keeps its own caches and journal
+    name = '-'.join(map(str, shard_ids))
+    monkeypatch.setenv('SEARCH_CACHE_PATH', str(directory / f'search-{name}.db'))
+    monkeypatch.setenv('LOUDNESS_PATH', str(directory / f'loudness-{name}.db'))
+    monkeypatch.setenv('QUEUE_JOURNAL_PATH', str(directory / f'queue-{name}.journal'))
+    intents = discord.Intents.default()
+    intents.message_content = True
+    return Bot(command_prefix='!', intents=intents, shard_count=shard_count, shard_ids=shard_ids)
+
+def test_processes_each_run_their_own_shards(environment):
+    directory, monkeypatch = environment
+
+    async def run():
+        gateway = FakeGateway(guilds=10, shards=2)
+        await gateway.start()
+        monkeypatch.setattr(discord.http.Route, 'BASE', gateway.api_url)
+        monkeypatch.setattr(discord.gateway.DiscordWebSocket, 'DEFAULT_GATEWAY', yarl.URL(gateway.gateway_url))
+
+        # Two processes, one shard each
+        bots = [create_bot(directory, monkeypatch, [shard_id], 2) for shard_id in (0, 1)]
+        tasks = [asyncio.create_task(bot.start('fake-token')) for bot in bots]
+        try:
+            await asyncio.wait_for(asyncio.gather(*(bot.wait_until_ready() for bot in bots)), 10)
+
+            assert gateway.identified == {0: 1, 1: 1}
+            # Only the process running shard 0 registers the slash commands
+            assert gateway.command_syncs == 1
+
+            for shard_id, bot in enumerate(bots):
+                guild_ids = {guild.id for guild in bot.guilds}
+                assert guild_ids == {guild_id for guild_id in gateway.guild_ids if gateway.shard_of(guild_id) == shard_id}
+                assert [(shard['id'], shard['guilds'], shard['voice']) for shard in bot.shard_stats()] == [(shard_id, 5, 0)]
+
+            # A command is answered by the process that runs the guild's shard, about that shard
+            guild_id = next(guild_id for guild_id in gateway.guild_ids if gateway.shard_of(guild_id) == 1)
+            channel_id = await gateway.send_message(guild_id, '!shards')
+            for _ in range(100):
+                if channel_id in gateway.messages:
+                    break
+                await asyncio.sleep(0.05)
+            [reply] = gateway.messages[channel_id]
+            assert reply['embeds'][0]['fields'][0]['name'] == '**Shard 1** (this server)'
+        finally:
+            for bot in bots:
+                await bot.close()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await gateway.close()
+
+    asyncio.run(run())
+
+@pytest.mark.parametrize('mode, syncs', [('auto', 1), ('always', 2), ('never', 0)])
+def test_commands_are_only_synced_when_they_change(environment, mode, syncs):
+    directory, monkeypatch = environment
+    monkeypatch.setenv('SYNC_COMMANDS', mode)
+
+    async def run():
+        gateway = FakeGateway(guilds=2, shards=1)
+        await gateway.start()
+        monkeypatch.setattr(discord.http.Route, 'BASE', gateway.api_url)
+        monkeypatch.setattr(discord.gateway.DiscordWebSocket, 'DEFAULT_GATEWAY', yarl.URL(gateway.gateway_url))
+
+        try:
+            # The same process restarted with the same commands
+            for _ in range(2):
+                bot = create_bot(directory, monkeypatch, [0], 1)
+                task = asyncio.create_task(bot.start('fake-token'))
+                try:
+                    await asyncio.wait_for(bot.wait_until_ready(), 10)
+                finally:
+                    await bot.close()
+                    await asyncio.gather(task, return_exceptions=True)
+            assert gateway.command_syncs == syncs
+        finally:
+            await gateway.close()
+
+    asyncio.run(run())
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def test_metrics_ports_are_offset_per_process_and_bind_failures_are_logged(caplog):
+    async def run():
+        port = free_port()
+        first, second, clash = Metrics(port=port), Metrics(port=port), Metrics(port=port)
+        await first.start()
+        # A process whose first shard is 1 serves its metrics on the next port
+        await second.start(offset=1)
+        # A process without an offset of its own can't bind, but keeps running
+        with caplog.at_level(logging.WARNING, logger='utils.metrics'):
+            await clash.start()
+
+        assert first._runner is not None
+        assert second._runner is not None
+        assert clash._runner is None
+        assert "continuing without them" in caplog.text
+
+        await first.stop()
+        await second.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,41 @@
+import asyncio
+import pytest
+
+from utils.spotify import SpotifyClient, TrackUnavailable
+
+class StubResolver:
+    """
+    Answers batched track lookups like the Spotify Web API, with None for unknown IDs.
+    """
+    def __init__(self, known):
+        self.known = known
+        self.calls = []
+
+    async def spotify(self, method, track_ids):
+        self.calls.append((method, list(track_ids)))
+        await asyncio.sleep(0)
+        return {'tracks': [{'id': track_id} if track_id in self.known else None for track_id in track_ids]}
+
+def test_lookups_in_one_window_share_a_batch():
+    async def run():
+        resolver = StubResolver({'a', 'b'})
+        client = SpotifyClient(resolver, batch_window=0.01)
+        tracks = await asyncio.gather(client.track('a'), client.track('b'), client.track('a'))
+
+        assert [track['id'] for track in tracks] == ['a', 'b', 'a']
+        assert resolver.calls == [('tracks', ['a', 'b'])]
+        assert not client._batches
+
+    asyncio.run(run())
+
+def test_unavailable_track_raises_for_its_waiter_only():
+    async def run():
+        client = SpotifyClient(StubResolver({'a'}), batch_window=0.01)
+        found, missing = await asyncio.gather(client.track('a'), client.track('gone'), return_exceptions=True)
+
+        assert found == {'id': 'a'}
+        assert isinstance(missing, TrackUnavailable)
+        with pytest.raises(TrackUnavailable):
+            await client.track('gone')
+
+    asyncio.run(run())
@@ -0,0 +1,287 @@
+import os
+import asyncio
+import logging
+import discord
+
+log = logging.getLogger(__name__)
+
+class ImportProgress:
+    """
+    A single progress message for a bulk import, edited in place at a throttled interval
+    instead of sending one message per queued song.
+
+    Attributes:
+    ----------
+    name : str
+        The name of the album or playlist being imported.
+
+    total : int
+        The number of tracks in the import, or None while it is unknown.
+
+    resolved : int
+        The number of tracks queued so far.
+
+    failed : int
+        The number of tracks skipped because they could not be found on YouTube or the queue was full.
+
+    api_calls : int
+        The number of Discord API calls made for this import.
+
+    complete : bool
+        False if the import stopped before every track was read, see finish.
+    """
+    def __init__(self, announcer, ctx):
+        """
+        Initialize the progress tracker. The message is sent by start.
+
+        Parameters:
+        ----------
+        announcer : QueueAnnouncer
+            The announcer that owns this import.
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+        """
+        self.announcer = announcer
+        self.ctx = ctx
+        self.name = None
+        self.total = None
+        self.resolved = 0
+        self.failed = 0
+        self.api_calls = 0
+        self.done = False
+        self.complete = True
+        self.message = None
+        self._last_edit = 0.0
+        self._task = None
+
+    def embed(self):
+        """
+        Render the progress embed.
+
+        Returns:
+        -------
+        discord.Embed
+            The embed.
+        """
+        if not self.done:
+            title = "Importing from Spotify"
+        elif self.complete:
+            title = "Imported from Spotify"
+        else:
+            title = "Import from Spotify stopped early"
+        embed = discord.Embed(title=title, description=self.name, colour=discord.Colour.blue())
+        embed.add_field(name='Queued', value=str(self.resolved), inline=True)
+        embed.add_field(name='Skipped', value=str(self.failed), inline=True)
+        embed.add_field(name='Total', value=str(self.total) if self.total is not None else '?', inline=True)
+        return embed
+
+    async def start(self):
+        """
+        Send the progress message.
+        """
+        self.message = await self.ctx.send(embed=self.embed())
+        self.api_calls += 1
+        self._last_edit = asyncio.get_running_loop().time()
+
+    def update(self, resolved=0, failed=0):
+        """
+        Count tracks as queued or failed and schedule an edit of the progress message.
+
+        Parameters:
+        ----------
+        resolved : int
+            The number of newly queued tracks.
+        failed : int
+            The number of tracks that newly failed.
+        """
+        self.resolved += resolved
+        self.failed += failed
+        if self._task is None and not self.done:
+            self._task = asyncio.create_task(self._edit_later())
+
+    async def _edit_later(self):
+        delay = self.announcer.edit_interval - (asyncio.get_running_loop().time() - self._last_edit)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        self._task = None
+        await self._edit()
+
+    async def _edit(self):
+        if self.message is None:
+            return
+
+        try:
+            await self.message.edit(embed=self.embed())
+            self.api_calls += 1
+        except discord.HTTPException:
+            log.warning("Could not update import progress", exc_info=True)
+
+        self._last_edit = asyncio.get_running_loop().time()
+
+    async def finish(self, complete=True):
+        """
+        Show the final counts and record how many Discord API calls the import avoided.
+
+        Parameters:
+        ----------
+        complete : bool
+            False if the import stopped before every track was read, e.g. because Spotify
+            failed to return a page.
+        """
+        self.done = True
+        self.complete = complete
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        await self._edit()
+
+        # Without coalescing every queued song would have been its own message
+        avoided = max(0, self.resolved - self.api_calls)
+        self.announcer.calls_avoided += avoided
+        log.info("Imported %d tracks (%d skipped) with %d Discord API calls, avoiding %d",
+                 self.resolved, self.failed, self.api_calls, avoided)
+
+class QueueAnnouncer:
+    """
+    Coalesces "Added to queue" messages so enqueues do not run into Discord's per-channel
+    rate limit. Bulk imports get a single progress message, and single enqueues that
+    arrive in quick succession are announced together.
+
+    Attributes:
+    ----------
+    window : float
+        The number of seconds rapid single enqueues are collected into one message.
+        Configured with the ANNOUNCE_WINDOW environment variable.
+
+    edit_interval : float
+        The minimum number of seconds between edits of an import progress message.
+        Configured with the ANNOUNCE_EDIT_INTERVAL environment variable.
+
+    calls_avoided : int
+        The number of Discord API calls avoided by coalescing.
+    """
+    def __init__(self, window=None, edit_interval=None):
+        """
+        Initialize the announcer.
+
+        Parameters:
+        ----------
+        window : float, optional
+            Overrides ANNOUNCE_WINDOW.
+        edit_interval : float, optional
+            Overrides ANNOUNCE_EDIT_INTERVAL.
+        """
+        self.window = window or float(os.environ.get('ANNOUNCE_WINDOW', 1.5))
+        self.edit_interval = edit_interval or float(os.environ.get('ANNOUNCE_EDIT_INTERVAL', 2))
+        self.calls_avoided = 0
+
+        # channel ID -> songs waiting to be announced
+        self._pending = {}
+        # channel ID -> task announcing them once the window closes
+        self._flushes = {}
+        # channel ID -> loop time of the last announcement, while its window is open
+        self._last_sent = {}
+
+    def start_import(self, ctx):
+        """
+        Create the progress tracker for a bulk import. Its message is sent by ImportProgress.start.
+
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+
+        Returns:
+        -------
+        ImportProgress
+            The progress tracker.
+        """
+        return ImportProgress(self, ctx)
+
+    async def announce(self, ctx, song):
+        """
+        Announce a queued song. The first song in a quiet channel is announced right away;
+        songs queued within the window after that are announced together once it closes.
+
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+        song : Track
+            The queued song.
+        """
+        channel_id = ctx.channel.id
+        now = asyncio.get_running_loop().time()
+
+        pending = self._pending.get(channel_id)
+        if pending is not None:
+            pending.append(song)
+            self.calls_avoided += 1
+            return
+
+        if now - self._last_sent.get(channel_id, float('-inf')) >= self.window:
+            self._mark_sent(channel_id)
+            await self._send(ctx, [song])
+            return
+
+        self._pending[channel_id] = [song]
+        self._flushes[channel_id] = asyncio.create_task(
+            self._flush_later(ctx, channel_id, self._last_sent[channel_id] + self.window - now))
+
+    async def _flush_later(self, ctx, channel_id, delay):
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self._flushes.pop(channel_id, None)
+            songs = self._pending.pop(channel_id, None)
+        self._mark_sent(channel_id)
+        await self._send(ctx, songs)
+
+    def _mark_sent(self, channel_id):
+        loop = asyncio.get_running_loop()
+        now = self._last_sent[channel_id] = loop.time()
+        # Forget the channel once its window has passed, unless it announced again since
+        loop.call_later(self.window, self._forget, channel_id, now)
+
+    def _forget(self, channel_id, sent_at):
+        if self._last_sent.get(channel_id) == sent_at:
+            del self._last_sent[channel_id]
+
+    def close(self):
+        """
+        Cancel the announcements waiting for their window to close.
+        """
+        for task in self._flushes.values():
+            task.cancel()
+        self._flushes.clear()
+        self._pending.clear()
+
+    async def _send(self, ctx, songs):
+        if len(songs) == 1:
+            embed = discord.Embed(title="Added to queue", colour=discord.Colour.blue())
+            embed.set_thumbnail(url=songs[0].thumbnail)
+            embed.add_field(name='', value=songs[0].title, inline=True)
+        else:
+            embed = discord.Embed(title=f"Added {len(songs)} songs to queue", colour=discord.Colour.blue())
+            embed.set_thumbnail(url=songs[0].thumbnail)
+            embed.description = '\n'.join(song.title for song in songs[:20])
+            if len(songs) > 20:
+                embed.description += f'\n...and {len(songs) - 20} more'
+
+        try:
+            await ctx.send(embed=embed)
+        except discord.HTTPException:
+            log.warning("Could not announce queued songs", exc_info=True)
+
+    def stats(self):
+        """
+        Return the coalescing counters.
+
+        Returns:
+        -------
+        dict
+            The number of Discord API calls avoided.
+        """
+        return {'calls_avoided': self.calls_avoided}
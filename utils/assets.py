@@ -0,0 +1,255 @@
+import io
+import os
+import time
+import logging
+import discord
+from urllib.parse import urlparse, parse_qs
+
+log = logging.getLogger(__name__)
+
+class AssetManager:
+    """
+    Loads the bot's static assets into memory once at startup and sends them without
+    touching the disk. When an asset channel is configured, each asset is uploaded there
+    once and later sends reuse its CDN URL in an embed instead of uploading the bytes again.
+
+    Attributes:
+    ----------
+    root : str
+        The directory assets are loaded from.
+
+    assets : dict
+        A dictionary mapping asset names relative to root, e.g. 'coinFlips/coinFlip2.gif', to their bytes.
+
+    upload_channel_id : int
+        The ID of the channel assets are uploaded to for reuse, or None to upload with every send.
+        Configured with the ASSET_CHANNEL_ID environment variable.
+
+    urls : dict
+        A dictionary mapping asset names to their (CDN URL, expires_at) pair.
+    """
+    # File signatures of the image formats Discord can show in an embed
+    SIGNATURES = (b'GIF87a', b'GIF89a', b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff')
+
+    def __init__(self, root='assets', upload_channel_id=None):
+        """
+        Initialize the manager and load the assets.
+
+        Parameters:
+        ----------
+        root : str
+            The directory to load assets from.
+        upload_channel_id : int, optional
+            Overrides ASSET_CHANNEL_ID.
+        """
+        self.root = root
+        self.assets = {}
+        self.urls = {}
+
+        channel_id = upload_channel_id or os.environ.get('ASSET_CHANNEL_ID')
+        self.upload_channel_id = int(channel_id) if channel_id else None
+
+        self.uploads = 0
+        self.bytes_uploaded = 0
+        self.reuses = 0
+        self.bytes_saved = 0
+        self.sends = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+        self.load()
+
+    def load(self):
+        """
+        Read every valid image under the root directory into memory. Files that are empty or
+        not a supported image are skipped with a warning.
+        """
+        self.assets.clear()
+        self.urls.clear()
+
+        for directory, _, files in os.walk(self.root):
+            for file_name in sorted(files):
+                path = os.path.join(directory, file_name)
+                with open(path, 'rb') as f:
+                    data = f.read()
+
+                if not data.startswith(self.SIGNATURES):
+                    log.warning("Skipping asset %s, it is not a supported image", path)
+                    continue
+
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                self.assets[name] = data
+
+        log.info("Loaded %d assets (%d bytes) from %s", len(self.assets), sum(map(len, self.assets.values())), self.root)
+
+    def group(self, directory):
+        """
+        List the assets in a directory.
+
+        Parameters:
+        ----------
+        directory : str
+            The directory relative to root, e.g. 'coinFlips'.
+
+        Returns:
+        -------
+        list
+            The asset names in the directory.
+        """
+        prefix = directory.rstrip('/') + '/'
+        return [name for name in self.assets if name.startswith(prefix)]
+
+    def cached_url(self, name):
+        """
+        Return the reusable CDN URL of an asset if it has one that has not expired.
+
+        Parameters:
+        ----------
+        name : str
+            The asset name.
+
+        Returns:
+        -------
+        str
+            The CDN URL, or None.
+        """
+        entry = self.urls.get(name)
+        if entry is None or (entry[1] is not None and entry[1] - 60 < time.time()):
+            return None
+        return entry[0]
+
+    @staticmethod
+    def url_expiry(url):
+        """
+        Read the expiry time Discord signs into attachment URLs.
+
+        Parameters:
+        ----------
+        url : str
+            The attachment URL.
+
+        Returns:
+        -------
+        float
+            The unix time the URL expires at, or None if it does not say.
+        """
+        expires = parse_qs(urlparse(url).query).get('ex')
+        try:
+            return float(int(expires[0], 16)) if expires else None
+        except ValueError:
+            return None
+
+    def file(self, name):
+        """
+        Build an upload for an asset from memory.
+
+        Parameters:
+        ----------
+        name : str
+            The asset name.
+
+        Returns:
+        -------
+        discord.File
+            The file to upload.
+        """
+        return discord.File(io.BytesIO(self.assets[name]), filename=name.rsplit('/', 1)[-1])
+
+    async def upload(self, bot, name):
+        """
+        Upload an asset to the asset channel and remember its CDN URL.
+
+        Parameters:
+        ----------
+        bot : commands.Bot
+            The bot instance.
+        name : str
+            The asset name.
+
+        Returns:
+        -------
+        str
+            The CDN URL, or None if there is no usable asset channel.
+        """
+        if self.upload_channel_id is None:
+            return None
+
+        channel = bot.get_channel(self.upload_channel_id)
+        if channel is None:
+            try:
+                channel = await bot.fetch_channel(self.upload_channel_id)
+            except discord.HTTPException:
+                log.warning("Asset channel %s is not available, uploading assets with every send", self.upload_channel_id)
+                self.upload_channel_id = None
+                return None
+
+        message = await channel.send(file=self.file(name))
+        self.uploads += 1
+        self.bytes_uploaded += len(self.assets[name])
+
+        url = message.attachments[0].url
+        self.urls[name] = (url, self.url_expiry(url))
+        return url
+
+    async def send(self, ctx, name, **kwargs):
+        """
+        Send an asset as an embedded image, reusing its uploaded CDN URL when possible.
+
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+        name : str
+            The asset name.
+        **kwargs
+            Extra arguments for ctx.send, e.g. delete_after.
+
+        Returns:
+        -------
+        discord.Message
+            The sent message.
+        """
+        start = time.perf_counter()
+
+        url = self.cached_url(name)
+        if url is not None:
+            self.reuses += 1
+            self.bytes_saved += len(self.assets[name])
+        else:
+            url = await self.upload(ctx.bot, name)
+
+        if url is not None:
+            embed = discord.Embed(colour=discord.Colour.blue())
+            embed.set_image(url=url)
+            message = await ctx.send(embed=embed, **kwargs)
+        else:
+            message = await ctx.send(file=self.file(name), **kwargs)
+            self.uploads += 1
+            self.bytes_uploaded += len(self.assets[name])
+
+        latency = time.perf_counter() - start
+        self.sends += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        log.debug("Sent asset %s in %.0fms (%s)", name, latency * 1000, self.stats())
+        return message
+
+    def stats(self):
+        """
+        Return the upload and latency counters.
+
+        Returns:
+        -------
+        dict
+            The number of loaded assets, uploads, bytes uploaded, URL reuses, bytes saved by
+            reuse, and the mean and max send latency in seconds.
+        """
+        return {
+            'assets': len(self.assets),
+            'uploads': self.uploads,
+            'bytes_uploaded': self.bytes_uploaded,
+            'reuses': self.reuses,
+            'bytes_saved': self.bytes_saved,
+            'mean_latency': self.total_latency / self.sends if self.sends else 0.0,
+            'max_latency': self.max_latency,
+        }
@@ -0,0 +1,318 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from utils.ttl_cache import TTLCache
+
+log = logging.getLogger(__name__)
+
+class AudioCache:
+    """
+    An optional on-disk cache of song audio stored as Ogg/Opus files keyed by YouTube video ID.
+    Songs are downloaded once they have been played a few times (or when prefetched, if
+    enabled) and are then played from disk. The least recently played files are deleted
+    once the cache grows past its byte budget.
+
+    The cache is disabled unless the AUDIO_CACHE_DIR environment variable is set. Several
+    processes can share the directory: each one downloads into temporary files named after
+    its process ID, and only leaves another process's temporary files alone until they are
+    clearly abandoned.
+
+    Attributes:
+    ----------
+    directory : str
+        The directory cached files are stored in, or None if the cache is disabled.
+
+    max_bytes : int
+        The byte budget of the cache. Configured with the AUDIO_CACHE_BYTES environment variable.
+
+    min_plays : int
+        The number of plays after which a song is cached. Configured with the AUDIO_CACHE_MIN_PLAYS environment variable.
+
+    on_prefetch : bool
+        Whether songs are cached as soon as they are prefetched. Configured with the AUDIO_CACHE_ON_PREFETCH environment variable.
+
+    entries : collections.OrderedDict
+        A dictionary mapping cached video IDs to their file size, from least to most recently played.
+
+    hits, misses, bytes_served, stores, evictions : int
+        Counters for cache lookups, bytes played from disk, files stored and files evicted.
+    """
+    # Unfinished downloads untouched for this many seconds were abandoned by a process that stopped
+    STALE_PART_SECONDS = 60 * 60
+
+    def __init__(self, directory=None, max_bytes=None, min_plays=None, on_prefetch=None):
+        """
+        Initialize the cache and index the files already on disk.
+
+        Parameters:
+        ----------
+        directory : str, optional
+            Overrides AUDIO_CACHE_DIR.
+        max_bytes : int, optional
+            Overrides AUDIO_CACHE_BYTES.
+        min_plays : int, optional
+            Overrides AUDIO_CACHE_MIN_PLAYS.
+        on_prefetch : bool, optional
+            Overrides AUDIO_CACHE_ON_PREFETCH.
+        """
+        self.directory = directory or os.environ.get('AUDIO_CACHE_DIR') or None
+        self.max_bytes = max_bytes or int(os.environ.get('AUDIO_CACHE_BYTES', 2 * 1024 ** 3))
+        self.min_plays = min_plays or int(os.environ.get('AUDIO_CACHE_MIN_PLAYS', 2))
+        if on_prefetch is None:
+            on_prefetch = os.environ.get('AUDIO_CACHE_ON_PREFETCH', '').lower() in ('1', 'true', 'yes')
+        self.on_prefetch = on_prefetch
+
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.play_counts = TTLCache(max_entries=10000, ttl=7 * 24 * 60 * 60)
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self.stores = 0
+        self.evictions = 0
+
+        # video ID -> task downloading it
+        self._storing = {}
+        # Downloads are limited to one at a time so they don't compete with playback
+        self._semaphore = None
+
+        if self.directory:
+            self.load()
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def path(self, video_id):
+        """
+        Return the file path for a video ID.
+
+        Parameters:
+        ----------
+        video_id : str
+            The YouTube video ID.
+
+        Returns:
+        -------
+        str
+            The path of the cached file.
+        """
+        return os.path.join(self.directory, f'{video_id}.opus')
+
+    def load(self):
+        """
+        Index the cached files on disk, oldest first, and clean up abandoned downloads.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        files = []
+        stale = time.time() - self.STALE_PART_SECONDS
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.part'):
+                # Downloads of other processes sharing the directory are still being written to
+                try:
+                    if entry.stat().st_mtime < stale:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+            elif entry.name.endswith('.opus'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-len('.opus')], stat.st_size))
+
+        for _, video_id, size in sorted(files):
+            self.entries[video_id] = size
+            self.total_bytes += size
+
+        self.evict()
+        log.info("Indexed %d cached songs (%d bytes) in %s", len(self.entries), self.total_bytes, self.directory)
+
+    def lookup(self, video_id):
+        """
+        Find the cached file for a song and mark it as recently played.
+
+        Parameters:
+        ----------
+        video_id : str
+            The YouTube video ID.
+
+        Returns:
+        -------
+        str
+            The path of the cached file, or None if the song is not cached.
+        """
+        if not self.enabled:
+            return None
+
+        size = self.entries.get(video_id)
+        if size is None:
+            self.misses += 1
+            return None
+
+        path = self.path(video_id)
+        try:
+            # The modification time keeps the LRU order across restarts
+            os.utime(path)
+        except FileNotFoundError:
+            self.discard(video_id)
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(video_id)
+        self.hits += 1
+        self.bytes_served += size
+        return path
+
+    def record_play(self, video_id, stream_url, opus=False):
+        """
+        Count a streamed play of a song and start caching it once it has been played enough times.
+
+        Parameters:
+        ----------
+        video_id : str
+            The YouTube video ID.
+        stream_url : str
+            The stream URL to download the audio from.
+        opus : bool
+            Whether the stream is Opus at 48 kHz, see store.
+        """
+        if not self.enabled:
+            return
+
+        plays = self.play_counts.get(video_id, 0) + 1
+        self.play_counts.put(video_id, plays)
+        if plays >= self.min_plays:
+            self.schedule_store(video_id, stream_url, opus)
+
+    def schedule_store(self, video_id, stream_url, opus=False):
+        """
+        Download a song into the cache in the background if it is not cached yet.
+
+        Parameters:
+        ----------
+        video_id : str
+            The YouTube video ID.
+        stream_url : str
+            The stream URL to download the audio from.
+        opus : bool
+            Whether the stream is Opus at 48 kHz, see store.
+        """
+        if not self.enabled or video_id in self.entries or video_id in self._storing:
+            return
+
+        task = asyncio.create_task(self.store(video_id, stream_url, opus))
+        self._storing[video_id] = task
+        task.add_done_callback(lambda t: self._storing.pop(video_id, None))
+
+    def storing(self, video_id):
+        """
+        Return the task downloading a song into the cache.
+
+        Parameters:
+        ----------
+        video_id : str
+            The YouTube video ID.
+
+        Returns:
+        -------
+        asyncio.Task
+            The download, or None if the song is not being downloaded.
+        """
+        return self._storing.get(video_id)
+
+    async def store(self, video_id, stream_url, opus=False):
+        """
+        Download a song's audio as Ogg/Opus into the cache. Opus streams are copied into
+        the Ogg file as they are, other streams are encoded with libopus.
+
+        Parameters:
+        ----------
+        video_id : str
+            The YouTube video ID.
+        stream_url : str
+            The stream URL to download the audio from.
+        opus : bool
+            Whether the stream is Opus at 48 kHz.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(1)
+
+        path = self.path(video_id)
+        partial = f'{path}.{os.getpid()}.part'
+        codec = ['-c:a', 'copy'] if opus else ['-c:a', 'libopus', '-b:a', '128k']
+
+        async with self._semaphore:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    'ffmpeg', '-nostdin', '-loglevel', 'error',
+                    '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+                    '-i', stream_url, '-vn', *codec, '-f', 'ogg', partial,
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+                )
+            except OSError:
+                log.warning("Could not start ffmpeg to cache audio for %s", video_id, exc_info=True)
+                return
+            _, stderr = await process.communicate()
+
+        if process.returncode != 0:
+            log.warning("Could not cache audio for %s: %s", video_id, stderr.decode(errors='replace').strip())
+            if os.path.exists(partial):
+                os.remove(partial)
+            return
+
+        os.replace(partial, path)
+        size = os.path.getsize(path)
+        self.entries[video_id] = size
+        self.total_bytes += size
+        self.stores += 1
+        self.evict()
+
+    def discard(self, video_id):
+        """
+        Remove a song from the cache, e.g. because its file failed to play.
+
+        Parameters:
+        ----------
+        video_id : str
+            The YouTube video ID.
+        """
+        size = self.entries.pop(video_id, None)
+        if size is None:
+            return
+
+        self.total_bytes -= size
+        try:
+            os.remove(self.path(video_id))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """
+        Delete the least recently played files until the cache fits its byte budget.
+        """
+        while self.total_bytes > self.max_bytes and self.entries:
+            video_id = next(iter(self.entries))
+            self.discard(video_id)
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+        -------
+        dict
+            The number of cached songs, bytes on disk, hit ratio, bytes served from disk,
+            files stored and files evicted.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'bytes_served': self.bytes_served,
+            'stores': self.stores,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,451 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from utils.track import Track
+
+log = logging.getLogger(__name__)
+
+class GuildState:
+    """
+    The queue, autoqueue toggle and current song of a guild, as replayed from the journal.
+
+    Attributes:
+    ----------
+    queue : collections.deque
+        The queued songs as Track.record tuples, in order.
+
+    autoqueue : bool
+        Whether autoqueue was enabled.
+
+    playing : list
+        The song that was playing as [record, started, text channel ID, voice channel ID,
+        paused at], where started is the unix time playback would have started at from the
+        beginning, and paused at the unix time the song was paused, or None if it was
+        playing. None if nothing was playing.
+    """
+    __slots__ = ('queue', 'autoqueue', 'playing')
+
+    def __init__(self):
+        self.queue = deque()
+        self.autoqueue = False
+        self.playing = None
+
+    def apply(self, change, args):
+        """
+        Apply a journaled change.
+
+        Raises:
+        ------
+        IndexError
+            If the change does not fit the queue, e.g. because part of the journal was lost.
+        """
+        if change == 'append':
+            self.queue.append(args[0])
+        elif change == 'appendleft':
+            self.queue.appendleft(args[0])
+        elif change == 'popleft':
+            self.queue.popleft()
+        elif change == 'remove':
+            del self.queue[args[0]]
+        elif change == 'insert':
+            self.queue.insert(args[0], args[1])
+        elif change == 'replace':
+            self.queue = deque(args[0])
+        elif change == 'clear':
+            self.queue.clear()
+        elif change == 'autoqueue':
+            self.autoqueue = args[0]
+        elif change == 'playing':
+            self.playing = args if args[0] is not None else None
+
+    def __bool__(self):
+        return bool(self.queue) or self.autoqueue or self.playing is not None
+
+class QueueJournal:
+    """
+    An append-only journal of every guild's queue, autoqueue toggle and current song, so
+    queues survive restarts without searching for their songs again.
+
+    Every change to a queue is written as one JSON line. Changes are handed to a background
+    thread that encodes and writes them, so journaling costs the event loop a tuple and a
+    queue put per change. Once enough changes have been written, the journal is compacted
+    into a snapshot of the current queues, written to a new file that replaces the old one.
+
+    While a song plays, the writer touches the file every few seconds, so after a crash
+    its modification time tells how far the song got.
+
+    The journal is disabled if the QUEUE_JOURNAL_PATH environment variable is set to an
+    empty value.
+
+    Attributes:
+    ----------
+    path : str
+        The journal file, or None if the journal is disabled.
+        Configured with the QUEUE_JOURNAL_PATH environment variable.
+
+    compact_after : int
+        The number of changes written before the journal is compacted.
+        Configured with the QUEUE_JOURNAL_COMPACT environment variable.
+
+    heartbeat : float
+        The number of seconds between touches of the file while songs are playing.
+
+    playing : dict
+        Maps guild IDs to the arguments of their last 'playing' record, for compaction.
+
+    records, bytes, compactions : int
+        The changes and bytes written since the last compaction, and the number of compactions.
+
+    write_seconds, restore_seconds : float
+        The time the writer spent writing, and the time the last load took.
+    """
+    def __init__(self, path=None, compact_after=None, heartbeat=10):
+        """
+        Initialize the journal. Nothing is written until start is called.
+
+        Parameters:
+        ----------
+        path : str, optional
+            Overrides QUEUE_JOURNAL_PATH.
+        compact_after : int, optional
+            Overrides QUEUE_JOURNAL_COMPACT.
+        heartbeat : float
+            The number of seconds between touches of the file while songs are playing.
+        """
+        self.path = (path or os.environ.get('QUEUE_JOURNAL_PATH', 'data/queue.journal')) or None
+        self.compact_after = compact_after or int(os.environ.get('QUEUE_JOURNAL_COMPACT', 10000))
+        self.heartbeat = heartbeat
+
+        self.playing = {}
+
+        self.records = 0
+        self.bytes = 0
+        self.compactions = 0
+        self.write_seconds = 0.0
+        self.restore_seconds = 0.0
+
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._file = None
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def load(self):
+        """
+        Replay the journal. A line cut off by a crash ends the replay.
+
+        Returns:
+        -------
+        tuple
+            A dict mapping guild IDs to their GuildState, and the unix time the journal was
+            last written or touched, or None if there is no journal.
+        """
+        if not self.enabled or not os.path.exists(self.path):
+            return {}, None
+
+        started = time.perf_counter()
+        states = {}
+        with open(self.path, encoding='utf-8') as file:
+            for number, line in enumerate(file, 1):
+                try:
+                    change, guild_id, *args = json.loads(line)
+                except (ValueError, TypeError):
+                    log.warning("Ignoring the rest of %s from line %d", self.path, number)
+                    break
+
+                if change == 'forget':
+                    states.pop(guild_id, None)
+                    continue
+
+                state = states.get(guild_id)
+                if state is None:
+                    state = states[guild_id] = GuildState()
+                try:
+                    state.apply(change, args)
+                except IndexError:
+                    log.warning("Skipping a '%s' that does not fit the queue of guild %s", change, guild_id)
+
+        last_seen = os.path.getmtime(self.path)
+        self.restore_seconds = time.perf_counter() - started
+        return {guild_id: state for guild_id, state in states.items() if state}, last_seen
+
+    def start(self):
+        """
+        Start writing changes in the background.
+        """
+        if not self.enabled or self._thread is not None:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self.bytes = self._file.tell()
+        self._thread = threading.Thread(target=self._run, name='queue-journal', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """
+        Write the remaining changes and stop the writer. Later changes are not journaled.
+        """
+        if self._thread is None:
+            return
+
+        self._queue.put(('stop', None))
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def _put(self, record):
+        if self._thread is not None:
+            self._queue.put(('record', record))
+
+    def listener(self, guild_id):
+        """
+        Create the listener that journals a guild's queue, see TrackQueue.listener.
+
+        Parameters:
+        ----------
+        guild_id : int
+            The ID of the guild.
+
+        Returns:
+        -------
+        callable
+            The listener.
+        """
+        def record(change, *args):
+            self._put((change, guild_id, *map(self._encode, args)))
+        return record
+
+    @staticmethod
+    def _encode(value):
+        if isinstance(value, Track):
+            return value.record()
+        if isinstance(value, list):
+            return [track.record() for track in value]
+        return value
+
+    def set_autoqueue(self, guild_id, enabled):
+        """
+        Journal a guild's autoqueue toggle.
+        """
+        self._put(('autoqueue', guild_id, enabled))
+
+    def set_playing(self, guild_id, song, text_channel_id=None, voice_channel_id=None):
+        """
+        Journal the song a guild started playing.
+
+        Parameters:
+        ----------
+        guild_id : int
+            The ID of the guild.
+        song : Track
+            The song, or None if the guild stopped playing.
+        text_channel_id : int, optional
+            The channel the music commands were used in.
+        voice_channel_id : int, optional
+            The voice channel the song plays in.
+        """
+        if song is None:
+            if self.playing.pop(guild_id, None) is not None:
+                self._put(('playing', guild_id, None))
+            return
+
+        args = (song.record(), time.time() - song.start, text_channel_id, voice_channel_id, None)
+        self.playing[guild_id] = args
+        self._put(('playing', guild_id, *args))
+
+    def set_paused(self, guild_id, paused):
+        """
+        Journal that a guild's song was paused or resumed, so the time spent paused does not
+        count towards the position it resumes at after a restart.
+
+        Parameters:
+        ----------
+        guild_id : int
+            The ID of the guild.
+        paused : bool
+            True if the song was paused, False if it was resumed.
+        """
+        if guild_id not in self.playing:
+            return
+
+        record, started, text_channel_id, voice_channel_id, paused_at = self.playing[guild_id]
+        now = time.time()
+        if paused and paused_at is None:
+            paused_at = now
+        elif not paused and paused_at is not None:
+            # Move the start forward by the time spent paused
+            started, paused_at = started + now - paused_at, None
+        else:
+            return
+
+        args = (record, started, text_channel_id, voice_channel_id, paused_at)
+        self.playing[guild_id] = args
+        self._put(('playing', guild_id, *args))
+
+    def forget(self, guild_id):
+        """
+        Journal that a guild's state was dropped.
+        """
+        self.playing.pop(guild_id, None)
+        self._put(('forget', guild_id))
+
+    def needs_compaction(self):
+        """
+        Check whether enough changes have been written to compact the journal.
+        """
+        return self._thread is not None and self.records >= self.compact_after
+
+    def compact(self, players):
+        """
+        Replace the journal with a snapshot of the current queues. The snapshot is taken
+        here and written by the writer, after the changes made before it.
+
+        Parameters:
+        ----------
+        players : dict
+            Maps guild IDs to their GuildPlayer.
+        """
+        if self._thread is None:
+            return
+
+        records = []
+        for guild_id, player in players.items():
+            if len(player.song_queue):
+                records.append(('replace', guild_id, [track.record() for track in player.song_queue]))
+            if player.toggle_autoqueue:
+                records.append(('autoqueue', guild_id, True))
+            if guild_id in self.playing:
+                records.append(('playing', guild_id, *self.playing[guild_id]))
+        self._queue.put(('compact', records))
+
+    def _run(self):
+        playing = set(self.playing)
+        while True:
+            try:
+                kind, payload = self._queue.get(timeout=self.heartbeat)
+            except queue.Empty:
+                if playing:
+                    self._touch()
+                continue
+
+            batch = [(kind, payload)]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            for kind, payload in batch:
+                if kind == 'record':
+                    if payload[0] == 'playing':
+                        (playing.add if payload[2] is not None else playing.discard)(payload[1])
+                    elif payload[0] == 'forget':
+                        playing.discard(payload[1])
+                    lines.append(payload)
+                elif kind == 'compact':
+                    self._write(lines)
+                    lines = []
+                    self._rewrite(payload)
+                    playing = {record[1] for record in payload if record[0] == 'playing'}
+                elif kind == 'stop':
+                    self._write(lines)
+                    self._file.close()
+                    return
+            self._write(lines)
+
+    def _write(self, records):
+        if not records:
+            return
+
+        started = time.perf_counter()
+        data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records)
+        try:
+            self._file.write(data)
+            self._file.flush()
+        except OSError:
+            log.warning("Could not write to the queue journal", exc_info=True)
+            return
+        self.records += len(records)
+        self.bytes += len(data)
+        self.write_seconds += time.perf_counter() - started
+
+    def _rewrite(self, records):
+        started = time.perf_counter()
+        partial = self.path + '.tmp'
+        data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records)
+        try:
+            with open(partial, 'w', encoding='utf-8') as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(partial, self.path)
+        except OSError:
+            log.warning("Could not compact the queue journal", exc_info=True)
+            return
+
+        self._file.close()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self.records = 0
+        self.bytes = len(data)
+        self.compactions += 1
+        self.write_seconds += time.perf_counter() - started
+
+    def _touch(self):
+        try:
+            os.utime(self.path)
+        except OSError:
+            pass
+
+    def stats(self):
+        """
+        Return the journal counters.
+
+        Returns:
+        -------
+        dict
+            The changes and bytes written since the last compaction, the number of
+            compactions, the time spent writing and the time the last restore took.
+        """
+        return {
+            'records': self.records,
+            'bytes': self.bytes,
+            'compactions': self.compactions,
+            'write_seconds': self.write_seconds,
+            'restore_seconds': self.restore_seconds,
+        }
+
+class ResumeContext:
+    """
+    Stands in for a command context when playback is resumed after a restart, since no
+    command was used.
+
+    Attributes:
+    ----------
+    guild : discord.Guild
+        The guild playback is resumed in.
+
+    channel : discord.TextChannel
+        The channel the music commands were last used in.
+    """
+    def __init__(self, guild, channel):
+        self.guild = guild
+        self.channel = channel
+        self.author = guild.me
+        self.message = None
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
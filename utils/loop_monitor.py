@@ -0,0 +1,101 @@
+import asyncio
+
+class LoopLagMonitor:
+    """
+    Samples how late the event loop wakes up from a fixed-interval sleep. Any time the loop
+    spends running blocking code shows up as lag, which makes this a cheap way to see if
+    the gateway is being starved.
+
+    Attributes:
+    ----------
+    interval : float
+        The number of seconds between samples.
+
+    samples : int
+        The number of samples taken so far.
+
+    total_lag : float
+        The sum of all sampled lag in seconds.
+
+    max_lag : float
+        The worst lag seen in seconds.
+
+    last_lag : float
+        The most recent lag sample in seconds.
+
+    on_sample : callable
+        Called with every lag sample, or None.
+    """
+    def __init__(self, interval=0.05, on_sample=None):
+        """
+        Initialize the monitor.
+
+        Parameters:
+        ----------
+        interval : float
+            The number of seconds between samples.
+        on_sample : callable, optional
+            Called with every lag sample in seconds, e.g. to record it in a histogram.
+        """
+        self.interval = interval
+        self.on_sample = on_sample
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self._task = None
+
+    def start(self):
+        """
+        Start sampling on the running event loop.
+        """
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        """
+        Stop sampling.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def reset(self):
+        """
+        Clear all collected samples.
+        """
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+
+            self.samples += 1
+            self.total_lag += lag
+            self.last_lag = lag
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if self.on_sample is not None:
+                self.on_sample(lag)
+
+    def stats(self):
+        """
+        Return a summary of the collected samples.
+
+        Returns:
+        -------
+        dict
+            The sample count along with the mean, max and last lag in seconds.
+        """
+        return {
+            'samples': self.samples,
+            'mean_lag': self.total_lag / self.samples if self.samples else 0.0,
+            'max_lag': self.max_lag,
+            'last_lag': self.last_lag,
+        }
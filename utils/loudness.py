@@ -0,0 +1,316 @@
+import os
+import re
+import json
+import time
+import shutil
+import sqlite3
+import asyncio
+import logging
+
+log = logging.getLogger(__name__)
+
+class LoudnessStore:
+    """
+    Measures the loudness of each song once and remembers it, so songs can be played at a
+    consistent volume without analysing them on every play.
+
+    Songs are analysed in the background with ffmpeg's loudnorm filter, after their first
+    play or while they are prefetched. The integrated loudness (LUFS) and true peak (dBTP)
+    are stored in a SQLite file and mirrored in memory, and playback turns them into a
+    single volume filter, see gain.
+
+    Attributes:
+    ----------
+    path : str
+        The path of the SQLite database file. Configured with the LOUDNESS_PATH environment variable.
+
+    enabled : bool
+        Whether songs are analysed and their volume adjusted. Configured with the
+        LOUDNESS_NORMALIZE environment variable.
+
+    target : float
+        The loudness songs are adjusted to, in LUFS. Configured with the LOUDNESS_TARGET environment variable.
+
+    max_boost : float
+        The most a quiet song is boosted by, in dB.
+
+    min_gain : float
+        Adjustments smaller than this many dB are skipped, so the song can still be passed
+        through without decoding it. A song with a gain is transcoded, which costs about 70
+        times the CPU of passing it through (see the README), so only clearly audible
+        differences are corrected. Configured with the LOUDNESS_MIN_GAIN environment variable.
+
+    max_seconds : float
+        The number of seconds of each song that are analysed.
+
+    workers : int
+        The number of analyses run at the same time. Configured with the LOUDNESS_WORKERS environment variable.
+
+    max_pending : int
+        The maximum number of analyses waiting for a worker. Songs beyond that are analysed
+        the next time they are played.
+
+    entries : dict
+        Maps video IDs to their (integrated loudness, true peak) pair.
+
+    lookups, hits, lookup_seconds, analyses, failures, skipped : int
+        Counters for gain lookups, lookups of analysed songs, the time spent looking up,
+        finished and failed analyses and analyses skipped because too many were pending.
+    """
+    # Keep this much headroom below 0 dBTP after boosting
+    PEAK_CEILING = -1.0
+
+    def __init__(self, path=None, target=None, workers=None, max_boost=10.0, min_gain=None, max_seconds=600, max_pending=50):
+        """
+        Open the loudness database and load it into memory.
+
+        Parameters:
+        ----------
+        path : str, optional
+            Overrides LOUDNESS_PATH.
+        target : float, optional
+            Overrides LOUDNESS_TARGET.
+        workers : int, optional
+            Overrides LOUDNESS_WORKERS.
+        max_boost : float
+            The most a quiet song is boosted by, in dB.
+        min_gain : float, optional
+            Overrides LOUDNESS_MIN_GAIN.
+        max_seconds : float
+            The number of seconds of each song that are analysed.
+        max_pending : int
+            The maximum number of analyses waiting for a worker.
+        """
+        self.path = path or os.environ.get('LOUDNESS_PATH', 'data/loudness.db')
+        self.enabled = os.environ.get('LOUDNESS_NORMALIZE', 'true').lower() not in ('0', 'false', 'no')
+        self.target = target or float(os.environ.get('LOUDNESS_TARGET', -14))
+        self.workers = workers or int(os.environ.get('LOUDNESS_WORKERS', 1))
+        self.max_boost = max_boost
+        self.min_gain = min_gain if min_gain is not None else float(os.environ.get('LOUDNESS_MIN_GAIN', 3))
+        self.max_seconds = max_seconds
+        self.max_pending = max_pending
+
+        self.entries = {}
+
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_seconds = 0.0
+        self.analyses = 0
+        self.failures = 0
+        self.skipped = 0
+
+        # video ID -> task analysing it
+        self._pending = {}
+        # Run ffmpeg at a lower CPU priority where nice exists
+        self._nice = ['nice', '-n', '10'] if shutil.which('nice') else []
+        # Created on first use so it belongs to the running loop
+        self._semaphore = None
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS loudness (
+                video_id TEXT PRIMARY KEY,
+                integrated REAL NOT NULL,
+                true_peak REAL NOT NULL,
+                analyzed_at REAL NOT NULL
+            )
+        ''')
+        self.db.commit()
+
+        self.load()
+
+    def load(self):
+        """
+        Load every measurement into memory.
+        """
+        rows = self.db.execute('SELECT video_id, integrated, true_peak FROM loudness').fetchall()
+        self.entries = {video_id: (integrated, true_peak) for video_id, integrated, true_peak in rows}
+        log.info("Loaded loudness of %d songs from %s", len(self.entries), self.path)
+
+    def gain(self, video_id):
+        """
+        Find the volume adjustment for a song.
+
+        Songs are adjusted towards the target loudness, but boosted by at most max_boost and
+        never so much that their peaks would clip. Loud songs are always turned down.
+
+        Parameters:
+        ----------
+        video_id : str
+            The YouTube video ID.
+
+        Returns:
+        -------
+        float
+            The adjustment in dB, or None if the song has not been analysed or needs no adjustment.
+        """
+        if not self.enabled:
+            return None
+
+        started = time.perf_counter()
+        entry = self.entries.get(video_id)
+        gain = None
+        if entry is not None:
+            integrated, true_peak = entry
+            gain = self.target - integrated
+            if gain > 0:
+                # Boosting is limited by the peak headroom, but a lack of headroom never
+                # turns a boost into a cut
+                gain = max(0.0, min(gain, self.max_boost, self.PEAK_CEILING - true_peak))
+            if abs(gain) < self.min_gain:
+                gain = None
+
+        self.lookups += 1
+        self.hits += entry is not None
+        self.lookup_seconds += time.perf_counter() - started
+        return gain
+
+    def schedule(self, video_id, source):
+        """
+        Analyse a song in the background if it has not been analysed yet.
+
+        Parameters:
+        ----------
+        video_id : str
+            The YouTube video ID.
+        source : str
+            The stream URL or local file to analyse.
+        """
+        if not self.enabled or not source or video_id in self.entries or video_id in self._pending:
+            return
+        if len(self._pending) >= self.max_pending:
+            self.skipped += 1
+            return
+
+        task = asyncio.create_task(self.analyze(video_id, source))
+        self._pending[video_id] = task
+        task.add_done_callback(lambda t: self._pending.pop(video_id, None))
+
+    async def analyze(self, video_id, source):
+        """
+        Measure a song's loudness with ffmpeg and store it.
+
+        ffmpeg runs on a single thread at a lower CPU priority, and at most `workers`
+        analyses run at once, so analysis does not take CPU away from playback.
+
+        Parameters:
+        ----------
+        video_id : str
+            The YouTube video ID.
+        source : str
+            The stream URL or local file to analyse.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+
+        arguments = [*self._nice, 'ffmpeg', '-nostdin', '-hide_banner', '-threads', '1']
+        if '://' in source:
+            arguments += ['-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5']
+        arguments += ['-t', str(self.max_seconds), '-i', source, '-vn',
+                      '-af', 'loudnorm=print_format=json', '-f', 'null', '-']
+
+        async with self._semaphore:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *arguments, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+            except OSError:
+                log.warning("Could not start ffmpeg to analyse the loudness of %s", video_id, exc_info=True)
+                self.failures += 1
+                return
+            try:
+                _, stderr = await process.communicate()
+            except asyncio.CancelledError:
+                process.kill()
+                raise
+
+        measurement = self.parse(stderr.decode(errors='replace'))
+        if process.returncode != 0 or measurement is None:
+            log.warning("Could not analyse the loudness of %s", video_id)
+            self.failures += 1
+            return
+
+        self.put(video_id, *measurement)
+        self.analyses += 1
+
+    @staticmethod
+    def parse(output):
+        """
+        Read the measurement from the JSON loudnorm prints at the end of ffmpeg's output.
+
+        Parameters:
+        ----------
+        output : str
+            ffmpeg's standard error.
+
+        Returns:
+        -------
+        tuple
+            The (integrated loudness, true peak) pair, or None if it could not be read or the
+            song is silent.
+        """
+        match = re.search(r'\{[^{}]*"input_i"[^{}]*\}', output)
+        if match is None:
+            return None
+        try:
+            report = json.loads(match.group(0))
+            integrated, true_peak = float(report['input_i']), float(report['input_tp'])
+        except (ValueError, KeyError):
+            return None
+
+        # Silence measures as -inf
+        if integrated != integrated or integrated in (float('inf'), float('-inf')):
+            return None
+        return integrated, true_peak
+
+    def put(self, video_id, integrated, true_peak):
+        """
+        Store a song's measurement.
+
+        Parameters:
+        ----------
+        video_id : str
+            The YouTube video ID.
+        integrated : float
+            The integrated loudness in LUFS.
+        true_peak : float
+            The true peak in dBTP.
+        """
+        self.entries[video_id] = (integrated, true_peak)
+        self.db.execute('INSERT OR REPLACE INTO loudness VALUES (?, ?, ?, ?)',
+                        (video_id, integrated, true_peak, time.time()))
+        self.db.commit()
+
+    def stats(self):
+        """
+        Return the store counters.
+
+        Returns:
+        -------
+        dict
+            The number of analysed songs, the share of lookups that found a measurement,
+            the mean lookup time in microseconds, pending, finished, failed and skipped analyses.
+        """
+        return {
+            'entries': len(self.entries),
+            'coverage': self.hits / self.lookups if self.lookups else 0.0,
+            'lookup_us': self.lookup_seconds / self.lookups * 1e6 if self.lookups else 0.0,
+            'pending': len(self._pending),
+            'analyses': self.analyses,
+            'failures': self.failures,
+            'skipped': self.skipped,
+        }
+
+    def close(self):
+        """
+        Stop the analyses in progress and close the database connection.
+        """
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
+        self.db.close()
@@ -0,0 +1,287 @@
+import os
+import re
+import time
+import bisect
+import logging
+from contextlib import contextmanager
+from aiohttp import web
+
+log = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from a fast cache hit to a slow playlist import
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Histogram:
+    """
+    A fixed-bucket histogram of observed values, in the format Prometheus expects.
+
+    Attributes:
+    ----------
+    buckets : tuple
+        The upper bound of each bucket, in increasing order.
+
+    counts : list
+        The number of observations per bucket, with one extra bucket for values above the last bound.
+
+    total : float
+        The sum of all observed values.
+
+    count : int
+        The number of observations.
+    """
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Record a value.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in.
+
+        Parameters:
+        ----------
+        q : float
+            The quantile, between 0 and 1.
+
+        Returns:
+        -------
+        float
+            The estimate, or infinity if it falls above the last bucket.
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+class Metrics:
+    """
+    Collects the bot's metrics and serves them in the Prometheus text format.
+
+    Latencies are recorded into histograms, which only costs a binary search and a few
+    additions per observation. Everything else, such as queue sizes or cache hit rates, is
+    read from the stats() of each registered component when the metrics are scraped, so
+    it costs nothing on the hot paths.
+
+    Attributes:
+    ----------
+    histograms : dict
+        Maps (metric name, labels) to its Histogram.
+
+    components : dict
+        Maps component names to callables returning their stats as a (possibly nested) dict.
+
+    port : int
+        The local port the Prometheus endpoint listens on, or None if it is disabled.
+        Configured with the METRICS_PORT environment variable.
+
+    host : str
+        The address the endpoint binds to. Configured with the METRICS_HOST environment variable.
+    """
+    PREFIX = 'hoppon'
+
+    def __init__(self, port=None, host=None):
+        """
+        Initialize an empty registry.
+
+        Parameters:
+        ----------
+        port : int, optional
+            Overrides METRICS_PORT.
+        host : str, optional
+            Overrides METRICS_HOST.
+        """
+        port = port or os.environ.get('METRICS_PORT')
+        self.port = int(port) if port else None
+        self.host = host or os.environ.get('METRICS_HOST', '127.0.0.1')
+        self.histograms = {}
+        self.components = {}
+        self._runner = None
+
+    def observe(self, name, value, **labels):
+        """
+        Record a value in a histogram.
+
+        Parameters:
+        ----------
+        name : str
+            The metric name, e.g. 'command_seconds'.
+        value : float
+            The observed value.
+        **labels
+            The metric's labels.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """
+        Time the code inside the block into a histogram, including when it raises.
+
+        Parameters:
+        ----------
+        name : str
+            The metric name.
+        **labels
+            The metric's labels.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def register(self, name, stats):
+        """
+        Export a component's stats as gauges.
+
+        Parameters:
+        ----------
+        name : str
+            The component name, used as part of the metric names.
+        stats : callable
+            Returns the component's stats as a dict. Nested dicts are flattened and
+            non-numeric values are skipped.
+        """
+        self.components[name] = stats
+
+    def summary(self, name):
+        """
+        Summarize the histograms of a metric for display.
+
+        Parameters:
+        ----------
+        name : str
+            The metric name.
+
+        Returns:
+        -------
+        list
+            A (labels, count, mean, p50, p95) tuple per label set, most observed first.
+        """
+        rows = []
+        for (metric, labels), histogram in self.histograms.items():
+            if metric == name and histogram.count:
+                rows.append((dict(labels), histogram.count, histogram.total / histogram.count,
+                             histogram.quantile(0.5), histogram.quantile(0.95)))
+        return sorted(rows, key=lambda row: row[1], reverse=True)
+
+    @staticmethod
+    def flatten(stats, prefix=''):
+        """
+        Flatten nested stats into (name, value) pairs, joining nested keys with underscores
+        and skipping values that are not numbers.
+        """
+        for key, value in stats.items():
+            name = f"{prefix}_{key}" if prefix else str(key)
+            if isinstance(value, dict):
+                yield from Metrics.flatten(value, name)
+            elif isinstance(value, (int, float)):
+                yield re.sub(r'\W', '_', name), float(value)
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = [*labels, *extra]
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+        -------
+        str
+            The metrics.
+        """
+        lines = []
+
+        by_name = {}
+        for (name, labels), histogram in self.histograms.items():
+            by_name.setdefault(name, []).append((labels, histogram))
+
+        for name, series in sorted(by_name.items()):
+            metric = f"{self.PREFIX}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for labels, histogram in series:
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{metric}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{metric}_bucket{self._labels(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{metric}_sum{self._labels(labels)} {histogram.total}")
+                lines.append(f"{metric}_count{self._labels(labels)} {histogram.count}")
+
+        for component, stats in self.components.items():
+            try:
+                values = list(self.flatten(stats()))
+            except Exception:
+                log.warning("Could not collect stats from %s", component, exc_info=True)
+                continue
+            for key, value in values:
+                metric = f"{self.PREFIX}_{component}_{key}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    async def _handle(self, request):
+        return web.Response(text=self.render(), content_type='text/plain', charset='utf-8')
+
+    async def start(self, offset=0):
+        """
+        Start serving /metrics on the configured port, if one is configured. The bot keeps
+        running without the endpoint if the port can't be bound.
+
+        Parameters:
+        ----------
+        offset : int
+            Added to the port, so processes running different shards on one host don't
+            compete for the same port.
+        """
+        if self.port is None or self._runner is not None:
+            return
+
+        port = self.port + offset
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, port).start()
+        except OSError as e:
+            log.warning("Could not serve metrics on %s:%d, continuing without them: %s", self.host, port, e)
+            await self._runner.cleanup()
+            self._runner = None
+            return
+        log.info("Serving metrics on http://%s:%d/metrics", self.host, port)
+
+    async def stop(self):
+        """
+        Stop serving metrics.
+        """
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+# The bot's metrics. Shared like a logger so any module can record into it.
+metrics = Metrics()
@@ -1,21 +1,39 @@
 import re
+import time
 import asyncio
 import os
-import spotipy
 import discord
-from yt_dlp import YoutubeDL
-from spotipy.oauth2 import SpotifyClientCredentials
+import logging
+from urllib.parse import urlparse, parse_qs
+from utils.resolver import Resolver
+from utils.resolver_processes import YoutubeProcessPool
+from utils.scheduler import priority, INTERACTIVE, PREFETCH, BULK, AUTOQUEUE
+from utils.announcer import QueueAnnouncer
+from utils.panel import PlayerPanel, QueueView, render_player
+from utils.player import PlayerRegistry
+from utils.journal import QueueJournal, ResumeContext
+from utils.search_cache import SearchCache
+from utils.audio_cache import AudioCache
+from utils.loudness import LoudnessStore
+from utils.suggestions import SuggestionIndex
+from utils.metrics import metrics
+from utils.voice import VoiceSessions
+from utils.spotify import SpotifyClient, TrackUnavailable
+from utils.track import Track
+
+log = logging.getLogger(__name__)
 
 class Music:
     """
-    A class that manages music data logic, including handling a queue of songs, 
+    A class that manages music data logic, including handling a queue of songs for each guild, 
     connecting to the Spotify API, and configuring FFMPEG streaming options.
 
     Attributes:
     ----------
     sp : spotipy.Spotify
         An instance of the Spotipy client that is authenticated and used to 
-        interact with the Spotify Web API.
+        interact with the Spotify Web API. Created with the YouTubeDL instances by create_clients
+        the first time the resolver needs them.
 
     FFMPEG_OPTIONS : dict
         A dictionary containing the options for FFMPEG, which is used to stream 
@@ -24,46 +42,136 @@ class Music:
     YDL_OPTS : dict
         A dictionary containing the options for YouTubeDL.
 
-    song_queue : list
-        A list where each element is a dictionary containing metadata for a song.
-        Each dictionary has the following structure:
-        - 'title' (str): The title of the song.
-        - 'artist' (str): The name of the artist.
-        - 'url' (str): The YouTube URL of the song.
-        - 'thumbnail' (str): The URL of the song's thumbnail image.
-
-    toggle_autoqueue : bool
-        A boolean flag indicating whether the autoqueue feature is enabled. When enabled,
-        the bot will automatically add songs to the queue based on the currently playing track.
+    resolver : Resolver
+        Runs every yt-dlp and Spotify call on a bounded thread pool so commands never block the event loop.
+
+    resolver_mode : str
+        'thread' to run yt-dlp on the resolver's thread pool, or 'process' to run it in worker
+        processes. Configured with the RESOLVER_MODE environment variable.
+
+    spotify : SpotifyClient
+        Caches and batches Spotify Web API requests.
+
+    search_cache : SearchCache
+        A persistent cache of search queries and Spotify track IDs to YouTube video IDs.
+
+    audio_cache : AudioCache
+        An optional on-disk cache of frequently played songs as Ogg/Opus files.
+
+    loudness : LoudnessStore
+        The measured loudness of songs, used to play every song at a similar volume.
+
+    suggestions : SuggestionIndex
+        An in-memory prefix index of known songs that autocompletes /play.
+
+    sessions : VoiceSessions
+        Keeps voice connections open for a while after the queue runs out so they can be reused.
+
+    announcer : QueueAnnouncer
+        Coalesces "Added to queue" messages for bulk imports and rapid enqueues.
+
+    import_workers : int
+        The number of tracks resolved at the same time when importing a Spotify album or playlist.
+
+    autoqueue_buffer_size : int
+        The number of pre-resolved recommendations each player keeps for autoqueue.
+
+    autoqueue_watermark : int
+        The buffer is refilled in the background once it holds fewer recommendations than this.
+
+    stream_expiry_margin : float
+        Stream URLs that expire within this many seconds are resolved again before they are played.
+
+    opus_passthrough : bool
+        Whether Opus streams are sent to Discord as-is instead of being decoded to PCM and encoded again.
+        Configured with the OPUS_PASSTHROUGH environment variable.
+
+    players : PlayerRegistry
+        The per-guild players holding each guild's song queue, autoqueue toggle and now playing state.
+        The YouTubeDL instance, Spotify client and resolver are shared by every guild.
+
+    journal : QueueJournal
+        Records every guild's queue so it can be restored after a restart.
+
+    resume : bool
+        Whether playback that was interrupted by a restart is resumed once the bot is ready.
+        Configured with the QUEUE_RESUME environment variable.
+
+    interrupted : dict
+        Maps the IDs of guilds that were playing before the restart to their (text channel ID,
+        voice channel ID) pair, until playback is resumed.
     """
     def __init__(self):
         """
         Initialize the Music class with Spotify API and YouTubeDL configurations.
         """
-        # Set up Spotify Web API client
-        spotify_client_id = os.environ['SPOTIFY_CLIENT_ID']
-        spotify_client_secret = os.environ['SPOTIFY_CLIENT_SECRET']
-
-        auth_manager = SpotifyClientCredentials(client_id=spotify_client_id,
-                                                client_secret=spotify_client_secret)
-        self.sp = spotipy.Spotify(auth_manager=auth_manager)
+        # Spotify Web API credentials, the client itself is created by create_clients
+        self.spotify_client_id = os.environ['SPOTIFY_CLIENT_ID']
+        self.spotify_client_secret = os.environ['SPOTIFY_CLIENT_SECRET']
+        self.sp = None
         
         # FFMPEG streaming options
         self.FFMPEG_OPTIONS = {'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5', 'options': '-vn'}
         
+        # Opus streams can be played without decoding them, see audio_source
+        self.opus_passthrough = os.environ.get('OPUS_PASSTHROUGH', 'true').lower() not in ('0', 'false', 'no')
+
         # YouTubeDL options
-        YDL_OPTS = {
-            'format': 'bestaudio/best',
+        self.YDL_OPTS = {
+            # Prefer YouTube's Opus formats so they can be passed through
+            'format': 'bestaudio[acodec=opus]/bestaudio/best',
             'default_search': 'ytsearch',
             'quiet': True,
             'noplaylist': True,
             'skip_download': True,
         }
-        self.ydl = YoutubeDL(YDL_OPTS)
+        self.ydl = None
+        self.search_ydl = None
+
+        # Run blocking yt-dlp and Spotify calls off the event loop, with yt-dlp optionally in
+        # worker processes so its parsing does not compete with the gateway for the GIL
+        self.resolver_mode = os.environ.get('RESOLVER_MODE', 'thread').lower()
+        processes = None
+        if self.resolver_mode == 'process':
+            processes = YoutubeProcessPool(self.YDL_OPTS, self.search_options())
+        self.resolver = Resolver(loader=self.create_clients, processes=processes)
+        self.spotify = SpotifyClient(self.resolver)
+
+        # Remember which video each search and Spotify track resolved to
+        self.search_cache = SearchCache()
+
+        # Keep frequently played songs on disk so they don't have to be streamed again
+        self.audio_cache = AudioCache()
+
+        # Measure each song's loudness once so songs play at a similar volume
+        self.loudness = LoudnessStore()
+
+        # Autocomplete /play from songs that were resolved before
+        self.suggestions = SuggestionIndex()
+        self.suggestions.load(self.search_cache)
+
+        # Linger in voice after the queue runs out instead of reconnecting for the next song
+        self.sessions = VoiceSessions()
+
+        # Coalesce queue announcements so imports don't hit Discord's rate limits
+        self.announcer = QueueAnnouncer()
+
+        # Number of tracks resolved at the same time when importing an album or playlist
+        self.import_workers = int(os.environ.get('IMPORT_WORKERS', 4))
+
+        # Pre-resolved recommendations kept per guild for autoqueue
+        self.autoqueue_buffer_size = int(os.environ.get('AUTOQUEUE_BUFFER', 10))
+        self.autoqueue_watermark = int(os.environ.get('AUTOQUEUE_WATERMARK', 3))
+
+        # Stream URLs are resolved just before playback and must outlive the song
+        self.stream_expiry_margin = 600
         
-        # Initialize song queue and autoqueue toggle
-        self.song_queue = []
-        self.toggle_autoqueue = False
+        # Per-guild song queues and autoqueue toggles, journaled so they survive restarts
+        self.journal = QueueJournal()
+        self.players = PlayerRegistry(journal=self.journal)
+        self.resume = os.environ.get('QUEUE_RESUME', 'true').lower() not in ('0', 'false', 'no')
+        self.interrupted = {}
+        self.restore_queues()
         
         # Regular expressions for matching YouTube and Spotify URLs
         self.youtube_url_pattern = r"^https:\/\/www\.youtube\.com\/watch\?v=[\w-]+$"
@@ -76,10 +184,91 @@ class Music:
             r'(.+?)\s*-\s*([^ ]+)\s*\(.*\)',  # Format: "Artist - Song Title (Extra Info)"
         ]
 
+    def create_clients(self):
+        """
+        Import yt-dlp and Spotipy and create the clients. Both libraries are slow to import,
+        so the resolver calls this on its thread pool when the clients are first needed
+        instead of at startup.
+
+        Returns:
+        -------
+        tuple
+            The YouTubeDL instance, the Spotipy client and the YouTubeDL instance for searches.
+            The YouTubeDL instances are None in process mode.
+        """
+        import spotipy
+        from spotipy.oauth2 import SpotifyClientCredentials
+
+        auth_manager = SpotifyClientCredentials(client_id=self.spotify_client_id,
+                                                client_secret=self.spotify_client_secret)
+        # Let the resolver's scheduler handle 429s and Retry-After instead of sleeping on a worker
+        self.sp = spotipy.Spotify(auth_manager=auth_manager, retries=0, status_retries=0,
+                                  status_forcelist=(500, 502, 503, 504))
+
+        # The worker processes have their own YouTubeDL instances
+        if self.resolver_mode != 'process':
+            from yt_dlp import YoutubeDL
+            self.ydl = YoutubeDL(self.YDL_OPTS)
+            self.search_ydl = YoutubeDL(self.search_options())
+        return self.ydl, self.sp, self.search_ydl
+
+    def search_options(self):
+        """
+        Return the YouTubeDL options for searches. Searches only need the video ID and title,
+        so each result is not extracted.
+        """
+        return {**self.YDL_OPTS, 'extract_flat': 'in_playlist'}
+
+    async def connect(self, ctx):
+        """
+        Connect to the author's voice channel, or reuse the guild's open connection.
+
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+
+        Returns:
+        -------
+        bool
+            True if the bot is connected to voice.
+        """
+        session = await self.sessions.connect(ctx)
+        if session is None:
+            return False
+
+        player = self.players.get(ctx.guild.id)
+        player.session = session
+        # Count the guild as connected from now on, even before anything is played
+        player.voice_client = ctx.voice_client
+        return True
+
     async def play_song(self, ctx, search):
         """
         Handle the input search query to play a song. It can be a YouTube URL, a Spotify URL, or a search query.
 
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+        search : str
+            The search query or URL to find the song.
+        """
+        # Measure time-to-first-audio from the command if nothing is playing yet
+        player = self.players.get(ctx.guild.id)
+        voice_client = ctx.voice_client
+        if voice_client and not voice_client.is_playing() and not voice_client.is_paused():
+            player.requested_at = getattr(ctx, 'started_at', None) or time.perf_counter()
+
+        try:
+            await self.queue_search(ctx, search)
+        finally:
+            player.requested_at = None
+
+    async def queue_search(self, ctx, search):
+        """
+        Queue the song or songs for a search query or URL, and start playback if nothing is playing.
+
         Parameters:
         ----------
         ctx : discord.ext.commands.Context
@@ -95,17 +284,29 @@ class Music:
             
         else:
             # Treat input as a search query
-            url = self.search_youtube(search)
+            song = await self.search_youtube(search)
             
             # Add to queue
-            if url:
-                await self.queue_youtube_url(ctx, url)
+            if song:
+                await self.add_to_queue(ctx, song)
             else:
                 await ctx.send("Could not find a video matching your search.")
                 return
 
         # If nothing is currently playing, start the playback
-        if not ctx.voice_client.is_playing():
+        await self.start_playback(ctx)
+
+    async def start_playback(self, ctx):
+        """
+        Start playing the queue if the voice client is connected and idle.
+
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+        """
+        voice_client = ctx.voice_client
+        if voice_client and not voice_client.is_playing() and not voice_client.is_paused():
             await self.play_next(ctx)
 
     async def handle_spotify_link(self, ctx, spotify_url):
@@ -124,29 +325,331 @@ class Music:
         
         # Determine the type of Spotify link
         if 'track' in spotify_url:
-            track = self.sp.track(url_id)
-            query = f"{track['name']} {track['artists'][0]['name']}"
-            youtube_url = self.search_youtube(query)
-            if youtube_url:
-                await self.queue_youtube_url(ctx, youtube_url)
+            try:
+                track = await self.spotify.track(url_id)
+            except TrackUnavailable:
+                await ctx.send("That Spotify track is not available.")
+                return
+            song = await self.search_spotify_track(track)
+            if song:
+                await self.add_to_queue(ctx, song)
                 
         elif 'album' in spotify_url:
-            album = self.sp.album(url_id)
-            for track in album['tracks']['items']:
-                query = f"{track['name']} {track['artists'][0]['name']}"
-                youtube_url = self.search_youtube(query)
-                if youtube_url:
-                    await self.queue_youtube_url(ctx, youtube_url)
+            progress = self.announcer.start_import(ctx)
+            await progress.start()
+            await self.import_spotify_tracks(ctx, self.iter_spotify_tracks('album', url_id, progress), progress)
 
         elif 'playlist' in spotify_url:
-            playlist = self.sp.playlist(url_id)
-            for item in playlist['tracks']['items']:
-                track = item['track']
-                query = f"{track['name']} {track['artists'][0]['name']}"
-                youtube_url = self.search_youtube(query)
-                if youtube_url:
-                    await self.queue_youtube_url(ctx, youtube_url)
-                    
+            progress = self.announcer.start_import(ctx)
+            await progress.start()
+            await self.import_spotify_tracks(ctx, self.iter_spotify_tracks('playlist', url_id, progress), progress)
+
+    async def iter_spotify_tracks(self, kind, url_id, progress=None):
+        """
+        Yield every track of a Spotify album or playlist, following pagination so that
+        collections longer than a single page are fully imported.
+
+        Parameters:
+        ----------
+        kind : str
+            Either 'album' or 'playlist'.
+        url_id : str
+            The Spotify ID of the album or playlist.
+        progress : ImportProgress, optional
+            Receives the name and track count of the album or playlist.
+
+        Yields:
+        ------
+        dict
+            A Spotify track object.
+        """
+        if kind == 'album':
+            collection = await self.spotify.album(url_id)
+        else:
+            collection = await self.spotify.playlist(url_id)
+        page = collection['tracks']
+
+        if progress is not None:
+            progress.name = collection.get('name')
+            progress.total = page.get('total')
+
+        while page:
+            for item in page['items']:
+                # Playlist items wrap the track, and removed tracks come back as None
+                track = item.get('track') if kind == 'playlist' else item
+                if track:
+                    self.spotify.prime(track)
+                    yield track
+
+            page = await self.spotify.next(page)
+
+    async def import_spotify_tracks(self, ctx, tracks, progress):
+        """
+        Queue a stream of Spotify tracks. The first track that resolves is queued and played
+        right away, then the rest are resolved concurrently by a bounded number of workers and
+        added to the song queue in their original order.
+
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+        tracks : AsyncIterator[dict]
+            The Spotify track objects to import, in playlist order.
+        progress : ImportProgress
+            The progress message to report queued and skipped tracks to.
+        """
+        player = self.players.get(ctx.guild.id)
+        workers = asyncio.Semaphore(self.import_workers)
+        resolved = {}
+        next_index = 0
+
+        async def resolve(index, track):
+            nonlocal next_index
+            try:
+                resolved[index] = await self.resolve_spotify_track(track)
+            finally:
+                workers.release()
+
+            # Queue every track that is now next in line, keeping the playlist order
+            queued = 0
+            failed = 0
+            while next_index in resolved:
+                metadata = resolved.pop(next_index)
+                next_index += 1
+                if metadata and player.song_queue.append(metadata):
+                    queued += 1
+                else:
+                    failed += 1
+
+            if queued or failed:
+                progress.update(resolved=queued, failed=failed)
+            if queued:
+                self.schedule_prefetch(player)
+                self.refresh_panel(ctx)
+                await self.start_playback(ctx)
+
+        tasks = []
+        complete = False
+        try:
+            # Resolve tracks one at a time until something can start playing
+            async for track in tracks:
+                metadata = await self.resolve_spotify_track(track)
+                if metadata and player.song_queue.append(metadata):
+                    progress.update(resolved=1)
+                    self.refresh_panel(ctx)
+                    await self.start_playback(ctx)
+                    break
+                progress.update(failed=1)
+
+            index = 0
+            # The rest of the import must not hold up other guilds' requests
+            with priority(BULK, ctx.guild.id):
+                async for track in tracks:
+                    await workers.acquire()
+                    tasks.append(asyncio.create_task(resolve(index, track)))
+                    index += 1
+            complete = True
+        finally:
+            # A failed worker or page request must not stop the tracks already started or
+            # leave the progress message unfinished
+            for result in await asyncio.gather(*tasks, return_exceptions=True):
+                if isinstance(result, Exception):
+                    log.warning("Import worker failed", exc_info=result)
+            await progress.finish(complete)
+
+    async def resolve_spotify_track(self, track):
+        """
+        Find the YouTube video for a Spotify track, logging instead of raising on failure.
+
+        Parameters:
+        ----------
+        track : dict
+            A Spotify track object.
+
+        Returns:
+        -------
+        Track
+            The song, or None if the track could not be resolved.
+        """
+        try:
+            return await self.search_spotify_track(track)
+        except Exception:
+            log.warning("Could not resolve Spotify track %r", track.get('name'), exc_info=True)
+
+        return None
+
+    async def search_spotify_track(self, track):
+        """
+        Find the YouTube video for a Spotify track, checking the search cache by track ID first.
+
+        Parameters:
+        ----------
+        track : dict
+            A Spotify track object.
+
+        Returns:
+        -------
+        Track
+            The song without a stream URL, or None if nothing was found.
+        """
+        # Local files in playlists have no Spotify ID
+        key = self.search_cache.spotify_key(track['id']) if track.get('id') else None
+        if key:
+            cached = self.search_cache.get(key)
+            if cached:
+                return Track(*cached, spotify_id=track['id'])
+
+        name = f"{track['name']} {track['artists'][0]['name']}"
+        song = await self.search_youtube(name)
+        if song:
+            self.suggestions.add(song.video_id, song.title, name)
+            if key:
+                song.spotify_id = track['id']
+                self.search_cache.put(key, song.video_id, song.title)
+
+        return song
+
+    async def fetch_youtube_metadata(self, url):
+        """
+        Extract the metadata and stream URL for a YouTube URL.
+
+        Parameters:
+        ----------
+        url : str
+            The YouTube URL to extract.
+
+        Returns:
+        -------
+        Track
+            The song, or None if the extraction timed out.
+        """
+        try:
+            info_dict = await self.resolver.extract(url)
+        except asyncio.TimeoutError:
+            return None
+
+        song = Track(info_dict['id'], info_dict.get('title', None), info_dict.get('thumbnail', None),
+                     info_dict.get('duration', None))
+        self.set_stream(song, info_dict)
+        return song
+
+    @staticmethod
+    def set_stream(song, info_dict):
+        """
+        Store the stream URL from a yt-dlp info dict on a song, along with the time it expires.
+
+        Parameters:
+        ----------
+        song : Track
+            The song.
+        info_dict : dict
+            The yt-dlp info dict for the song's video.
+        """
+        song.url = info_dict.get('url', None)
+        song.expires = None
+        song.opus = (info_dict.get('acodec') == 'opus' and info_dict.get('asr') == 48000
+                     and info_dict.get('audio_channels', 2) in (1, 2))
+
+        # googlevideo URLs carry their expiry time as a unix timestamp
+        if song.url:
+            expire = parse_qs(urlparse(song.url).query).get('expire')
+            if expire and expire[0].isdigit():
+                song.expires = float(expire[0])
+
+    async def resolve_stream(self, song, force=False):
+        """
+        Make sure a song has a stream URL that will not expire while it plays.
+
+        Parameters:
+        ----------
+        song : Track
+            The song.
+        force : bool
+            Resolve the stream URL again even if the current one looks valid.
+
+        Returns:
+        -------
+        bool
+            True if the song has a stream URL.
+        """
+        if not force and song.url:
+            if song.expires is None or song.expires - self.stream_expiry_margin > time.time():
+                return True
+
+        info_dict = await self.resolver.extract(song.watch_url)
+        self.set_stream(song, info_dict)
+        return song.url is not None
+
+    def schedule_prefetch(self, player):
+        """
+        Start resolving the stream URL of the next song in the background while the current
+        one plays, so the next song starts without a gap.
+
+        Parameters:
+        ----------
+        player : GuildPlayer
+            The player whose next song should be prefetched.
+        """
+        if player.now_playing is None or not player.song_queue:
+            return
+
+        song = player.song_queue[0]
+        if player.prefetch is not None and player.prefetch[0] is song:
+            return
+
+        with priority(PREFETCH, player.guild_id):
+            task = asyncio.create_task(self.prefetch_song(song))
+        # play_next reports failures, so don't let them surface as unretrieved task exceptions
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        player.prefetch = (song, task)
+
+    async def prefetch_song(self, song):
+        """
+        Resolve the stream URL of an upcoming song, analyse its loudness, and download it into
+        the audio cache if caching on prefetch is enabled. Songs that are already cached are
+        not resolved.
+
+        Parameters:
+        ----------
+        song : Track
+            The upcoming song.
+        """
+        if song.video_id in self.audio_cache.entries:
+            self.schedule_loudness(song)
+            return
+
+        if await self.resolve_stream(song):
+            if self.audio_cache.on_prefetch:
+                self.audio_cache.schedule_store(song.video_id, song.url, song.opus)
+            self.schedule_loudness(song)
+
+    def schedule_loudness(self, song):
+        """
+        Analyse a song's loudness in the background, from its file in the audio cache where
+        there is one. A song being downloaded into the cache is analysed once the download
+        is done, so its audio is not fetched a second time.
+
+        Parameters:
+        ----------
+        song : Track
+            The song, with its stream URL resolved.
+        """
+        video_id = song.video_id
+        if video_id in self.audio_cache.entries:
+            self.loudness.schedule(video_id, self.audio_cache.path(video_id))
+            return
+
+        storing = self.audio_cache.storing(video_id)
+        if storing is None:
+            self.loudness.schedule(video_id, song.url)
+            return
+
+        def stored(task):
+            # If the download failed the song is analysed the next time it plays
+            if video_id in self.audio_cache.entries:
+                self.loudness.schedule(video_id, self.audio_cache.path(video_id))
+        storing.add_done_callback(stored)
+
     async def queue_youtube_url(self, ctx, url):
         """
         Queue a YouTube URL by extracting metadata and adding it to the song queue.
@@ -158,114 +661,240 @@ class Music:
         url : str
             The YouTube URL to queue.
         """
-        info_dict = self.ydl.extract_info(url, download=False)
-        fetched_url = info_dict.get('url', None)
-        video_title = info_dict.get('title', None)
-        thumbnail_url = info_dict.get('thumbnail', None)
-        metadata = {
-            'title': video_title,
-            'url': fetched_url,
-            'thumbnail': thumbnail_url,
-        }
-            
-        self.song_queue.append(metadata)
-        embed = discord.Embed(title="Added to queue", colour=discord.Colour.blue())
-        embed.set_thumbnail(url=metadata['thumbnail'])
-        embed.add_field(name='', value=metadata['title'], inline=True)
-        await ctx.send(embed=embed)
-    
-    async def autoqueue_song(self, ctx, video_title):
+        # Songs picked from the /play suggestions are already known, so skip the lookup
+        known = self.suggestions.track(parse_qs(urlparse(url).query)['v'][0])
+        if known:
+            await self.add_to_queue(ctx, known)
+            return
+
+        metadata = await self.fetch_youtube_metadata(url)
+        if metadata:
+            await self.add_to_queue(ctx, metadata)
+        else:
+            await ctx.send("Timed out while fetching the video.")
+
+    async def add_to_queue(self, ctx, metadata):
         """
-        Automatically queue a song based on the last played song using recommendations.
+        Add a song to the song queue and announce it.
 
         Parameters:
         ----------
         ctx : discord.ext.commands.Context
             The context of the command being executed.
-        video_title : str
-            The title of the last played song.
+        metadata : Track
+            The song to queue.
         """
-        artist = None
-        song = None
+        player = self.players.get(ctx.guild.id)
+        if not player.song_queue.append(metadata):
+            await ctx.send(f"The queue is full ({player.song_queue.maxlen} songs).")
+            return
 
-        # Loop through the patterns until a match is found
-        for pattern in self.title_patterns:
-            match = re.match(pattern, video_title)
-            if match:
-                artist, song = match.groups()
-                break
+        self.schedule_prefetch(player)
+        self.refresh_panel(ctx)
+        await self.announcer.announce(ctx, metadata)
 
-        if not artist or not song:
-            await ctx.send("Could not parse title for autoqueue.")
-            return
-            
-        # Get a recommended song from Spotify
-        recommended_song = self.get_recommendation(song.strip(), artist.strip())
-        
-        if recommended_song:
-            # Search for the song on YouTube
-            search_query = f"{recommended_song['artist']} {recommended_song['song']}"
-            youtube_url = self.search_youtube(search_query)
-
-            if youtube_url:
-                # Add the YouTube URL to the song queue
-                await self.queue_youtube_url(ctx, youtube_url)
+    async def autoqueue_song(self, ctx):
+        """
+        Automatically queue a recommended song based on the recently played songs. Songs are
+        taken from the player's buffer of pre-resolved recommendations, which is refilled in
+        the background once it runs low.
+
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+        """
+        player = self.players.get(ctx.guild.id)
+
+        # Only wait on Spotify when the buffer has not been filled yet
+        if not player.autoqueue_buffer:
+            if player.refill_task is not None:
+                await asyncio.gather(player.refill_task, return_exceptions=True)
             else:
-                await ctx.send(f"Could not find a YouTube video for {song} by {artist}.")
+                await self.refill_autoqueue(player)
+
+        recent = self.recent_ids(player, include_buffer=False)
+        youtube_song = None
+        while player.autoqueue_buffer:
+            candidate = player.autoqueue_buffer.popleft()
+            if candidate.video_id not in recent:
+                youtube_song = candidate
+                break
+
+        self.schedule_autoqueue_refill(player)
+
+        if youtube_song:
+            # Add the YouTube video to the song queue
+            await self.add_to_queue(ctx, youtube_song)
         else:
             await ctx.send("Could not find a recommendation to autoqueue based on the last played song.")
-    
-    def search_youtube(self, query):
+
+    def recent_ids(self, player, include_buffer=True):
         """
-        Search for a YouTube video based on a query and return the URL of the first result.
+        Collect the video and Spotify IDs of the songs a player has recently played, has queued
+        or has buffered, so autoqueue does not repeat them.
 
         Parameters:
         ----------
-        query : str
-            The search query for YouTube.
+        player : GuildPlayer
+            The player to collect IDs for.
+        include_buffer : bool
+            Whether to include the songs in the autoqueue buffer.
+
+        Returns:
+        -------
+        set
+            The YouTube video IDs and Spotify track IDs.
+        """
+        recent = set()
+        sources = [player.history, player.song_queue]
+        if include_buffer:
+            sources.append(player.autoqueue_buffer)
+
+        for songs in sources:
+            for song in songs:
+                recent.add(song.video_id)
+                if song.spotify_id:
+                    recent.add(song.spotify_id)
+
+        if player.now_playing is not None:
+            recent.add(player.now_playing.video_id)
+            if player.now_playing.spotify_id:
+                recent.add(player.now_playing.spotify_id)
+
+        return recent
+
+    def schedule_autoqueue_refill(self, player):
+        """
+        Refill the player's autoqueue buffer in the background if it has dropped below the watermark.
+
+        Parameters:
+        ----------
+        player : GuildPlayer
+            The player whose buffer should be refilled.
+        """
+        if len(player.autoqueue_buffer) >= self.autoqueue_watermark or player.refill_task is not None:
+            return
+
+        with priority(AUTOQUEUE, player.guild_id):
+            player.refill_task = asyncio.create_task(self.refill_autoqueue(player))
+
+    async def refill_autoqueue(self, player):
+        """
+        Fill the player's autoqueue buffer with one batch of Spotify recommendations seeded
+        from the last few played songs, resolved to YouTube videos ahead of time.
+
+        Parameters:
+        ----------
+        player : GuildPlayer
+            The player whose buffer should be filled.
+        """
+        try:
+            played = list(player.history)
+            if player.now_playing is not None:
+                played.append(player.now_playing)
+
+            # Spotify accepts at most five seed tracks
+            seeds = []
+            for song in reversed(played):
+                if song.spotify_id and song.spotify_id not in seeds:
+                    seeds.append(song.spotify_id)
+                if len(seeds) == 5:
+                    break
+
+            if not seeds and played:
+                seed = await self.find_spotify_id(played[-1])
+                if seed:
+                    seeds.append(seed)
+
+            if not seeds:
+                return
+
+            needed = self.autoqueue_buffer_size - len(player.autoqueue_buffer)
+            if needed <= 0:
+                return
+
+            recent = self.recent_ids(player)
+            recommendations = await self.spotify.recommendations(seed_tracks=seeds, limit=min(100, needed * 2))
+            candidates = [track for track in recommendations['tracks'] if track['id'] not in recent][:needed]
+
+            songs = await asyncio.gather(*(self.resolve_spotify_track(track) for track in candidates))
+            for song in songs:
+                if song and song.video_id not in recent and len(player.autoqueue_buffer) < self.autoqueue_buffer_size:
+                    player.autoqueue_buffer.append(song)
+                    recent.add(song.video_id)
+        except Exception:
+            log.warning("Could not refill autoqueue for guild %s", player.guild_id, exc_info=True)
+        finally:
+            if player.refill_task is asyncio.current_task():
+                player.refill_task = None
+
+    async def find_spotify_id(self, song):
+        """
+        Find the Spotify track ID for a song that was not queued from Spotify by parsing
+        its YouTube title, and remember it on the song.
+
+        Parameters:
+        ----------
+        song : Track
+            The song to look up.
 
         Returns:
         -------
         str
-            The URL of the first YouTube video result.
+            The Spotify track ID, or None if the title could not be parsed or matched.
         """
-        info_dict = self.ydl.extract_info(query, download=False)
-        if 'entries' in info_dict:
-            video = info_dict['entries'][0]  # Take the first result
-            return f"https://www.youtube.com/watch?v={video['id']}"
-        else:
+        artist = None
+        track_name = None
+
+        # Loop through the patterns until a match is found
+        for pattern in self.title_patterns:
+            match = re.match(pattern, song.title or '')
+            if match:
+                artist, track_name = match.groups()
+                break
+
+        if not artist or not track_name:
             return None
+
+        results = await self.spotify.search(q=f'track:{track_name.strip()} artist:{artist.strip()}', type='track', limit=1)
+        if results['tracks']['items']:
+            song.spotify_id = results['tracks']['items'][0]['id']
+
+        return song.spotify_id
     
-    def get_recommendation(self, track_name, artist_name):
+    async def search_youtube(self, query):
         """
-        Get a song recommendation from Spotify based on a track and artist.
+        Search for a YouTube video based on a query and return the metadata of the first result.
+        Results are served from the search cache when the query was resolved before.
 
         Parameters:
         ----------
-        track_name : str
-            The name of the track.
-        artist_name : str
-            The name of the artist.
+        query : str
+            The search query for YouTube.
 
         Returns:
         -------
-        dict
-            A dictionary containing the recommended song's artist and title, or None if no recommendation is found.
+        Track
+            The first result without a stream URL, or None if nothing was found.
         """
-        results = self.sp.search(q=f'track:{track_name} artist:{artist_name}', type='track', limit=1)
-        if results['tracks']['items']:
-            track_id = results['tracks']['items'][0]['id']
-            recommendations = self.sp.recommendations(seed_tracks=[track_id], limit=1)
-            if recommendations['tracks']:
-                recommended_track = recommendations['tracks'][0]
-                recommended_artist = recommended_track['artists'][0]['name']
-                recommended_song = recommended_track['name']
-                return {
-                    'artist': recommended_artist,
-                    'song': recommended_song
-                }
-                
-        return None
+        key = self.search_cache.query_key(query)
+        cached = self.search_cache.get(key)
+        if cached:
+            return Track(*cached)
+
+        try:
+            info_dict = await self.resolver.search(query)
+        except asyncio.TimeoutError:
+            return None
+
+        if info_dict.get('entries'):
+            video = info_dict['entries'][0]  # Take the first result
+            self.search_cache.put(key, video['id'], video.get('title'))
+            self.suggestions.add(video['id'], video.get('title'), query)
+            return Track(video['id'], video.get('title'), duration=video.get('duration'))
+        else:
+            return None
     
     async def autoqueue(self, ctx):
         """
@@ -277,11 +906,18 @@ class Music:
             The context of the command being executed.
         """
         if ctx.voice_client:
-            self.toggle_autoqueue = not self.toggle_autoqueue
-            
-            if self.toggle_autoqueue:
+            player = self.players.get(ctx.guild.id)
+            player.toggle_autoqueue = not player.toggle_autoqueue
+            self.journal.set_autoqueue(ctx.guild.id, player.toggle_autoqueue)
+
+            if player.toggle_autoqueue:
+                # Start buffering recommendations so the first handover is instant
+                self.schedule_autoqueue_refill(player)
+                self.refresh_panel(ctx)
                 await ctx.send("Autoqueue enabled. I will automatically queue a song based on the last played song.")
             else:
+                player.autoqueue_buffer.clear()
+                self.refresh_panel(ctx)
                 await ctx.send("Autoqueue disabled.")
         else:
             await ctx.send("I'm not in a voice channel.")
@@ -290,53 +926,399 @@ class Music:
         """
         Play the next song in the queue. If autoqueue is enabled, add a recommended song based on the last played song.
 
+        The song's stream URL is resolved here, just before playback, and the following song's
+        stream URL is prefetched while this one plays. Only one call per guild starts a song
+        at a time; a call that finds a song already playing leaves the queue alone.
+
         Parameters:
         ----------
         ctx : discord.ext.commands.Context
             The context of the command being executed.
         """
-        if len(self.song_queue) > 0:
-            song_metadata = self.song_queue.pop(0)
+        if not ctx.voice_client:
+            self.journal.set_playing(ctx.guild.id, None)
+            return
 
-            embed = discord.Embed(title="Now Playing", colour=discord.Colour.blue())
-            embed.set_thumbnail(url=song_metadata['thumbnail'])
-            embed.add_field(name='', value=song_metadata['title'], inline=True)
-            
-            ctx.voice_client.play(discord.FFmpegPCMAudio(song_metadata['url'], **self.FFMPEG_OPTIONS),
-                                after=lambda e: asyncio.run_coroutine_threadsafe(self.play_next(ctx), ctx.bot.loop))
-            await ctx.send(embed=embed)
-            
-            # Autoqueue a song based on the last played song
-            if self.toggle_autoqueue and len(self.song_queue) == 0:
-                await self.autoqueue_song(ctx, song_metadata['title'])
-        else:
-            await ctx.send("The queue is empty!")
-            await ctx.voice_client.disconnect()
+        player = self.players.get(ctx.guild.id)
+        async with player.playback_lock:
+            # Another call may have started a song while this one waited for the lock
+            voice_client = ctx.voice_client
+            if voice_client is None or voice_client.is_playing() or voice_client.is_paused():
+                return
+            player.voice_client = voice_client
+
+            while len(player.song_queue) > 0:
+                song_metadata = player.song_queue.popleft()
+
+                # Wait for the prefetch of this song if one is still running
+                if player.prefetch is not None and player.prefetch[0] is song_metadata:
+                    await asyncio.gather(player.prefetch[1], return_exceptions=True)
+                player.prefetch = None
+
+                # Play from the local audio cache when the song is cached
+                local_path = self.audio_cache.lookup(song_metadata.video_id)
+                if local_path is not None:
+                    break
+
+                try:
+                    # Someone is waiting for this song, even if it was queued by an import
+                    with priority(INTERACTIVE, ctx.guild.id):
+                        if await self.resolve_stream(song_metadata):
+                            break
+                except Exception:
+                    log.warning("Could not resolve stream for %s", song_metadata.video_id, exc_info=True)
+
+                await ctx.send(f"Could not load {song_metadata.title}, skipping it.")
+            else:
+                if player.now_playing is not None:
+                    player.history.append(player.now_playing)
+                player.now_playing = None
+                self.journal.set_playing(ctx.guild.id, None)
+                if player.panel is not None:
+                    await player.panel.close()
+                    player.panel = None
+                # Stay connected so the next song starts right away, see VoiceSessions
+                await ctx.send("The queue is empty!")
+                return
+
+            # The voice client may have disconnected or been given a song while the stream resolved
+            voice_client = ctx.voice_client
+            if voice_client is None or voice_client.is_playing() or voice_client.is_paused():
+                player.song_queue.appendleft(song_metadata)
+                return
+
+            if player.now_playing is not None:
+                player.history.append(player.now_playing)
+            player.now_playing = song_metadata
+            self.suggestions.record_play(song_metadata)
+
+            source = self.audio_source(song_metadata, local_path)
+            if local_path is None:
+                self.audio_cache.record_play(song_metadata.video_id, song_metadata.url, song_metadata.opus)
+            self.journal.set_playing(ctx.guild.id, song_metadata, ctx.channel.id, voice_client.channel.id)
+            song_metadata.start = 0
+            # Songs that were not prefetched are analysed while they play, for the next time
+            self.schedule_loudness(song_metadata)
+
+            # The after callback runs on the voice thread, so hand the next song back to this loop
+            loop = asyncio.get_running_loop()
+            started = time.monotonic()
+            voice_client.play(source,
+                              after=lambda e: asyncio.run_coroutine_threadsafe(self.song_finished(ctx, song_metadata, started, e), loop))
+            if player.requested_at is not None:
+                metrics.observe('time_to_first_audio_seconds', time.perf_counter() - player.requested_at,
+                                source='cache' if local_path is not None else 'stream', session=player.session or 'cold')
+                player.requested_at = None
+            self.refresh_panel(ctx, create=True)
+
+            self.schedule_prefetch(player)
+
+        # Autoqueue a song based on the last played song
+        if player.toggle_autoqueue:
+            if len(player.song_queue) == 0:
+                with priority(AUTOQUEUE, ctx.guild.id):
+                    await self.autoqueue_song(ctx)
+            else:
+                self.schedule_autoqueue_refill(player)
+
+    def audio_source(self, song, local_path=None):
+        """
+        Create the audio source for a song.
+
+        Opus at 48 kHz is what Discord expects, so when the stream (or the cached file) is
+        already Opus, ffmpeg only remuxes it and discord.py sends the packets as they are.
+        Other streams are decoded to PCM and encoded to Opus again by discord.py.
+
+        Songs whose loudness is known and far enough from the target are played through a
+        volume filter, which needs the decoded PCM path, see LoudnessStore.gain. Songs with a
+        start position are seeked to it.
+
+        Parameters:
+        ----------
+        song : Track
+            The song, with its stream URL resolved unless it is played from the audio cache.
+        local_path : str, optional
+            The path of the song in the audio cache.
+
+        Returns:
+        -------
+        discord.AudioSource
+            The audio source to play.
+        """
+        gain = self.loudness.gain(song.video_id)
+        # Filters need decoded audio, so songs with a gain can't be passed through
+        passthrough = self.opus_passthrough and gain is None
+        volume = '' if gain is None else f' -af volume={gain:.1f}dB'
+        # Songs resumed after a restart start where they were interrupted
+        seek = f'-ss {song.start:.1f} ' if song.start else ''
+
+        if local_path is not None:
+            # The audio cache always stores Ogg/Opus at 48 kHz
+            if passthrough:
+                return discord.FFmpegOpusAudio(local_path, codec='copy', before_options=seek or None, options='-vn')
+            return discord.FFmpegPCMAudio(local_path, before_options=seek or None, options='-vn' + volume)
+
+        options = dict(self.FFMPEG_OPTIONS, before_options=seek + self.FFMPEG_OPTIONS['before_options'])
+        if passthrough and song.opus:
+            return discord.FFmpegOpusAudio(song.url, codec='copy', **options)
+        options['options'] += volume
+        return discord.FFmpegPCMAudio(song.url, **options)
+
+    async def song_finished(self, ctx, song_metadata, started, error):
+        """
+        Handle the end of a song and move on to the next one. A song that fails straight away
+        most likely had an expired stream URL, so it is resolved again and retried once.
+
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+        song_metadata : Track
+            The song that finished.
+        started : float
+            The monotonic time the song started playing.
+        error : Exception
+            The error playback stopped with, or None.
+        """
+        player = self.players.get(ctx.guild.id)
+        failed = error is not None or (not player.skipping and time.monotonic() - started < 3)
+        player.skipping = False
+
+        if failed and not song_metadata.retried:
+            log.info("Playback of %s failed, resolving its stream again", song_metadata.video_id)
+            song_metadata.retried = True
+            song_metadata.url = None
+            # The cached file may be the cause, so stream the song instead
+            self.audio_cache.discard(song_metadata.video_id)
+            player.song_queue.appendleft(song_metadata)
+
+        await self.play_next(ctx)
+
+    def refresh_panel(self, ctx, create=False):
+        """
+        Schedule an update of the guild's "Now Playing" panel.
+
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+        create : bool
+            Post a new panel in the context's channel if the guild does not have one.
+        """
+        player = self.players.get(ctx.guild.id)
+        if player.panel is None:
+            if not create:
+                return
+            player.panel = PlayerPanel(ctx.channel, lambda: render_player(player))
+
+        player.panel.refresh()
+
+    def stop_playback(self, ctx):
+        """
+        Stop the current song on purpose, e.g. for a skip, so it is not mistaken for a failed stream.
+
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+        """
+        self.players.get(ctx.guild.id).skipping = True
+        ctx.voice_client.stop()
             
     async def queue(self, ctx):
         """
-        Send an embed message showing the current song queue.
+        Send an embed message showing the current song queue, with buttons to page through long queues.
 
         Parameters:
         ----------
         ctx : discord.ext.commands.Context
             The context of the command being executed.
         """
-        if len(self.song_queue) > 0:
-            embed = discord.Embed(title="Queue", colour=discord.Colour.blue())
-            
-            for i in range(len(self.song_queue)):
-                embed.add_field(name='', value=f'**{i+1}.** {self.song_queue[i]["title"]}', inline=False)
+        player = self.players.get(ctx.guild.id)
+        song_queue = player.song_queue
+        if len(song_queue) > 0:
+            view = None
+            if player.queue_pages.page_count(song_queue) > 1:
+                view = QueueView(player.queue_pages, song_queue)
 
             await ctx.message.delete()
-            await ctx.send(embed=embed)
+            await ctx.send(embed=player.queue_pages.page(song_queue, 0), view=view)
         else:
             await ctx.message.delete()
             await ctx.send("The queue is empty.")
             
+    async def shuffle_queue(self, ctx):
+        """
+        Shuffle the song queue.
+
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+        """
+        player = self.players.get(ctx.guild.id)
+        player.song_queue.shuffle()
+        self.schedule_prefetch(player)
+        self.refresh_panel(ctx)
+        await ctx.send("The queue was shuffled.")
+
+    async def remove_song(self, ctx, position):
+        """
+        Remove a song from the song queue.
+
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+        position : int
+            The one-based position of the song in the queue.
+        """
+        player = self.players.get(ctx.guild.id)
+        if not 1 <= position <= len(player.song_queue):
+            await ctx.send(f"There is no song at position {position}.")
+            return
+
+        song = player.song_queue.remove(position - 1)
+        self.schedule_prefetch(player)
+        self.refresh_panel(ctx)
+        await ctx.send(f"Removed {song.title} from the queue.")
+
+    async def move_song(self, ctx, source, destination):
+        """
+        Move a song to a new position in the song queue.
+
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+        source : int
+            The one-based position of the song to move.
+        destination : int
+            The one-based position to move it to.
+        """
+        player = self.players.get(ctx.guild.id)
+        length = len(player.song_queue)
+        if not 1 <= source <= length or not 1 <= destination <= length:
+            await ctx.send(f"Positions must be between 1 and {length}.")
+            return
+
+        player.song_queue.move(source - 1, destination - 1)
+        self.schedule_prefetch(player)
+        self.refresh_panel(ctx)
+        await ctx.send(f"Moved {player.song_queue[destination - 1].title} to position {destination}.")
+
     async def clear_queue(self, ctx):
         """
         Clear the song queue.
+
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
         """
-        self.song_queue.clear()
+        self.players.get(ctx.guild.id).song_queue.clear()
+        self.refresh_panel(ctx)
         await ctx.send("The queue was cleared.")
+
+    def restore_queues(self):
+        """
+        Restore the queues journaled before the last restart and start journaling.
+
+        Songs are restored with their video IDs, so nothing has to be searched again. A song
+        that was playing goes back to the front of its queue, to resume at the position it
+        was interrupted at.
+        """
+        if not self.journal.enabled:
+            return
+
+        started = time.perf_counter()
+        states, last_seen = self.journal.load()
+        tracks = 0
+        for guild_id, state in states.items():
+            player = self.players.get(guild_id)
+            for record in state.queue:
+                player.song_queue.append(Track.from_record(record))
+            player.toggle_autoqueue = state.autoqueue
+
+            if state.playing is not None:
+                # Journals written before pauses were recorded have no paused at field
+                record, song_started, text_channel_id, voice_channel_id, *rest = state.playing
+                paused_at = rest[0] if rest else None
+                song = Track.from_record(record)
+                # A paused song resumes where it was paused, however long ago that was
+                position = max(0, (paused_at or last_seen) - song_started)
+                # Don't resume a song in its last few seconds
+                if song.duration is None or position < song.duration - 5:
+                    song.start = position
+                    player.song_queue.appendleft(song)
+                self.interrupted[guild_id] = (text_channel_id, voice_channel_id)
+            tracks += len(player.song_queue)
+
+        # Nothing is journaled until the journal is started, so write the restored state as a snapshot
+        self.journal.start()
+        self.journal.compact(self.players.players)
+        if states:
+            log.info("Restored %d songs in %d guilds in %.3fs", tracks, len(states), time.perf_counter() - started)
+
+    async def resume_playback(self, bot):
+        """
+        Rejoin the voice channels that were playing before the last restart and continue
+        their queues, if resuming is enabled and someone is still in the channel.
+
+        Parameters:
+        ----------
+        bot : discord.ext.commands.Bot
+            The bot, once it is ready.
+        """
+        interrupted, self.interrupted = self.interrupted, {}
+        if not self.resume:
+            return
+
+        for guild_id, (text_channel_id, voice_channel_id) in interrupted.items():
+            # Guilds of other shards are resumed by their own process
+            guild = bot.get_guild(guild_id)
+            if guild is None or guild.voice_client is not None:
+                continue
+
+            channel = guild.get_channel(voice_channel_id) if voice_channel_id else None
+            text_channel = guild.get_channel(text_channel_id) if text_channel_id else None
+            if channel is None or text_channel is None or not any(not member.bot for member in channel.members):
+                continue
+
+            try:
+                await channel.connect()
+                ctx = ResumeContext(guild, text_channel)
+                await ctx.send("I'm back! Picking up the queue where I left off.")
+                await self.play_next(ctx)
+            except Exception:
+                log.warning("Could not resume playback in guild %s", guild_id, exc_info=True)
+
+    def stats(self):
+        """
+        Return the size of the per-guild music state.
+
+        Returns:
+        -------
+        dict
+            The number of players, songs playing, songs queued across all guilds, the longest
+            queue and songs waiting in autoqueue buffers.
+        """
+        queues = [len(player.song_queue) for player in self.players.players.values()]
+        return {
+            'players': len(queues),
+            'playing': sum(player.now_playing is not None for player in self.players.players.values()),
+            'queued': sum(queues),
+            'longest_queue': max(queues, default=0),
+            'autoqueue_buffered': sum(len(player.autoqueue_buffer) for player in self.players.players.values()),
+        }
+
+    def close(self):
+        """
+        Write what is left to the journal and the search cache, stop the background work and
+        release the thread pool, worker processes and database connections.
+        """
+        self.journal.close()
+        self.announcer.close()
+        self.resolver.close()
+        self.search_cache.close()
+        self.loudness.close()
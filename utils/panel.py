@@ -0,0 +1,252 @@
+import os
+import asyncio
+import logging
+import discord
+from itertools import islice
+
+log = logging.getLogger(__name__)
+
+class PlayerPanel:
+    """
+    A single "Now Playing" message per guild that is edited in place whenever the player
+    changes. Edits are debounced so that a burst of changes becomes one edit, and slowed
+    down further if Discord rate limits them.
+
+    Attributes:
+    ----------
+    channel : discord.abc.Messageable
+        The channel the panel is posted in.
+
+    render : callable
+        Called with no arguments to build the panel's current embed.
+
+    min_interval : float
+        The minimum number of seconds between edits. Configured with the PANEL_EDIT_INTERVAL environment variable.
+
+    message : discord.Message
+        The panel message, or None until it has been sent.
+
+    edits : int
+        The number of times the panel was sent or edited.
+
+    closed : bool
+        Whether the session the panel belongs to has ended. A closed panel is never sent or edited again.
+    """
+    def __init__(self, channel, render, min_interval=None):
+        """
+        Initialize the panel. The message is sent on the first refresh.
+
+        Parameters:
+        ----------
+        channel : discord.abc.Messageable
+            The channel to post the panel in.
+        render : callable
+            Builds the panel's embed.
+        min_interval : float, optional
+            Overrides PANEL_EDIT_INTERVAL.
+        """
+        self.channel = channel
+        self.render = render
+        self.min_interval = min_interval or float(os.environ.get('PANEL_EDIT_INTERVAL', 2))
+        self.message = None
+        self.edits = 0
+        self.closed = False
+        self._next_edit = 0.0
+        self._task = None
+
+    def refresh(self):
+        """
+        Schedule an update of the panel. Calls made before the update runs are merged into it.
+        """
+        if self._task is None and not self.closed:
+            self._task = asyncio.create_task(self._update_later())
+
+    async def _update_later(self):
+        delay = self._next_edit - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        self._task = None
+        await self.update()
+
+    async def update(self):
+        """
+        Send or edit the panel message right away with the current state.
+        """
+        if not self.closed:
+            await self._send()
+
+    async def _send(self):
+        loop = asyncio.get_running_loop()
+        embed = self.render()
+
+        try:
+            if self.message is None:
+                self.message = await self.channel.send(embed=embed)
+            else:
+                await self.message.edit(embed=embed)
+            self.edits += 1
+        except discord.NotFound:
+            # The panel was deleted, so post a new one next time
+            self.message = None
+            self.refresh()
+        except discord.HTTPException as e:
+            if e.status == 429:
+                retry_after = getattr(e, 'retry_after', None) or self.min_interval * 2
+                self._next_edit = loop.time() + retry_after
+                self.refresh()
+                return
+            log.warning("Could not update the player panel", exc_info=True)
+
+        self._next_edit = loop.time() + self.min_interval
+
+    async def close(self):
+        """
+        Show the panel's final state and detach from its message, so the next session posts a new one.
+        The panel does nothing after this.
+        """
+        self.closed = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        # A failed final edit is not retried, since refresh does nothing once the panel is closed
+        if self.message is not None:
+            await self._send()
+        self.message = None
+
+def render_player(player):
+    """
+    Build the "Now Playing" panel embed for a player.
+
+    Parameters:
+    ----------
+    player : GuildPlayer
+        The player to render.
+
+    Returns:
+    -------
+    discord.Embed
+        The embed.
+    """
+    song = player.now_playing
+    if song is None:
+        embed = discord.Embed(title="Nothing playing", colour=discord.Colour.blue())
+    else:
+        paused = player.voice_client is not None and player.voice_client.is_paused()
+        embed = discord.Embed(title="Paused" if paused else "Now Playing", description=song.title,
+                              url=song.watch_url, colour=discord.Colour.blue())
+        embed.set_thumbnail(url=song.thumbnail)
+
+    up_next = list(islice(player.song_queue, 3))
+    if up_next:
+        embed.add_field(name='Up next', value='\n'.join(f'**{i+1}.** {s.title}' for i, s in enumerate(up_next)), inline=False)
+
+    autoqueue = 'on' if player.toggle_autoqueue else 'off'
+    embed.set_footer(text=f"{len(player.song_queue)} songs in queue · Autoqueue {autoqueue}")
+    return embed
+
+class QueuePages:
+    """
+    Renders a song queue as pages of an embed. Rendered pages are cached and only thrown
+    away when the queue changes.
+
+    Attributes:
+    ----------
+    page_size : int
+        The number of songs per page.
+    """
+    def __init__(self, page_size=10):
+        """
+        Initialize an empty page cache.
+
+        Parameters:
+        ----------
+        page_size : int
+            The number of songs per page.
+        """
+        self.page_size = page_size
+        self._version = None
+        self._pages = {}
+
+    def page_count(self, song_queue):
+        """
+        Count the pages needed for a queue.
+
+        Parameters:
+        ----------
+        song_queue : TrackQueue
+            The queue.
+
+        Returns:
+        -------
+        int
+            The number of pages, at least 1.
+        """
+        return max(1, -(-len(song_queue) // self.page_size))
+
+    def page(self, song_queue, index):
+        """
+        Render one page of a queue.
+
+        Parameters:
+        ----------
+        song_queue : TrackQueue
+            The queue.
+        index : int
+            The zero-based page number.
+
+        Returns:
+        -------
+        discord.Embed
+            The page.
+        """
+        if self._version != song_queue.version:
+            self._version = song_queue.version
+            self._pages.clear()
+
+        embed = self._pages.get(index)
+        if embed is None:
+            start = index * self.page_size
+            lines = [f'**{start + i + 1}.** {song.title}'
+                     for i, song in enumerate(islice(song_queue, start, start + self.page_size))]
+
+            embed = discord.Embed(title="Queue", description='\n'.join(lines), colour=discord.Colour.blue())
+            embed.set_footer(text=f"Page {index + 1} of {self.page_count(song_queue)} · {len(song_queue)} songs")
+            self._pages[index] = embed
+
+        return embed
+
+class QueueView(discord.ui.View):
+    """
+    Previous and next buttons for paging through the queue.
+    """
+    def __init__(self, pages, song_queue):
+        """
+        Initialize the view on the first page.
+
+        Parameters:
+        ----------
+        pages : QueuePages
+            The page cache to render from.
+        song_queue : TrackQueue
+            The queue to page through.
+        """
+        super().__init__(timeout=120)
+        self.pages = pages
+        self.song_queue = song_queue
+        self.index = 0
+
+    async def show(self, interaction):
+        self.index = max(0, min(self.index, self.pages.page_count(self.song_queue) - 1))
+        await interaction.response.edit_message(embed=self.pages.page(self.song_queue, self.index), view=self)
+
+    @discord.ui.button(label='Previous', style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction, button):
+        self.index -= 1
+        await self.show(interaction)
+
+    @discord.ui.button(label='Next', style=discord.ButtonStyle.secondary)
+    async def next(self, interaction, button):
+        self.index += 1
+        await self.show(interaction)
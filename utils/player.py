@@ -0,0 +1,216 @@
+import os
+import time
+import asyncio
+from collections import deque
+from utils.track import TrackQueue
+from utils.panel import QueuePages
+
+class GuildPlayer:
+    """
+    Holds the playback state of a single guild so that guilds never share a queue.
+
+    Attributes:
+    ----------
+    guild_id : int
+        The ID of the guild this player belongs to.
+
+    song_queue : TrackQueue
+        The songs waiting to be played, in order.
+
+    toggle_autoqueue : bool
+        A boolean flag indicating whether the autoqueue feature is enabled. When enabled,
+        the bot will automatically add songs to the queue based on the currently playing track.
+
+    now_playing : Track
+        The song that is currently playing, or None.
+
+    voice_client : discord.VoiceClient
+        The voice client the guild is playing through, or None.
+
+    history : collections.deque
+        The most recently played songs, oldest first.
+
+    autoqueue_buffer : collections.deque
+        Recommended songs resolved ahead of time for autoqueue.
+
+    refill_task : asyncio.Task
+        The background task refilling the autoqueue buffer, or None.
+
+    panel : PlayerPanel
+        The guild's "Now Playing" panel, or None when nothing has played since the last session.
+
+    queue_pages : QueuePages
+        Cached pages of the queue view.
+
+    prefetch : tuple
+        The (song, task) pair for the stream URL being resolved ahead of playback, or None.
+
+    playback_lock : asyncio.Lock
+        Held while the next song is taken off the queue and started, so two callers of
+        play_next can't both start a song.
+
+    skipping : bool
+        Set when the current song is stopped on purpose, so it is not retried as a failed stream.
+
+    requested_at : float
+        The perf_counter time a play command was issued while nothing was playing, until its
+        first song starts. Used to measure time-to-first-audio.
+
+    session : str
+        'warm' if the last play command reused an open voice connection, 'cold' if it had to connect.
+
+    last_active : float
+        The monotonic time of the last command or playback event in this guild.
+    """
+    # The number of played songs remembered for autoqueue seeds and deduplication
+    HISTORY_SIZE = 50
+
+    def __init__(self, guild_id):
+        """
+        Initialize an empty player for a guild.
+
+        Parameters:
+        ----------
+        guild_id : int
+            The ID of the guild.
+        """
+        self.guild_id = guild_id
+        self.song_queue = TrackQueue()
+        self.toggle_autoqueue = False
+        self.now_playing = None
+        self.voice_client = None
+        self.history = deque(maxlen=self.HISTORY_SIZE)
+        self.autoqueue_buffer = deque()
+        self.refill_task = None
+        self.panel = None
+        self.queue_pages = QueuePages()
+        self.prefetch = None
+        self.playback_lock = asyncio.Lock()
+        self.skipping = False
+        self.requested_at = None
+        self.session = None
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        """
+        Mark the player as active.
+        """
+        self.last_active = time.monotonic()
+
+    def is_connected(self):
+        """
+        Check whether the player has a live voice connection.
+
+        Returns:
+        -------
+        bool
+            True if the voice client is connected.
+        """
+        return self.voice_client is not None and self.voice_client.is_connected()
+
+class PlayerRegistry:
+    """
+    Maps guild IDs to their GuildPlayer. Players are created on first use and evicted once
+    their guild has gone idle, so memory stays proportional to the number of active guilds.
+
+    Attributes:
+    ----------
+    players : dict
+        A dictionary mapping guild IDs to GuildPlayer instances.
+
+    idle_timeout : float
+        The number of seconds a disconnected player is kept before it is evicted.
+        Configured with the PLAYER_IDLE_TIMEOUT environment variable.
+
+    journal : QueueJournal
+        The journal every player's queue is recorded in, or None.
+    """
+    def __init__(self, idle_timeout=None, journal=None):
+        """
+        Initialize an empty registry.
+
+        Parameters:
+        ----------
+        idle_timeout : float, optional
+            Overrides PLAYER_IDLE_TIMEOUT.
+        journal : QueueJournal, optional
+            The journal to record every player's queue in.
+        """
+        self.players = {}
+        self.idle_timeout = idle_timeout or float(os.environ.get('PLAYER_IDLE_TIMEOUT', 600))
+        self.journal = journal
+
+    def get(self, guild_id):
+        """
+        Return the player for a guild, creating it if needed, and mark it as active.
+
+        Parameters:
+        ----------
+        guild_id : int
+            The ID of the guild.
+
+        Returns:
+        -------
+        GuildPlayer
+            The guild's player.
+        """
+        player = self.players.get(guild_id)
+        if player is None:
+            player = self.players[guild_id] = GuildPlayer(guild_id)
+            if self.journal is not None:
+                player.song_queue.listener = self.journal.listener(guild_id)
+
+        player.touch()
+        return player
+
+    def peek(self, guild_id):
+        """
+        Return the player for a guild without creating it.
+
+        Parameters:
+        ----------
+        guild_id : int
+            The ID of the guild.
+
+        Returns:
+        -------
+        GuildPlayer
+            The guild's player, or None if it has no state.
+        """
+        return self.players.get(guild_id)
+
+    def remove(self, guild_id):
+        """
+        Drop the player for a guild.
+
+        Parameters:
+        ----------
+        guild_id : int
+            The ID of the guild.
+        """
+        if self.players.pop(guild_id, None) is not None and self.journal is not None:
+            self.journal.forget(guild_id)
+
+    def evict_idle(self):
+        """
+        Drop every player that is not connected to voice and has been inactive for longer
+        than the idle timeout.
+
+        Returns:
+        -------
+        int
+            The number of players evicted.
+        """
+        cutoff = time.monotonic() - self.idle_timeout
+        idle = [guild_id for guild_id, player in self.players.items()
+                if not player.is_connected() and player.last_active < cutoff]
+
+        for guild_id in idle:
+            del self.players[guild_id]
+            if self.journal is not None:
+                self.journal.forget(guild_id)
+
+        return len(idle)
+
+    def __len__(self):
+        return len(self.players)
@@ -0,0 +1,175 @@
+import os
+import time
+import asyncio
+import logging
+import aiohttp
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from utils.ttl_cache import TTLCache
+
+log = logging.getLogger(__name__)
+
+class PrayerTimesError(Exception):
+    """
+    Raised when prayer times could not be fetched and there are no cached times to fall back on.
+    """
+
+class PrayerTimesClient:
+    """
+    Fetches daily prayer times from the Aladhan API over a shared, pooled HTTP session.
+
+    Timings are cached per city until local midnight in that city, concurrent requests for
+    the same city share one upstream call, and if the API is slow or down the last known
+    timings are returned instead.
+
+    Attributes:
+    ----------
+    base_url : str
+        The base URL of the Aladhan API. Configured with the ALADHAN_API_URL environment variable.
+
+    timeout : float
+        The number of seconds to wait for the API. Configured with the SALAH_TIMEOUT environment variable.
+
+    method : int
+        The Aladhan calculation method.
+
+    cache : TTLCache
+        The last timings fetched for each city, kept for a week so they can stand in while
+        the API is down. Sized with the SALAH_CACHE_SIZE environment variable.
+    """
+    # The number of seconds timings are kept as a fallback after they were fetched
+    STALE_TTL = 7 * 24 * 60 * 60
+
+    def __init__(self, base_url=None, timeout=None, method=2, max_entries=None):
+        """
+        Initialize the client. The HTTP session is created on first use.
+
+        Parameters:
+        ----------
+        base_url : str, optional
+            Overrides ALADHAN_API_URL.
+        timeout : float, optional
+            Overrides SALAH_TIMEOUT.
+        method : int
+            The Aladhan calculation method.
+        max_entries : int, optional
+            Overrides SALAH_CACHE_SIZE.
+        """
+        self.base_url = (base_url or os.environ.get('ALADHAN_API_URL', 'http://api.aladhan.com/v1')).rstrip('/')
+        self.timeout = timeout or float(os.environ.get('SALAH_TIMEOUT', 5))
+        self.method = method
+        self.session = None
+
+        # (country, city) -> (timings, date, expires_at), where the timings are fresh until expires_at
+        self.cache = TTLCache(max_entries or int(os.environ.get('SALAH_CACHE_SIZE', 1000)), self.STALE_TTL)
+        # (country, city) -> task for the request currently in flight
+        self.inflight = {}
+
+    async def get_session(self):
+        """
+        Return the shared HTTP session, creating it if needed.
+
+        Returns:
+        -------
+        aiohttp.ClientSession
+            The session.
+        """
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=10, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self.session
+
+    async def close(self):
+        """
+        Close the HTTP session.
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def timings(self, country, city):
+        """
+        Get today's prayer times for a city.
+
+        Parameters:
+        ----------
+        country : str
+            The country the city is in.
+        city : str
+            The city.
+
+        Returns:
+        -------
+        tuple
+            The (timings, stale) pair, where timings maps prayer names to times and stale is
+            True if the API could not be reached and cached timings from earlier were used.
+
+        Raises:
+        ------
+        PrayerTimesError
+            If the timings could not be fetched and nothing is cached for the city.
+        """
+        key = (country.strip().casefold(), city.strip().casefold())
+
+        cached = self.cache.get(key)
+        if cached is not None and cached[2] > time.time():
+            return cached[0], False
+
+        task = self.inflight.get(key)
+        if task is None:
+            task = self.inflight[key] = asyncio.create_task(self._fetch(key, country, city))
+            task.add_done_callback(lambda t: self.inflight.pop(key, None))
+
+        try:
+            return await asyncio.shield(task), False
+        except PrayerTimesError:
+            if cached is not None:
+                log.warning("Using stale prayer times for %s, %s", city, country)
+                return cached[0], True
+            raise
+
+    async def _fetch(self, key, country, city):
+        session = await self.get_session()
+        params = {'city': city, 'country': country, 'method': self.method}
+
+        try:
+            async with session.get(f'{self.base_url}/timingsByCity', params=params) as response:
+                data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            raise PrayerTimesError(f"Could not reach the prayer times API: {e!r}") from e
+
+        # Error pages can decode to a list, a string or null instead of an object
+        body = data.get('data') if isinstance(data, dict) else data
+        if response.status != 200 or not isinstance(body, dict) or not isinstance(body.get('timings'), dict):
+            raise PrayerTimesError(f"Prayer times API returned {response.status}: {body!r:.200}")
+
+        timings = body['timings']
+        date = (body.get('date') or {}).get('gregorian', {}).get('date')
+        timezone = (body.get('meta') or {}).get('timezone')
+        self.cache.put(key, (timings, date, self.next_midnight(timezone)))
+        return timings
+
+    @staticmethod
+    def next_midnight(timezone):
+        """
+        Find the next midnight in a timezone, which is when a city's timings change.
+
+        Parameters:
+        ----------
+        timezone : str
+            The IANA timezone name, e.g. 'America/Toronto'.
+
+        Returns:
+        -------
+        float
+            The unix time of the next local midnight, or an hour from now if the timezone is unknown.
+        """
+        try:
+            now = datetime.now(ZoneInfo(timezone))
+        except (ZoneInfoNotFoundError, TypeError, ValueError):
+            return time.time() + 3600
+
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=now.tzinfo)
+        return midnight.timestamp()
@@ -0,0 +1,332 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from utils.scheduler import Scheduler
+from utils.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+class Resolver:
+    """
+    An async layer over the blocking yt-dlp and Spotify clients. Every call is run on a
+    bounded thread pool so that slow lookups never stall the Discord gateway.
+
+    Attributes:
+    ----------
+    ydl : yt_dlp.YoutubeDL
+        The shared YouTubeDL instance used for extraction.
+
+    search_ydl : yt_dlp.YoutubeDL
+        The shared YouTubeDL instance used for searches. Configuring it with extract_flat
+        lets searches return just the video IDs and titles without extracting every result.
+
+    sp : spotipy.Spotify
+        The shared Spotipy client.
+
+    max_workers : int
+        The maximum number of blocking calls that may run at the same time.
+        Configured with the RESOLVER_WORKERS environment variable.
+
+    timeout : float
+        The number of seconds a single call may run before it is abandoned.
+        Configured with the RESOLVER_TIMEOUT environment variable.
+
+    scheduler : Scheduler
+        Orders the calls by priority and guild, and rate limits each upstream. The YouTube and
+        Spotify limits are configured with the YOUTUBE_RATE, YOUTUBE_BURST, SPOTIFY_RATE and
+        SPOTIFY_BURST environment variables.
+
+    loader : callable
+        Creates the clients on first use, or None once they exist. Returns a (ydl, sp, search_ydl) tuple.
+
+    processes : YoutubeProcessPool
+        Runs yt-dlp in worker processes instead of on the thread pool, or None.
+
+    dedup_hits : dict
+        The number of calls per operation that joined an identical call already in flight
+        instead of running again.
+    """
+    def __init__(self, ydl=None, sp=None, search_ydl=None, max_workers=None, timeout=None, loader=None, processes=None):
+        """
+        Initialize the resolver and its thread pool.
+
+        Parameters:
+        ----------
+        ydl : yt_dlp.YoutubeDL
+            The YouTubeDL instance to run extractions with.
+        sp : spotipy.Spotify
+            The Spotipy client to run Spotify Web API calls with.
+        search_ydl : yt_dlp.YoutubeDL, optional
+            The YouTubeDL instance to run searches with. Defaults to ydl.
+        max_workers : int, optional
+            Overrides RESOLVER_WORKERS.
+        timeout : float, optional
+            Overrides RESOLVER_TIMEOUT.
+        loader : callable, optional
+            Creates the clients on the thread pool the first time they are needed, instead of
+            passing them in. Importing and constructing yt-dlp and Spotipy is slow, so this keeps
+            them off the startup path.
+        processes : YoutubeProcessPool, optional
+            Runs searches and extractions in worker processes. The ydl instances are not used then.
+        """
+        self.ydl = ydl
+        self.sp = sp
+        self.search_ydl = search_ydl or ydl
+        self.max_workers = max_workers or int(os.environ.get('RESOLVER_WORKERS', 4))
+        self.timeout = timeout or float(os.environ.get('RESOLVER_TIMEOUT', 30))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='resolver')
+        self.processes = processes
+
+        # Every worker process can be busy at once
+        slots = max(self.max_workers, processes.workers) if processes else self.max_workers
+        self.scheduler = Scheduler(slots, {
+            'youtube': (float(os.environ.get('YOUTUBE_RATE', 20)), int(os.environ.get('YOUTUBE_BURST', 40))),
+            'spotify': (float(os.environ.get('SPOTIFY_RATE', 10)), int(os.environ.get('SPOTIFY_BURST', 20))),
+        })
+
+        self.loader = loader
+        self._loading = None
+
+        # (operation, key) -> task of the call in flight
+        self._inflight = {}
+        self.dedup_hits = {'search': 0, 'extract': 0, 'spotify': 0}
+
+    async def run(self, func, *args, upstream='youtube', timeout=None, **kwargs):
+        """
+        Run a blocking callable on the resolver thread pool once the scheduler allows it.
+
+        The timeout only covers the time the call spends running, not the time spent
+        waiting for a free worker. A call that times out keeps its worker slot until its
+        thread actually finishes, so later calls never wait in the executor's queue.
+
+        Parameters:
+        ----------
+        func : callable
+            The blocking function to run.
+        *args, **kwargs
+            Arguments passed through to func.
+        upstream : str
+            The upstream func calls, either 'youtube' or 'spotify'.
+        timeout : float, optional
+            Overrides the default per-call timeout.
+
+        Returns:
+        -------
+        Any
+            The return value of func.
+
+        Raises:
+        ------
+        asyncio.TimeoutError
+            If the call does not finish within the timeout.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def call():
+            future = loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
+            return await self.wait(future, timeout or self.timeout)
+
+        return await self.scheduler.run(upstream, call)
+
+    async def wait(self, future, timeout):
+        """
+        Wait for a call running on a worker thread or process. If the wait times out or is
+        cancelled, the call can't be stopped, so the scheduler keeps its slot taken until
+        the call is done.
+
+        Parameters:
+        ----------
+        future : asyncio.Future
+            The future of the running call.
+        timeout : float
+            The number of seconds to wait.
+
+        Returns:
+        -------
+        Any
+            The result of the call.
+        """
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if not future.done():
+                self.scheduler.hold(future)
+            raise
+
+    async def load(self):
+        """
+        Create the clients with the loader if they don't exist yet. Concurrent callers share one load.
+        """
+        if self.loader is None:
+            return
+
+        if self._loading is None:
+            loop = asyncio.get_running_loop()
+            self._loading = loop.run_in_executor(self.executor, self.loader)
+
+        try:
+            clients = await asyncio.shield(self._loading)
+        except Exception:
+            # Let the next call try again
+            self._loading = None
+            raise
+
+        if self.loader is not None:
+            self.ydl, self.sp, search_ydl = clients
+            self.search_ydl = search_ydl or self.ydl
+            self.loader = None
+
+    async def single_flight(self, operation, key, factory):
+        """
+        Run a call, or join an identical call that is already in flight so that concurrent
+        callers share one result. A caller that joins at a more urgent priority class raises
+        the call to that class. A failure is raised to every caller that joined the call,
+        but is not remembered, so the next call runs again.
+
+        Parameters:
+        ----------
+        operation : str
+            The kind of call, used to count deduplicated calls.
+        key : hashable
+            Identifies the call within the operation.
+        factory : callable
+            Returns the coroutine to run when no identical call is in flight.
+
+        Returns:
+        -------
+        Any
+            The result of the call.
+        """
+        flight = (operation, key)
+        task = self._inflight.get(flight)
+        if task is not None:
+            self.dedup_hits[operation] = self.dedup_hits.get(operation, 0) + 1
+            # The call runs at the priority of whoever started it, so don't leave a more urgent caller waiting behind that
+            self.scheduler.promote(task)
+        else:
+            task = asyncio.ensure_future(factory())
+            self._inflight[flight] = task
+            task.add_done_callback(lambda t: self._inflight.pop(flight, None))
+            # Callers that were cancelled never see the result, so retrieve any exception here
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        # A cancelled caller must not cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    async def search(self, query):
+        """
+        Run a YouTube search for the query.
+
+        Parameters:
+        ----------
+        query : str
+            The search query for YouTube.
+
+        Returns:
+        -------
+        dict
+            The yt-dlp info dict for the search.
+        """
+        return await self.single_flight('search', query, lambda: self._search(query))
+
+    async def _search(self, query):
+        await self.load()
+        with metrics.span('resolver_seconds', operation='search'):
+            if self.processes is not None:
+                return await self.run_process('search', query)
+            return await self.run(self.search_ydl.extract_info, query, download=False)
+
+    async def extract(self, url):
+        """
+        Extract the metadata and stream information for a YouTube URL.
+
+        Parameters:
+        ----------
+        url : str
+            The YouTube URL to extract.
+
+        Returns:
+        -------
+        dict
+            The yt-dlp info dict for the video.
+        """
+        return await self.single_flight('extract', url, lambda: self._extract(url))
+
+    async def _extract(self, url):
+        await self.load()
+        with metrics.span('resolver_seconds', operation='extract'):
+            if self.processes is not None:
+                return await self.run_process('extract', url)
+            return await self.run(self.ydl.extract_info, url, download=False)
+
+    async def run_process(self, operation, target):
+        """
+        Run a yt-dlp search or extraction in a worker process once the scheduler allows it.
+
+        Parameters:
+        ----------
+        operation : str
+            Either 'search' or 'extract'.
+        target : str
+            The search query or URL.
+
+        Returns:
+        -------
+        dict
+            The yt-dlp info dict, with only the fields Music uses.
+
+        Raises:
+        ------
+        asyncio.TimeoutError
+            If the call does not finish within the timeout.
+        """
+        async def call():
+            return await self.wait(asyncio.ensure_future(self.processes.run(operation, target)), self.timeout)
+
+        return await self.scheduler.run('youtube', call)
+
+    async def spotify(self, method, *args, **kwargs):
+        """
+        Call a Spotipy client method by name, e.g. `await resolver.spotify('track', track_id)`.
+
+        Parameters:
+        ----------
+        method : str
+            The name of the spotipy.Spotify method to call.
+        *args, **kwargs
+            Arguments passed through to the method.
+
+        Returns:
+        -------
+        dict
+            The decoded Spotify Web API response.
+        """
+        await self.load()
+        with metrics.span('resolver_seconds', operation=f'spotify.{method}'):
+            return await self.run(getattr(self.sp, method), *args, upstream='spotify', **kwargs)
+
+    def stats(self):
+        """
+        Return the number of deduplicated calls per operation and the scheduler's stats.
+
+        Returns:
+        -------
+        dict
+            The dedup hit count per operation, the number of calls currently in flight,
+            the scheduler's queue depths, wait times and upstream rates, and the worker
+            processes' stats in process mode.
+        """
+        stats = {'dedup_hits': dict(self.dedup_hits), 'inflight': len(self._inflight),
+                 'scheduler': self.scheduler.stats()}
+        if self.processes is not None:
+            stats['processes'] = self.processes.stats()
+        return stats
+
+    def close(self):
+        """
+        Shut down the thread pool and worker processes, dropping any calls that have not started yet.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.processes is not None:
+            self.processes.close()
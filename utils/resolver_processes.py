@@ -0,0 +1,183 @@
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+log = logging.getLogger(__name__)
+
+# The YouTubeDL instances of a worker process, created once by _start_worker
+_ydl = None
+_search_ydl = None
+
+def _start_worker(options, search_options, factory):
+    global _ydl, _search_ydl
+    if factory is None:
+        from yt_dlp import YoutubeDL
+        factory = YoutubeDL
+    _ydl = factory(options)
+    _search_ydl = factory(search_options)
+
+def slim_video(info):
+    """
+    Keep the fields of a yt-dlp info dict for a video that Music uses, so only those are
+    sent back from the worker.
+    """
+    return {key: info.get(key) for key in ('id', 'title', 'thumbnail', 'duration', 'url', 'acodec', 'asr', 'audio_channels')
+            if info.get(key) is not None}
+
+def slim_search(info):
+    """
+    Keep the fields of a yt-dlp search result that Music uses.
+    """
+    return {'entries': [{key: entry.get(key) for key in ('id', 'title', 'duration')}
+                        for entry in info.get('entries') or [] if entry]}
+
+def _extract(url):
+    started = time.perf_counter()
+    info = _ydl.extract_info(url, download=False)
+    return os.getpid(), time.perf_counter() - started, slim_video(info)
+
+def _search(query):
+    started = time.perf_counter()
+    info = _search_ydl.extract_info(query, download=False)
+    return os.getpid(), time.perf_counter() - started, slim_search(info)
+
+class YoutubeProcessPool:
+    """
+    Runs yt-dlp in a pool of worker processes instead of threads.
+
+    Extraction is mostly pure Python that holds the GIL, so with threads a burst of lookups
+    competes with the gateway and voice threads for one core. Each worker process creates
+    its own YouTubeDL instances once and keeps them, receives calls over the pool's queue
+    and sends back only the fields Music needs, see slim_video and slim_search.
+
+    A crashed worker breaks the whole pool, so the pool is replaced and the call retried once.
+
+    Attributes:
+    ----------
+    workers : int
+        The number of worker processes. Configured with the RESOLVER_PROCESSES environment variable.
+
+    max_tasks : int
+        The number of calls a worker handles before it is replaced, bounding memory growth
+        inside yt-dlp, or None to keep workers. Configured with the RESOLVER_PROCESS_MAX_TASKS
+        environment variable.
+
+    restarts : int
+        The number of times the pool was replaced after a worker crashed.
+
+    per_worker : dict
+        Maps the IDs of recent worker processes to their [calls, busy seconds].
+    """
+    def __init__(self, options, search_options=None, workers=None, max_tasks=None, factory=None):
+        """
+        Initialize the pool. Worker processes are started on the first call.
+
+        Parameters:
+        ----------
+        options : dict
+            The YouTubeDL options for extraction.
+        search_options : dict, optional
+            The YouTubeDL options for searches. Defaults to options.
+        workers : int, optional
+            Overrides RESOLVER_PROCESSES.
+        max_tasks : int, optional
+            Overrides RESOLVER_PROCESS_MAX_TASKS.
+        factory : callable, optional
+            Creates a YouTubeDL-like object from options in the worker. Must be picklable.
+            Defaults to yt_dlp.YoutubeDL.
+        """
+        self.options = options
+        self.search_options = search_options or options
+        self.workers = workers or int(os.environ.get('RESOLVER_PROCESSES', os.cpu_count() or 2))
+        max_tasks = max_tasks or os.environ.get('RESOLVER_PROCESS_MAX_TASKS')
+        self.max_tasks = int(max_tasks) if max_tasks else None
+        self.factory = factory
+
+        self.restarts = 0
+        self.per_worker = {}
+        self.executor = self._create()
+
+    def _create(self):
+        kwargs = {'max_tasks_per_child': self.max_tasks} if self.max_tasks else {}
+        # Forking the bot while its threads hold locks can deadlock the workers, so fork them
+        # from a clean server process where the platform has one
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            kwargs['mp_context'] = multiprocessing.get_context('forkserver')
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_start_worker,
+                                   initargs=(self.options, self.search_options, self.factory), **kwargs)
+
+    def restart(self):
+        """
+        Replace a broken pool with a new one.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = self._create()
+        self.restarts += 1
+        log.warning("Restarted the yt-dlp worker processes (%d restarts)", self.restarts)
+
+    async def run(self, operation, target):
+        """
+        Run a search or extraction in a worker process.
+
+        Parameters:
+        ----------
+        operation : str
+            Either 'search' or 'extract'.
+        target : str
+            The search query or URL.
+
+        Returns:
+        -------
+        dict
+            The slimmed yt-dlp info dict.
+        """
+        func = _search if operation == 'search' else _extract
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self.executor
+            try:
+                pid, seconds, info = await loop.run_in_executor(executor, func, target)
+                break
+            except BrokenProcessPool:
+                # Another call may have replaced the pool already
+                if executor is self.executor:
+                    self.restart()
+                if attempt:
+                    raise
+
+        counters = self.per_worker.get(pid)
+        if counters is None:
+            counters = self.per_worker[pid] = [0, 0.0]
+            # Forget the oldest workers once replaced workers pile up
+            while len(self.per_worker) > self.workers * 4:
+                del self.per_worker[next(iter(self.per_worker))]
+        counters[0] += 1
+        counters[1] += seconds
+        return info
+
+    def stats(self):
+        """
+        Return the pool counters.
+
+        Returns:
+        -------
+        dict
+            The number of workers and restarts, and the calls, busy seconds and calls per
+            busy second of each recent worker process.
+        """
+        return {
+            'workers': self.workers,
+            'restarts': self.restarts,
+            'per_worker': {pid: {'calls': calls, 'busy_seconds': busy, 'calls_per_second': calls / busy if busy else 0.0}
+                           for pid, (calls, busy) in self.per_worker.items()},
+        }
+
+    def close(self):
+        """
+        Shut down the worker processes, dropping any calls that have not started yet.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,463 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import contextvars
+from contextlib import contextmanager
+from utils.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+INTERACTIVE = 0
+PREFETCH = 1
+BULK = 2
+AUTOQUEUE = 3
+PRIORITY_NAMES = ('interactive', 'prefetch', 'bulk', 'autoqueue')
+
+# (priority class, guild ID) of the work the current task is doing. Tasks inherit it from
+# the code that created them, so it does not have to be passed through every call.
+_current = contextvars.ContextVar('scheduler_priority', default=(INTERACTIVE, None))
+
+@contextmanager
+def priority(level, guild_id=None):
+    """
+    Run the calls made inside the block, and by tasks created inside it, at a priority class.
+
+    Parameters:
+    ----------
+    level : int
+        One of INTERACTIVE, PREFETCH, BULK or AUTOQUEUE.
+    guild_id : int, optional
+        The guild the work is for. Defaults to the guild of the enclosing block.
+    """
+    if guild_id is None:
+        guild_id = _current.get()[1]
+
+    token = _current.set((level, guild_id))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+def set_priority(level, guild_id):
+    """
+    Run the rest of the current task's calls, and those of tasks it creates, at a priority class.
+
+    Parameters:
+    ----------
+    level : int
+        One of INTERACTIVE, PREFETCH, BULK or AUTOQUEUE.
+    guild_id : int
+        The guild the work is for.
+    """
+    _current.set((level, guild_id))
+
+def retry_after(error, attempt):
+    """
+    Work out how long to wait before retrying a call that failed because the upstream is
+    rate limiting or overloaded.
+
+    Parameters:
+    ----------
+    error : Exception
+        The error raised by the call.
+    attempt : int
+        The number of retries made so far.
+
+    Returns:
+    -------
+    float
+        The number of seconds to back off for, or None if the call should not be retried.
+    """
+    backoff = min(60, 2 ** attempt)
+
+    # spotipy.SpotifyException carries the status code and response headers
+    status = getattr(error, 'http_status', None)
+    if status == 429 or (status is not None and status >= 500):
+        value = (getattr(error, 'headers', None) or {}).get('Retry-After')
+        if value and str(value).isdigit():
+            return max(float(value), 1)
+        return backoff
+
+    # yt-dlp reports throttling in the message of its DownloadError
+    if 'HTTP Error 429' in str(error):
+        return backoff
+
+    return None
+
+class TokenBucket:
+    """
+    A token bucket limiting the request rate to one upstream. The rate is halved whenever
+    the upstream throttles us and recovers gradually as calls succeed.
+
+    Attributes:
+    ----------
+    max_rate : float
+        The configured number of requests per second.
+
+    rate : float
+        The current number of requests per second.
+
+    burst : int
+        The number of requests that may be made at once after a quiet period.
+
+    paused_until : float
+        The monotonic time before which no requests are made, set from Retry-After.
+
+    throttles : int
+        The number of times the upstream has throttled us.
+    """
+    def __init__(self, rate, burst):
+        """
+        Initialize a full bucket.
+
+        Parameters:
+        ----------
+        rate : float
+            The number of requests per second.
+        burst : int
+            The size of the bucket.
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.throttles = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """
+        Return the number of seconds until a request may be made.
+        """
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        """
+        Use up a token for a request.
+        """
+        self._refill(now)
+        self.tokens -= 1
+
+    def throttle(self, now, pause):
+        """
+        Stop making requests for a while and halve the rate after the upstream throttled us.
+
+        Parameters:
+        ----------
+        now : float
+            The current monotonic time.
+        pause : float
+            The number of seconds to stop for.
+        """
+        self.throttles += 1
+        self.rate = max(self.max_rate / 16, self.rate / 2)
+        self.paused_until = max(self.paused_until, now + pause)
+        self.tokens = 0.0
+        self.updated = self.paused_until
+
+    def recover(self):
+        """
+        Raise the rate back towards the configured rate after a successful call.
+        """
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+class Scheduler:
+    """
+    Decides the order outbound YouTube and Spotify calls run in.
+
+    Calls wait in one queue per upstream and are started most urgent priority class first,
+    as long as a worker slot is free and the upstream's token bucket allows it. Within a
+    priority class, guilds take turns: each call is tagged with a virtual start time one
+    step past the guild's previous call, so a guild importing a large playlist does not hold
+    up a single song requested in another guild. Calls that are rate limited back off for
+    the Retry-After period and run again. A task's calls can be raised to a more urgent
+    class while they wait, see promote.
+
+    Attributes:
+    ----------
+    slots : int
+        The maximum number of calls that may run at the same time.
+
+    buckets : dict
+        The token bucket of each upstream.
+
+    max_retries : int
+        The number of times a throttled call is retried before its error is raised.
+
+    held : int
+        The number of slots kept by abandoned calls that are still running, see hold.
+
+    waiting, started : list
+        The number of calls waiting and started per priority class.
+
+    wait_total, wait_max : list
+        The total and longest time calls spent waiting per priority class.
+    """
+    def __init__(self, slots, limits, max_retries=3):
+        """
+        Initialize the scheduler.
+
+        Parameters:
+        ----------
+        slots : int
+            The maximum number of calls that may run at the same time.
+        limits : dict
+            Maps each upstream name to a (requests per second, burst) tuple.
+        max_retries : int
+            The number of times a throttled call is retried.
+        """
+        self.slots = slots
+        self.active = 0
+        self.held = 0
+        self.max_retries = max_retries
+        self.buckets = {upstream: TokenBucket(rate, burst) for upstream, (rate, burst) in limits.items()}
+
+        # upstream -> heap of (priority, virtual start, sequence, future)
+        self._queues = {upstream: [] for upstream in limits}
+        self._sequence = itertools.count()
+        # Virtual time per priority class, and the last tag given to each (priority, guild)
+        self._vtime = [0] * len(PRIORITY_NAMES)
+        self._last_tag = {}
+        self._timer = None
+        # task -> (upstream, entry) of its call waiting in a queue, and task -> (priority, guild ID)
+        # the task was promoted to
+        self._pending = {}
+        self._promoted = {}
+
+        self.waiting = [0] * len(PRIORITY_NAMES)
+        self.started = [0] * len(PRIORITY_NAMES)
+        self.wait_total = [0.0] * len(PRIORITY_NAMES)
+        self.wait_max = [0.0] * len(PRIORITY_NAMES)
+
+    async def run(self, upstream, factory):
+        """
+        Run a call once the scheduler allows it, retrying it if the upstream throttles it.
+
+        Parameters:
+        ----------
+        upstream : str
+            The upstream the call goes to.
+        factory : callable
+            Returns the coroutine making the call. Called again for every retry.
+
+        Returns:
+        -------
+        Any
+            The result of the call.
+        """
+        attempt = 0
+        while True:
+            await self.acquire(upstream)
+            try:
+                result = await factory()
+            except Exception as error:
+                pause = retry_after(error, attempt)
+                if pause is None or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.buckets[upstream].throttle(time.monotonic(), pause)
+                log.warning("%s is throttling requests, backing off for %.1fs", upstream, pause)
+            else:
+                self.buckets[upstream].recover()
+                return result
+            finally:
+                self.release()
+
+    async def acquire(self, upstream):
+        """
+        Wait until a call to the upstream may start at the current task's priority.
+
+        Parameters:
+        ----------
+        upstream : str
+            The upstream the call goes to.
+        """
+        enqueued = time.monotonic()
+        task = asyncio.current_task()
+        level, guild_id = _current.get()
+        promoted = self._promoted.get(task)
+        if promoted is not None and promoted[0] < level:
+            level, guild_id = promoted
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (level, self._tag(level, guild_id), next(self._sequence), future)
+        heapq.heappush(self._queues[upstream], entry)
+        self._pending[task] = (upstream, entry)
+        self.waiting[level] += 1
+        self._dispatch()
+
+        try:
+            # The call may have been promoted while it waited, so it starts at the class it was dispatched from
+            level = await future
+        except asyncio.CancelledError:
+            # The slot was handed over just before the caller was cancelled
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            self._pending.pop(task, None)
+
+        waited = time.monotonic() - enqueued
+        metrics.observe('scheduler_wait_seconds', waited, priority=PRIORITY_NAMES[level])
+        self.started[level] += 1
+        self.wait_total[level] += waited
+        self.wait_max[level] = max(self.wait_max[level], waited)
+
+    def _tag(self, level, guild_id):
+        tag = max(self._vtime[level], self._last_tag.get((level, guild_id), 0)) + 1
+        self._last_tag[(level, guild_id)] = tag
+        return tag
+
+    def promote(self, task):
+        """
+        Raise a task's calls to the current task's priority class if that is more urgent,
+        e.g. when an interactive command joins a lookup an autoqueue refill already started.
+        A call the task is waiting on moves up its queue right away, and the task's later
+        calls start at the raised class too.
+
+        Parameters:
+        ----------
+        task : asyncio.Task
+            The task making the calls.
+        """
+        level, guild_id = _current.get()
+        promoted = self._promoted.get(task)
+        if promoted is not None and promoted[0] <= level:
+            return
+        if promoted is None:
+            task.add_done_callback(lambda task: self._promoted.pop(task, None))
+        self._promoted[task] = (level, guild_id)
+
+        pending = self._pending.get(task)
+        if pending is None:
+            return
+        upstream, entry = pending
+        if entry[0] <= level or entry[3].done():
+            return
+
+        queue = self._queues[upstream]
+        queue.remove(entry)
+        heapq.heapify(queue)
+        self.waiting[entry[0]] -= 1
+
+        entry = (level, self._tag(level, guild_id), entry[2], entry[3])
+        heapq.heappush(queue, entry)
+        self._pending[task] = (upstream, entry)
+        self.waiting[level] += 1
+        self._dispatch()
+
+    def release(self):
+        """
+        Free the slot of a finished call and start the next one.
+        """
+        self.active -= 1
+        self._dispatch()
+
+    def hold(self, future):
+        """
+        Keep a slot taken until a future finishes. A call that timed out or was cancelled
+        releases its slot, but the thread or process running it can't be stopped, so the
+        slot is held again until that work is actually done.
+
+        Parameters:
+        ----------
+        future : asyncio.Future
+            The future of the work that is still running.
+        """
+        self.active += 1
+        self.held += 1
+
+        def done(future):
+            # Nobody awaits the result anymore, so retrieve any exception here
+            future.cancelled() or future.exception()
+            self.held -= 1
+            self.release()
+
+        future.add_done_callback(done)
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        now = time.monotonic()
+        wake = None
+        while self.active < self.slots:
+            best = None
+            for upstream, queue in self._queues.items():
+                # Drop callers that were cancelled while waiting
+                while queue and queue[0][3].cancelled():
+                    self.waiting[heapq.heappop(queue)[0]] -= 1
+                if not queue:
+                    continue
+
+                delay = self.buckets[upstream].delay(now)
+                if delay > 0:
+                    wake = delay if wake is None else min(wake, delay)
+                elif best is None or queue[0] < self._queues[best][0]:
+                    best = upstream
+
+            if best is None:
+                break
+
+            level, tag, _, future = heapq.heappop(self._queues[best])
+            self.waiting[level] -= 1
+            self._vtime[level] = max(self._vtime[level], tag)
+            self.buckets[best].take(now)
+            self.active += 1
+            future.set_result(level)
+
+        # Tags at or behind the virtual time no longer matter
+        if len(self._last_tag) > 1000:
+            self._last_tag = {key: tag for key, tag in self._last_tag.items() if tag > self._vtime[key[0]]}
+
+        if wake is not None and self.active < self.slots:
+            self._timer = asyncio.get_running_loop().call_later(wake, self._dispatch)
+
+    def stats(self):
+        """
+        Return the queue depth and wait times per priority class, and the state of each upstream.
+
+        Returns:
+        -------
+        dict
+            'active' and 'held' count the slots taken by running calls and by abandoned calls
+            that are still running. 'classes' maps each priority class to its waiting and
+            started calls and mean and max wait in seconds. 'upstreams' maps each upstream to
+            its current rate, number of throttles and remaining pause in seconds.
+        """
+        now = time.monotonic()
+        return {
+            'active': self.active,
+            'held': self.held,
+            'classes': {
+                name: {
+                    'waiting': self.waiting[level],
+                    'started': self.started[level],
+                    'mean_wait': self.wait_total[level] / self.started[level] if self.started[level] else 0.0,
+                    'max_wait': self.wait_max[level],
+                }
+                for level, name in enumerate(PRIORITY_NAMES)
+            },
+            'upstreams': {
+                upstream: {
+                    'rate': bucket.rate,
+                    'throttles': bucket.throttles,
+                    'paused_for': max(0.0, bucket.paused_until - now),
+                }
+                for upstream, bucket in self.buckets.items()
+            },
+        }
@@ -0,0 +1,239 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+class SearchCache:
+    """
+    A persistent cache mapping search queries and Spotify track IDs to YouTube video IDs, so
+    repeat plays skip the YouTube search entirely. Entries live in a single SQLite file and
+    are mirrored in memory, where lookups are served from. Neither lookups nor stores write
+    to the database on the spot: new entries, the last-used times of hits and the entries
+    that expired or were evicted are collected in memory and written by flush, so the
+    entries stored since the last flush are lost if the process crashes.
+
+    Attributes:
+    ----------
+    path : str
+        The path of the SQLite database file. Configured with the SEARCH_CACHE_PATH environment variable.
+
+    ttl : float
+        The number of seconds an entry stays valid. Configured with the SEARCH_CACHE_TTL environment variable.
+
+    max_entries : int
+        The maximum number of entries kept before the least recently used ones are evicted.
+        Configured with the SEARCH_CACHE_SIZE environment variable.
+
+    hits, misses, evictions : int
+        Counters for cache lookups and evictions since startup.
+    """
+    def __init__(self, path=None, ttl=None, max_entries=None):
+        """
+        Open the cache database and warm the in-memory copy from it.
+
+        Parameters:
+        ----------
+        path : str, optional
+            Overrides SEARCH_CACHE_PATH.
+        ttl : float, optional
+            Overrides SEARCH_CACHE_TTL.
+        max_entries : int, optional
+            Overrides SEARCH_CACHE_SIZE.
+        """
+        self.path = path or os.environ.get('SEARCH_CACHE_PATH', 'data/search_cache.db')
+        self.ttl = ttl or float(os.environ.get('SEARCH_CACHE_TTL', 30 * 24 * 60 * 60))
+        self.max_entries = max_entries or int(os.environ.get('SEARCH_CACHE_SIZE', 10000))
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # key -> (video_id, title, created_at), ordered from least to most recently used
+        self.entries = OrderedDict()
+        # Until they are flushed: key -> (video_id, title, created_at) of stored entries,
+        # key -> last-used time of a hit, and keys that expired or were evicted
+        self._stored = {}
+        self._last_used = {}
+        self._deleted = set()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS search_cache (
+                key TEXT PRIMARY KEY,
+                video_id TEXT NOT NULL,
+                title TEXT,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS search_cache_last_used ON search_cache (last_used)')
+        self.db.commit()
+
+        self.load()
+
+    @staticmethod
+    def query_key(query):
+        """
+        Build the cache key for a search query. Queries are compared case-insensitively
+        with runs of whitespace collapsed.
+
+        Parameters:
+        ----------
+        query : str
+            The search query.
+
+        Returns:
+        -------
+        str
+            The cache key.
+        """
+        return 'query:' + re.sub(r'\s+', ' ', query).strip().casefold()
+
+    @staticmethod
+    def spotify_key(track_id):
+        """
+        Build the cache key for a Spotify track ID.
+
+        Parameters:
+        ----------
+        track_id : str
+            The Spotify track ID.
+
+        Returns:
+        -------
+        str
+            The cache key.
+        """
+        return 'spotify:' + track_id
+
+    def load(self):
+        """
+        Drop expired entries from the database and load the most recently used ones into memory.
+        """
+        now = time.time()
+        self.db.execute('DELETE FROM search_cache WHERE created_at < ?', (now - self.ttl,))
+        self.db.commit()
+
+        rows = self.db.execute('''
+            SELECT key, video_id, title, created_at FROM (
+                SELECT * FROM search_cache ORDER BY last_used DESC LIMIT ?
+            ) ORDER BY last_used ASC
+        ''', (self.max_entries,)).fetchall()
+
+        self.entries.clear()
+        for key, video_id, title, created_at in rows:
+            self.entries[key] = (video_id, title, created_at)
+
+        log.info("Loaded %d cached searches from %s", len(self.entries), self.path)
+
+    def get(self, key):
+        """
+        Look up a cache key.
+
+        Parameters:
+        ----------
+        key : str
+            A key built with query_key or spotify_key.
+
+        Returns:
+        -------
+        tuple
+            The (video_id, title) pair, or None on a miss.
+        """
+        entry = self.entries.get(key)
+        now = time.time()
+
+        if entry is None or entry[2] < now - self.ttl:
+            if entry is not None:
+                del self.entries[key]
+                self._stored.pop(key, None)
+                self._last_used.pop(key, None)
+                self._deleted.add(key)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        self._last_used[key] = now
+        return entry[0], entry[1]
+
+    def put(self, key, video_id, title=None):
+        """
+        Store a video ID for a cache key, evicting the least recently used entries if the
+        cache is full.
+
+        Parameters:
+        ----------
+        key : str
+            A key built with query_key or spotify_key.
+        video_id : str
+            The YouTube video ID.
+        title : str, optional
+            The title of the video.
+        """
+        entry = self.entries[key] = (video_id, title, time.time())
+        self.entries.move_to_end(key)
+        self._stored[key] = entry
+        self._last_used.pop(key, None)
+        self._deleted.discard(key)
+
+        while len(self.entries) > self.max_entries:
+            evicted_key = self.entries.popitem(last=False)[0]
+            self._stored.pop(evicted_key, None)
+            self._last_used.pop(evicted_key, None)
+            self._deleted.add(evicted_key)
+            self.evictions += 1
+
+    def flush(self):
+        """
+        Write the entries stored, the last-used times of hits and drop the entries that
+        expired or were evicted since the last flush, in a single transaction.
+        """
+        if not self._stored and not self._last_used and not self._deleted:
+            return
+
+        stored, self._stored = self._stored, {}
+        last_used, self._last_used = self._last_used, {}
+        deleted, self._deleted = self._deleted, set()
+        self.db.executemany('INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?, ?)',
+                            [(key, video_id, title, created_at, created_at)
+                             for key, (video_id, title, created_at) in stored.items()])
+        self.db.executemany('UPDATE search_cache SET last_used = ? WHERE key = ?',
+                            [(used, key) for key, used in last_used.items()])
+        self.db.executemany('DELETE FROM search_cache WHERE key = ?', [(key,) for key in deleted])
+        self.db.commit()
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+        -------
+        dict
+            The number of entries, hits, misses and evictions along with the hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        """
+        Flush the pending writes and close the database connection.
+        """
+        self.flush()
+        self.db.close()
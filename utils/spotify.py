@@ -0,0 +1,291 @@
+import os
+import asyncio
+import logging
+from utils.ttl_cache import TTLCache
+
+log = logging.getLogger(__name__)
+
+class TrackUnavailable(LookupError):
+    """
+    Raised for a track ID the Spotify Web API returned no track for.
+    """
+
+class SpotifyClient:
+    """
+    A caching access layer over the Spotify Web API. Responses are kept in an in-memory LRU
+    with a TTL, and concurrent single track lookups are batched into one `sp.tracks` call.
+
+    Attributes:
+    ----------
+    resolver : Resolver
+        Runs the blocking Spotipy calls off the event loop.
+
+    cache : TTLCache
+        Cached track, album, playlist and search responses. Sized and timed with the
+        SPOTIFY_CACHE_SIZE and SPOTIFY_CACHE_TTL environment variables.
+
+    batch_window : float
+        The number of seconds track lookups are collected for before they are sent as one batch.
+
+    api_calls : int
+        The number of Spotify Web API requests made.
+
+    calls_saved : int
+        The number of requests avoided through cache hits and batching.
+    """
+    # The most track IDs the Spotify Web API accepts in one request
+    MAX_BATCH = 50
+
+    def __init__(self, resolver, max_entries=None, ttl=None, batch_window=0.05):
+        """
+        Initialize the client.
+
+        Parameters:
+        ----------
+        resolver : Resolver
+            The resolver used to call the Spotipy client.
+        max_entries : int, optional
+            Overrides SPOTIFY_CACHE_SIZE.
+        ttl : float, optional
+            Overrides SPOTIFY_CACHE_TTL.
+        batch_window : float
+            The number of seconds to collect track lookups for.
+        """
+        self.resolver = resolver
+        self.cache = TTLCache(max_entries or int(os.environ.get('SPOTIFY_CACHE_SIZE', 5000)),
+                              ttl or float(os.environ.get('SPOTIFY_CACHE_TTL', 3600)))
+        self.batch_window = batch_window
+        self.api_calls = 0
+        self.calls_saved = 0
+
+        # track ID -> future for lookups waiting on the next batch
+        self._pending = {}
+        self._flush_handle = None
+        # Batches in flight, referenced here so they are not garbage collected
+        self._batches = set()
+
+    async def _cached(self, key, method, *args, **kwargs):
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.calls_saved += 1
+            return cached
+
+        # Concurrent lookups of the same object, e.g. a playlist imported twice at once, share one request
+        return await self.resolver.single_flight('spotify', key, lambda: self._fetch(key, method, *args, **kwargs))
+
+    async def _fetch(self, key, method, *args, **kwargs):
+        result = await self.resolver.spotify(method, *args, **kwargs)
+        self.api_calls += 1
+        self.cache.put(key, result)
+        return result
+
+    def prime(self, track):
+        """
+        Cache a full or simplified track object that arrived as part of another response,
+        so a later lookup of the same track does not need a request.
+
+        Parameters:
+        ----------
+        track : dict
+            A Spotify track object.
+        """
+        if track.get('id'):
+            self.cache.put(('track', track['id']), track)
+
+    async def track(self, track_id):
+        """
+        Look up a track. Lookups made within the batch window are sent together.
+
+        Parameters:
+        ----------
+        track_id : str
+            The Spotify track ID.
+
+        Returns:
+        -------
+        dict
+            The Spotify track object.
+
+        Raises:
+        ------
+        TrackUnavailable
+            If Spotify has no track with that ID.
+        """
+        cached = self.cache.get(('track', track_id))
+        if cached is not None:
+            self.calls_saved += 1
+            return cached
+
+        future = self._pending.get(track_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[track_id] = loop.create_future()
+
+            if len(self._pending) >= self.MAX_BATCH:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        else:
+            self.calls_saved += 1
+
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        pending, self._pending = self._pending, {}
+        if pending:
+            task = asyncio.create_task(self._fetch_batch(pending))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _fetch_batch(self, pending):
+        track_ids = list(pending)
+        for start in range(0, len(track_ids), self.MAX_BATCH):
+            chunk = track_ids[start:start + self.MAX_BATCH]
+            try:
+                results = await self.resolver.spotify('tracks', chunk)
+            except Exception as e:
+                for track_id in chunk:
+                    if not pending[track_id].done():
+                        pending[track_id].set_exception(e)
+                continue
+
+            self.api_calls += 1
+            self.calls_saved += len(chunk) - 1
+            for track_id, track in zip(chunk, results['tracks']):
+                if pending[track_id].done():
+                    continue
+                # Unknown and unavailable IDs come back as None
+                if track:
+                    self.prime(track)
+                    pending[track_id].set_result(track)
+                else:
+                    pending[track_id].set_exception(TrackUnavailable(f"Spotify has no track {track_id}"))
+
+    async def tracks(self, track_ids):
+        """
+        Look up several tracks, fetching uncached ones in batches of up to 50.
+
+        Parameters:
+        ----------
+        track_ids : list
+            The Spotify track IDs.
+
+        Returns:
+        -------
+        list
+            The Spotify track objects, in the same order as track_ids.
+        """
+        return await asyncio.gather(*(self.track(track_id) for track_id in track_ids))
+
+    async def album(self, album_id):
+        """
+        Look up an album, including its first page of tracks.
+
+        Parameters:
+        ----------
+        album_id : str
+            The Spotify album ID.
+
+        Returns:
+        -------
+        dict
+            The Spotify album object.
+        """
+        return await self._cached(('album', album_id), 'album', album_id)
+
+    async def playlist(self, playlist_id):
+        """
+        Look up a playlist, including its first page of tracks.
+
+        Parameters:
+        ----------
+        playlist_id : str
+            The Spotify playlist ID.
+
+        Returns:
+        -------
+        dict
+            The Spotify playlist object.
+        """
+        return await self._cached(('playlist', playlist_id), 'playlist', playlist_id)
+
+    async def next(self, page):
+        """
+        Fetch the page following a paginated response.
+
+        Parameters:
+        ----------
+        page : dict
+            A paginated Spotify response.
+
+        Returns:
+        -------
+        dict
+            The next page, or None if this was the last one.
+        """
+        if not page.get('next'):
+            return None
+
+        return await self._cached(('page', page['next']), 'next', page)
+
+    async def search(self, q, type='track', limit=1):
+        """
+        Run a Spotify search.
+
+        Parameters:
+        ----------
+        q : str
+            The search query.
+        type : str
+            The type of item to search for.
+        limit : int
+            The maximum number of results.
+
+        Returns:
+        -------
+        dict
+            The Spotify search response.
+        """
+        return await self._cached(('search', q, type, limit), 'search', q=q, type=type, limit=limit)
+
+    async def recommendations(self, seed_tracks, limit=1):
+        """
+        Get track recommendations. These are not cached so repeated calls can vary.
+
+        Parameters:
+        ----------
+        seed_tracks : list
+            Up to five Spotify track IDs to seed the recommendations with.
+        limit : int
+            The number of recommendations to return.
+
+        Returns:
+        -------
+        dict
+            The Spotify recommendations response.
+        """
+        result = await self.resolver.spotify('recommendations', seed_tracks=seed_tracks, limit=limit)
+        self.api_calls += 1
+        for track in result['tracks']:
+            self.prime(track)
+        return result
+
+    def stats(self):
+        """
+        Return the cache and request counters.
+
+        Returns:
+        -------
+        dict
+            The number of cached responses, cache hit rate, API calls made and API calls saved.
+        """
+        return {
+            'entries': len(self.cache),
+            'hit_rate': self.cache.hit_rate(),
+            'api_calls': self.api_calls,
+            'calls_saved': self.calls_saved,
+        }
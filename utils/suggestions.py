@@ -0,0 +1,253 @@
+import os
+import re
+import time
+import heapq
+import bisect
+import logging
+from collections import OrderedDict
+from utils.track import Track
+
+log = logging.getLogger(__name__)
+
+class Suggestion:
+    """
+    A song that can be suggested, with the data it is ranked by.
+    """
+    __slots__ = ('video_id', 'title', 'keys', 'plays', 'last_used')
+
+    def __init__(self, video_id, title, last_used):
+        self.video_id = video_id
+        self.title = title
+        self.keys = set()
+        self.plays = 0
+        self.last_used = last_used
+
+class SuggestionIndex:
+    """
+    An in-memory prefix index of songs the bot has resolved before, used to autocomplete
+    the /play command without any network calls.
+
+    Every word of a song's title, search query or Spotify name starts a key, so typing the
+    start of any word finds the song. The keys are kept in a sorted list and matched with
+    a binary search. Matches are ranked by play count, decayed by how long ago the song was
+    last played or resolved.
+
+    Attributes:
+    ----------
+    max_entries : int
+        The maximum number of songs kept before the least recently used are dropped.
+        Configured with the SUGGESTION_INDEX_SIZE environment variable.
+
+    half_life : float
+        The number of seconds after which a song's ranking weight halves.
+
+    entries : collections.OrderedDict
+        Maps video IDs to their Suggestion, from least to most recently used.
+    """
+    # Keys are truncated so long titles don't bloat the index
+    KEY_LENGTH = 60
+
+    def __init__(self, max_entries=None, half_life=7 * 24 * 60 * 60):
+        """
+        Initialize an empty index.
+
+        Parameters:
+        ----------
+        max_entries : int, optional
+            Overrides SUGGESTION_INDEX_SIZE.
+        half_life : float
+            The number of seconds after which a song's ranking weight halves.
+        """
+        self.max_entries = max_entries or int(os.environ.get('SUGGESTION_INDEX_SIZE', 20000))
+        self.half_life = half_life
+        self.entries = OrderedDict()
+
+        # Sorted (key, video ID) pairs
+        self._keys = []
+
+    @staticmethod
+    def normalize(text):
+        """
+        Lowercase text and reduce it to words separated by single spaces.
+
+        Parameters:
+        ----------
+        text : str
+            The text to normalize.
+
+        Returns:
+        -------
+        str
+            The normalized text.
+        """
+        return ' '.join(re.findall(r'\w+', text.casefold()))
+
+    def add(self, video_id, title, text=None, last_used=None):
+        """
+        Add a song to the index, or add another way of finding a song that is already indexed.
+
+        Parameters:
+        ----------
+        video_id : str
+            The YouTube video ID.
+        title : str
+            The title shown in suggestions. Kept if the song is already indexed.
+        text : str, optional
+            Extra text to find the song by, e.g. the search query or Spotify name it was resolved from.
+        last_used : float, optional
+            The unix time the song was last used. Defaults to now.
+        """
+        if not video_id or not title:
+            return
+
+        for key in self._new_keys(video_id, title, text, last_used):
+            bisect.insort(self._keys, key)
+
+        while len(self.entries) > self.max_entries:
+            self.remove(next(iter(self.entries)))
+
+    def _new_keys(self, video_id, title, text, last_used):
+        entry = self.entries.get(video_id)
+        if entry is None:
+            entry = self.entries[video_id] = Suggestion(video_id, title, last_used or time.time())
+        else:
+            entry.last_used = max(entry.last_used, last_used or time.time())
+            self.entries.move_to_end(video_id)
+
+        keys = []
+        for source in (title, text):
+            if not source:
+                continue
+            words = self.normalize(source).split(' ')
+            for start in range(len(words)):
+                key = ' '.join(words[start:])[:self.KEY_LENGTH]
+                if key and key not in entry.keys:
+                    entry.keys.add(key)
+                    keys.append((key, video_id))
+        return keys
+
+    def remove(self, video_id):
+        """
+        Drop a song from the index.
+
+        Parameters:
+        ----------
+        video_id : str
+            The YouTube video ID.
+        """
+        entry = self.entries.pop(video_id, None)
+        if entry is None:
+            return
+
+        for key in entry.keys:
+            index = bisect.bisect_left(self._keys, (key, video_id))
+            if index < len(self._keys) and self._keys[index] == (key, video_id):
+                del self._keys[index]
+
+    def record_play(self, song):
+        """
+        Count a play of a song, adding it to the index if needed.
+
+        Parameters:
+        ----------
+        song : Track
+            The song that started playing.
+        """
+        self.add(song.video_id, song.title)
+        entry = self.entries.get(song.video_id)
+        if entry is not None:
+            entry.plays += 1
+
+    def load(self, search_cache):
+        """
+        Index the songs in the search cache, with the queries that found them.
+
+        Parameters:
+        ----------
+        search_cache : SearchCache
+            The search cache to index.
+        """
+        # Sorting once is much faster than inserting every key in order
+        for key, (video_id, title, created_at) in search_cache.entries.items():
+            if video_id and title:
+                query = key[len('query:'):] if key.startswith('query:') else None
+                self._keys.extend(self._new_keys(video_id, title, query, created_at))
+        self._keys.sort()
+
+        while len(self.entries) > self.max_entries:
+            self.remove(next(iter(self.entries)))
+
+        log.info("Indexed %d songs for suggestions", len(self.entries))
+
+    def score(self, entry, now):
+        """
+        Rank a song by its play count, halving its weight every half_life since it was last used.
+        """
+        return (entry.plays + 1) * 0.5 ** ((now - entry.last_used) / self.half_life)
+
+    def suggest(self, text, limit=25, scan=500):
+        """
+        Find the best ranked songs with a word starting with the text.
+
+        Parameters:
+        ----------
+        text : str
+            What has been typed so far.
+        limit : int
+            The maximum number of suggestions. Discord shows at most 25.
+        scan : int
+            The maximum number of matching keys to rank, bounding the time a short prefix takes.
+
+        Returns:
+        -------
+        list
+            The matching Suggestions, best first.
+        """
+        prefix = self.normalize(text)[:self.KEY_LENGTH]
+        now = time.time()
+
+        if not prefix:
+            # Nothing typed yet, so suggest the favourite songs
+            candidates = self.entries.values()
+        else:
+            candidates = {}
+            index = bisect.bisect_left(self._keys, (prefix,))
+            while index < len(self._keys) and len(candidates) < scan:
+                key, video_id = self._keys[index]
+                if not key.startswith(prefix):
+                    break
+                candidates[video_id] = self.entries[video_id]
+                index += 1
+            candidates = candidates.values()
+
+        return heapq.nlargest(limit, candidates, key=lambda entry: self.score(entry, now))
+
+    def track(self, video_id):
+        """
+        Build a track for an indexed song, so it can be queued without looking it up.
+
+        Parameters:
+        ----------
+        video_id : str
+            The YouTube video ID.
+
+        Returns:
+        -------
+        Track
+            The song without a stream URL, or None if the song is not indexed.
+        """
+        entry = self.entries.get(video_id)
+        if entry is None:
+            return None
+        return Track(entry.video_id, entry.title)
+
+    def stats(self):
+        """
+        Return the size of the index.
+
+        Returns:
+        -------
+        dict
+            The number of indexed songs and keys.
+        """
+        return {'entries': len(self.entries), 'keys': len(self._keys)}
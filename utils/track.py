@@ -0,0 +1,292 @@
+import os
+import random
+from collections import deque
+
+class Track:
+    """
+    A compact record for a queued song. Slots keep the per-track overhead small when
+    large playlists are queued across many guilds.
+
+    Attributes:
+    ----------
+    video_id : str
+        The YouTube video ID of the song.
+
+    title : str
+        The title of the song.
+
+    thumbnail : str
+        The URL of the song's thumbnail image. Defaults to YouTube's standard thumbnail for the video.
+
+    duration : float
+        The length of the song in seconds, or None if unknown.
+
+    spotify_id : str
+        The Spotify track ID the song was resolved from, or None.
+
+    url : str
+        The stream URL of the song, or None until it is resolved before playback.
+
+    expires : float
+        The unix time the stream URL expires at, or None if unknown.
+
+    opus : bool
+        Whether the stream is Opus audio at 48 kHz, which can be sent to Discord without transcoding.
+
+    retried : bool
+        Whether playback has already been retried with a freshly resolved stream URL.
+
+    start : float
+        The position in seconds playback starts from, used to resume a song after a restart.
+    """
+    __slots__ = ('video_id', 'title', '_thumbnail', 'duration', 'spotify_id', 'url', 'expires', 'opus', 'retried', 'start')
+
+    def __init__(self, video_id, title, thumbnail=None, duration=None, spotify_id=None):
+        """
+        Initialize a track without a stream URL.
+
+        Parameters:
+        ----------
+        video_id : str
+            The YouTube video ID.
+        title : str
+            The title of the video.
+        thumbnail : str, optional
+            The URL of the video's thumbnail.
+        duration : float, optional
+            The length of the video in seconds.
+        spotify_id : str, optional
+            The Spotify track ID the video was resolved from.
+        """
+        self.video_id = video_id
+        self.title = title
+        self._thumbnail = thumbnail
+        self.duration = duration
+        self.spotify_id = spotify_id
+        self.url = None
+        self.expires = None
+        self.opus = False
+        self.retried = False
+        self.start = 0
+
+    @property
+    def thumbnail(self):
+        return self._thumbnail or f"https://i.ytimg.com/vi/{self.video_id}/hqdefault.jpg"
+
+    @thumbnail.setter
+    def thumbnail(self, value):
+        self._thumbnail = value
+
+    @property
+    def watch_url(self):
+        """
+        The YouTube watch URL of the track.
+        """
+        return f"https://www.youtube.com/watch?v={self.video_id}"
+
+    def record(self):
+        """
+        Return the fields needed to queue the track again, e.g. after a restart. The stream
+        URL is left out since it expires.
+
+        Returns:
+        -------
+        tuple
+            The video ID, title, duration, Spotify ID and thumbnail.
+        """
+        return (self.video_id, self.title, self.duration, self.spotify_id, self._thumbnail)
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        Create a track from the fields returned by record.
+
+        Parameters:
+        ----------
+        record : sequence
+            The video ID, title, duration, Spotify ID and thumbnail.
+
+        Returns:
+        -------
+        Track
+            The track, without a stream URL.
+        """
+        video_id, title, duration, spotify_id, thumbnail = record
+        return cls(video_id, title, thumbnail, duration, spotify_id)
+
+    def __repr__(self):
+        return f"Track({self.video_id!r}, {self.title!r})"
+
+class TrackQueue:
+    """
+    A bounded song queue backed by a deque, so taking the next song is O(1) no matter how
+    long the queue is.
+
+    Attributes:
+    ----------
+    maxlen : int
+        The maximum number of tracks the queue holds. Configured with the QUEUE_MAX_SIZE environment variable.
+
+    version : int
+        Incremented on every change, so views of the queue can tell when they are stale.
+
+    listener : callable
+        Called with the name of every change and its arguments, e.g. ('append', track), or None.
+        Used to journal the queue, see QueueJournal.
+    """
+    def __init__(self, maxlen=None):
+        """
+        Initialize an empty queue.
+
+        Parameters:
+        ----------
+        maxlen : int, optional
+            Overrides QUEUE_MAX_SIZE.
+        """
+        self.maxlen = maxlen or int(os.environ.get('QUEUE_MAX_SIZE', 5000))
+        self._tracks = deque()
+        self.version = 0
+        self.listener = None
+
+    def append(self, track):
+        """
+        Add a track to the end of the queue.
+
+        Parameters:
+        ----------
+        track : Track
+            The track to add.
+
+        Returns:
+        -------
+        bool
+            False if the queue is full and the track was not added.
+        """
+        if len(self._tracks) >= self.maxlen:
+            return False
+
+        self._tracks.append(track)
+        self.version += 1
+        if self.listener is not None:
+            self.listener('append', track)
+        return True
+
+    def appendleft(self, track):
+        """
+        Put a track at the front of the queue, even if the queue is full.
+
+        Parameters:
+        ----------
+        track : Track
+            The track to play next.
+        """
+        self._tracks.appendleft(track)
+        self.version += 1
+        if self.listener is not None:
+            self.listener('appendleft', track)
+
+    def popleft(self):
+        """
+        Remove and return the track at the front of the queue.
+
+        Returns:
+        -------
+        Track
+            The next track.
+        """
+        track = self._tracks.popleft()
+        self.version += 1
+        if self.listener is not None:
+            self.listener('popleft')
+        return track
+
+    def remove(self, index):
+        """
+        Remove and return the track at a position in the queue.
+
+        Parameters:
+        ----------
+        index : int
+            The zero-based position of the track.
+
+        Returns:
+        -------
+        Track
+            The removed track.
+
+        Raises:
+        ------
+        IndexError
+            If the position is out of range.
+        """
+        track = self._tracks[index]
+        del self._tracks[index]
+        self.version += 1
+        if self.listener is not None:
+            self.listener('remove', index)
+        return track
+
+    def move(self, source, destination):
+        """
+        Move a track to a new position in the queue.
+
+        Parameters:
+        ----------
+        source : int
+            The zero-based position of the track to move.
+        destination : int
+            The zero-based position to move it to.
+
+        Raises:
+        ------
+        IndexError
+            If either position is out of range.
+        """
+        if not 0 <= destination < len(self._tracks):
+            raise IndexError('queue index out of range')
+
+        track = self.remove(source)
+        self._tracks.insert(destination, track)
+        self.version += 1
+        if self.listener is not None:
+            self.listener('insert', destination, track)
+
+    def shuffle(self):
+        """
+        Shuffle the queue in place.
+        """
+        tracks = list(self._tracks)
+        random.shuffle(tracks)
+        self._tracks = deque(tracks)
+        self.version += 1
+        if self.listener is not None:
+            self.listener('replace', tracks)
+
+    def clear(self):
+        """
+        Remove every track from the queue.
+        """
+        self._tracks.clear()
+        self.version += 1
+        if self.listener is not None:
+            self.listener('clear')
+
+    def is_full(self):
+        """
+        Check whether the queue has reached its maximum size.
+
+        Returns:
+        -------
+        bool
+            True if no more tracks can be appended.
+        """
+        return len(self._tracks) >= self.maxlen
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def __getitem__(self, index):
+        return self._tracks[index]
+
+    def __iter__(self):
+        return iter(self._tracks)
@@ -0,0 +1,101 @@
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """
+    An in-memory least recently used cache whose entries also expire after a fixed time.
+
+    Attributes:
+    ----------
+    max_entries : int
+        The maximum number of entries kept before the least recently used ones are evicted.
+
+    ttl : float
+        The number of seconds an entry stays valid.
+
+    hits, misses : int
+        Counters for cache lookups.
+    """
+    def __init__(self, max_entries, ttl):
+        """
+        Initialize an empty cache.
+
+        Parameters:
+        ----------
+        max_entries : int
+            The maximum number of entries.
+        ttl : float
+            The number of seconds an entry stays valid.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        # key -> (value, expires_at), ordered from least to most recently used
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        """
+        Look up a key.
+
+        Parameters:
+        ----------
+        key : hashable
+            The key to look up.
+        default : Any
+            The value returned on a miss.
+
+        Returns:
+        -------
+        Any
+            The cached value, or default if the key is missing or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, ttl=None):
+        """
+        Store a value, evicting the least recently used entries if the cache is full.
+
+        Parameters:
+        ----------
+        key : hashable
+            The key to store the value under.
+        value : Any
+            The value to store.
+        ttl : float, optional
+            Overrides the default time to live for this entry.
+        """
+        self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] >= time.monotonic()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def hit_rate(self):
+        """
+        Return the fraction of lookups that were hits.
+
+        Returns:
+        -------
+        float
+            The hit rate, or 0 if there were no lookups.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
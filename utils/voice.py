@@ -0,0 +1,158 @@
+import os
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+class VoiceSessions:
+    """
+    Keeps voice connections open after the queue runs out, so the next song in the guild
+    can start without a new voice handshake.
+
+    A connection that has been idle for longer than the idle timeout is closed by
+    disconnect_idle, which the bot runs periodically. Connections are also closed as soon
+    as no humans are left in their channel.
+
+    Attributes:
+    ----------
+    idle_timeout : float
+        The number of seconds an idle connection is kept open.
+        Configured with the VOICE_IDLE_TIMEOUT environment variable.
+
+    idle_since : dict
+        Maps guild IDs to the monotonic time their connection was first seen idle.
+
+    warm_starts, cold_starts, moves, idle_disconnects, empty_disconnects : int
+        Counters for reused connections, new connections, channel moves and disconnects.
+    """
+    def __init__(self, idle_timeout=None):
+        """
+        Initialize the session manager.
+
+        Parameters:
+        ----------
+        idle_timeout : float, optional
+            Overrides VOICE_IDLE_TIMEOUT.
+        """
+        self.idle_timeout = idle_timeout or float(os.environ.get('VOICE_IDLE_TIMEOUT', 300))
+        self.idle_since = {}
+
+        self.warm_starts = 0
+        self.cold_starts = 0
+        self.moves = 0
+        self.idle_disconnects = 0
+        self.empty_disconnects = 0
+
+    @staticmethod
+    def is_idle(voice_client):
+        return not voice_client.is_playing() and not voice_client.is_paused()
+
+    async def connect(self, ctx):
+        """
+        Make sure the bot is connected to voice for a command, reusing an open connection.
+
+        An idle connection in another channel is moved to the author's channel instead of
+        reconnecting. A connection that is playing stays where it is.
+
+        Parameters:
+        ----------
+        ctx : discord.ext.commands.Context
+            The context of the command being executed.
+
+        Returns:
+        -------
+        str
+            'warm' if an open connection was reused, 'cold' if a new one was made, or None
+            if the author is not in a voice channel and the bot is not connected.
+        """
+        voice_client = ctx.voice_client
+        channel = ctx.author.voice.channel if ctx.author.voice else None
+
+        if voice_client and voice_client.is_connected():
+            self.idle_since.pop(ctx.guild.id, None)
+            if channel is not None and voice_client.channel != channel and self.is_idle(voice_client):
+                await voice_client.move_to(channel)
+                self.moves += 1
+            self.warm_starts += 1
+            return 'warm'
+
+        if channel is None:
+            return None
+
+        await channel.connect()
+        self.cold_starts += 1
+        return 'cold'
+
+    async def disconnect_idle(self, voice_clients):
+        """
+        Disconnect the voice clients that have been idle for longer than the idle timeout.
+
+        Parameters:
+        ----------
+        voice_clients : list
+            Every voice client of the bot.
+
+        Returns:
+        -------
+        int
+            The number of voice clients disconnected.
+        """
+        now = time.monotonic()
+        idle_since = {}
+        expired = []
+
+        for voice_client in voice_clients:
+            guild_id = voice_client.guild.id
+            if not self.is_idle(voice_client):
+                continue
+            idle_since[guild_id] = self.idle_since.get(guild_id, now)
+            if now - idle_since[guild_id] >= self.idle_timeout:
+                expired.append(voice_client)
+
+        # Forget guilds that are playing again or no longer connected
+        self.idle_since = idle_since
+
+        for voice_client in expired:
+            log.info("Leaving voice in guild %s after %.0fs idle", voice_client.guild.id, self.idle_timeout)
+            self.idle_since.pop(voice_client.guild.id, None)
+            await voice_client.disconnect()
+        self.idle_disconnects += len(expired)
+        return len(expired)
+
+    async def channel_left(self, channel):
+        """
+        Disconnect from a voice channel if a member left it and only bots remain.
+
+        Parameters:
+        ----------
+        channel : discord.VoiceChannel
+            The channel a member left.
+        """
+        voice_client = channel.guild.voice_client
+        if voice_client is None or voice_client.channel != channel:
+            return
+
+        if not any(not member.bot for member in channel.members):
+            log.info("Leaving voice in guild %s because the channel is empty", channel.guild.id)
+            self.idle_since.pop(channel.guild.id, None)
+            self.empty_disconnects += 1
+            await voice_client.disconnect()
+
+    def stats(self):
+        """
+        Return the session counters.
+
+        Returns:
+        -------
+        dict
+            The number of idle connections, warm and cold starts, channel moves, and
+            disconnects because of idling or an empty channel.
+        """
+        return {
+            'idle': len(self.idle_since),
+            'warm_starts': self.warm_starts,
+            'cold_starts': self.cold_starts,
+            'moves': self.moves,
+            'idle_disconnects': self.idle_disconnects,
+            'empty_disconnects': self.empty_disconnects,
+        }